@@ -1,32 +1,58 @@
-import json
+import os
 import pandas as pd
-import plotly.express as px
 
-from dash import Dash, dcc, html
+from dash import ClientsideFunction, Dash, dcc, html
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 
-import joblib
-from statsmodels.tsa.statespace.sarimax import SARIMAX
+from src.instrumentation import install_request_profiler, log_event, render_metrics, timed_callback
+from src.models.forecast_store import CITY_KEY, MODEL_VERSION, load_forecast_store
+from src.visualization.callback_cache import CallbackCache, data_version, normalize_choice, normalize_date
+from src.visualization.dashboard_data import DailyCube, LazyData, NeighborhoodGeometry, client_payload
 
 # ─── Data loading ──────────────────────────────────────────────────────────────
 
-crashes = pd.read_csv(
-    'data/processed/crashes.csv',
-    parse_dates=['crash_date']
+# Startup mode: 'background' (default) starts serving at once and loads the data
+# in a thread, 'lazy' loads each input on first use, 'eager' loads before serving
+STARTUP = os.environ.get('DASHBOARD_STARTUP', 'background')
+# Clientside mode: the info cards and time series are computed in the browser
+# from a packed daily cube sent with the page (see assets/clientside.js)
+CLIENTSIDE = os.environ.get('DASHBOARD_CLIENTSIDE') == '1'
+
+CUBE_FILE = 'data/processed/daily_neighborhood_cube.npz'
+CONFIDENCE_FILE = 'data/processed/neighborhood_forecast_confidence.csv'
+# Simplified outlines and bbox index (see src/features/build_neighborhood_geometry.py)
+GEOMETRY_DIR = 'data/processed/neighborhood_geometry'
+FORECAST_FILE = 'models/forecast_store/reconciled_forecasts.parquet'
+# Files the inputs are loaded from
+ARTIFACTS = (CUBE_FILE, CONFIDENCE_FILE, f'{GEOMETRY_DIR}/index.json', FORECAST_FILE)
+
+
+def _client_payload():
+    # Packed once per process; plotly.io only to resolve the template the server side uses
+    import plotly.io as pio
+    return client_payload(data.cube, data.forecasts, pio.templates['plotly_dark'].to_plotly_json(), CITY_KEY)
+
+
+data = LazyData(
+    # Pre-aggregated (date x neighborhood) crashes/injured/killed with prefix sums
+    # (see src/features/build_timeseries_features.py)
+    cube=lambda: DailyCube.load(CUBE_FILE),
+    confidence=lambda: pd.read_csv(CONFIDENCE_FILE),
+    geometry=lambda: NeighborhoodGeometry.load(GEOMETRY_DIR),
+    # Precomputed forecasts, reconciled so the city total equals the sum of its
+    # neighborhoods (see src/models/build_forecast_store.py, src/models/reconcile_forecasts.py)
+    forecasts=lambda: load_forecast_store(FORECAST_FILE),
+    **({'client_payload': _client_payload} if CLIENTSIDE else {}),
 )
-crashes.rename(columns={
-    'number_of_persons_killed': 'killed',
-    'number_of_persons_injured': 'injured'
-}, inplace=True)
 
-confidence = pd.read_csv('data/processed/neighborhood_forecast_confidence.csv')
-
-with open('data/external/neighborhoods.geojson') as f:
-    geojson_nbhd = json.load(f)
-
-# Load the city SARIMA model
-city_model = joblib.load('models/crash_count_forecast/sarima_model.pkl')
+# Callback outputs shared by all worker processes through one SQLite file. The
+# key includes a fingerprint of the input files and the model version, so a
+# data rebuild or a new model starts from an empty cache.
+cache = CallbackCache(
+    os.environ.get('DASHBOARD_CACHE', 'data/interim/callback_cache.sqlite'),
+    version=data_version(*ARTIFACTS, extra=MODEL_VERSION)
+)
 
 
 # ─── Dash app setup ────────────────────────────────────────────────────────────
@@ -35,258 +61,323 @@ app = Dash(__name__, external_stylesheets=[dbc.themes.CYBORG])
 app.title = "NYC Motor Vehicle Crashes Dashboard"
 
 
+# Liveness: the process answers. Readiness: every input is loaded, or in lazy
+# mode, where nothing is loaded before the first callback, every input exists.
+@app.server.route('/healthz')
+def healthz():
+    return {'status': 'alive'}
+
+
+@app.server.route('/readyz')
+def readyz():
+    if STARTUP == 'lazy':
+        missing = [path for path in ARTIFACTS if not os.path.exists(path)]
+        if not missing:
+            return {'status': 'ready'}
+        return {'status': 'missing', 'missing': missing}, 503
+    if data.ready:
+        return {'status': 'ready'}
+    return {'status': 'loading', 'error': data.error}, 503
+
+
+@app.server.route('/cache-stats')
+def cache_stats():
+    return cache.stats()
+
+
+# Per-process callback latency histograms, in the Prometheus text format
+@app.server.route('/metrics')
+def metrics():
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+# Opt-in: DASHBOARD_PROFILE_MS=500 saves a cProfile of the first request slower
+# than 500 ms to reports/profiles/
+if os.environ.get('DASHBOARD_PROFILE_MS'):
+    install_request_profiler(app.server, float(os.environ['DASHBOARD_PROFILE_MS']))
+
+
+if STARTUP == 'eager':
+    data.warm()
+    log_event('dashboard_ready', startup=STARTUP)
+elif STARTUP == 'background':
+    data.warm(background=True)
+
+
 # ─── Layout ────────────────────────────────────────────────────────────────────
 
-app.layout = dbc.Container(fluid=True, children=[
-
-    # Top row: Parameters | Info cards
-    dbc.Row([
-
-        # ─── Parameters (Left) ────────────────────────────────────────────────────
-        dbc.Col(
-            dbc.Card([
-                dbc.CardBody([
-
-                    # Placeholder title + about icon
-                    html.Div([
-                        html.H5("NYC Vehicle Collisions Time Series", className="text-white d-inline mb-3"),
-                        html.Span(
-                            "ℹ️",
-                            id="about-icon",
-                            style={"cursor":"pointer","marginLeft":"0.5rem","color":"#FFFFFF"}
-                        )
-                    ], className="mb-3"),
-
-                    # Popover shown when info icon is clicked
-                    # replace your existing PopoverBody with this:
-                    dbc.Popover(
-                        [
-                            dbc.PopoverHeader(
-                                "About",
-                                style={'fontFamily': 'Arial, sans-serif', 'fontSize': '1.1em', 'color': 'black'}
-                            ),
-                            dbc.PopoverBody(
-                                html.Div([
-                                    html.P(
-                                        "This dashboard is an interactive tool that gives an historical analysis and "
-                                        "forecast of vehicle collisions for both city-wide and "
-                                        "neighborhood-specific bases.",
-                                        style={'fontFamily': 'Arial, sans-serif', 'fontSize': '0.9em', 'color': 'white',
-                                               'marginBottom': '0.5rem'}
-                                    ),
-                                    html.P("NOTE: The 'Forecast' option only shows totals for the period of a one-year forecast"),
-                                    html.A(
-                                        "Learn more here",
-                                        href="https://github.com/zachpinto/nyc-crashes",
-                                        # replace with your link
-                                        target="_blank",
-                                        style={'color': '#636EFB', 'textDecoration': 'underline', 'fontSize': '0.85em'}
-                                    )
-                                ]),
-                                style={'backgroundColor': '#252e3f'}
-                            )
-                        ],
-                        target="about-icon",
-                        trigger="click",
-                        placement="right"
-                    ),
-
-
-                    # Actual controls
-                    dbc.Row([
-
-                        # Data Type radios
-                        dbc.Col([
-                            html.Label(
-                                "Historical or Forecast:",
-                                className="text-white mb-1 mt-n1",
-                                style={'fontSize':'1.05em'}
-                            ),
-
-                            dcc.RadioItems(
-                                id='data_type',
-                                options=[
-                                    {'label': 'Historical', 'value': 'historical'},
-                                    {'label': 'Forecast',   'value': 'forecast'}
-                                ],
-                                value='historical',
-                                inline=True,
-                                labelStyle={'color':'white','fontSize':'1.1em','marginRight':'1.5rem'},
-                                inputStyle={'marginRight':'0.5rem'}
+def make_layout(min_date=None, max_date=None, neighborhoods=(), client_cube=None):
+    return dbc.Container(fluid=True, children=[
+
+        # Packed daily cube for the clientside callbacks; empty in server mode
+        dcc.Store(id='client_cube', data=client_cube),
+
+        # Top row: Parameters | Info cards
+        dbc.Row([
+
+            # ─── Parameters (Left) ────────────────────────────────────────────────────
+            dbc.Col(
+                dbc.Card([
+                    dbc.CardBody([
+
+                        # Placeholder title + about icon
+                        html.Div([
+                            html.H5("NYC Vehicle Collisions Time Series", className="text-white d-inline mb-3"),
+                            html.Span(
+                                "ℹ️",
+                                id="about-icon",
+                                style={"cursor":"pointer","marginLeft":"0.5rem","color":"#FFFFFF"}
                             )
-                        ], width=4,
-                           className="d-flex flex-column justify-content-center",
-                           style={'fontSize':'1.05em'}),
-
-                        # Date range + neighborhood selector
-                        dbc.Col([
-
-                            html.Div([
-                                html.Label("Date Range:", className="text-white mb-1"),
-                                dcc.DatePickerRange(
-                                    id='date_picker',
-                                    min_date_allowed=crashes['crash_date'].min(),
-                                    max_date_allowed=crashes['crash_date'].max(),
-                                    start_date=crashes['crash_date'].min(),
-                                    end_date=crashes['crash_date'].max(),
-                                    display_format='YYYY-MM-DD',
-                                    style={'width':'100%','fontSize':'1.05em'}
+                        ], className="mb-3"),
+
+                        # Popover shown when info icon is clicked
+                        # replace your existing PopoverBody with this:
+                        dbc.Popover(
+                            [
+                                dbc.PopoverHeader(
+                                    "About",
+                                    style={'fontFamily': 'Arial, sans-serif', 'fontSize': '1.1em', 'color': 'black'}
+                                ),
+                                dbc.PopoverBody(
+                                    html.Div([
+                                        html.P(
+                                            "This dashboard is an interactive tool that gives an historical analysis and "
+                                            "forecast of vehicle collisions for both city-wide and "
+                                            "neighborhood-specific bases.",
+                                            style={'fontFamily': 'Arial, sans-serif', 'fontSize': '0.9em', 'color': 'white',
+                                                   'marginBottom': '0.5rem'}
+                                        ),
+                                        html.P("NOTE: The 'Forecast' option only shows totals for the period of a one-year forecast"),
+                                        html.A(
+                                            "Learn more here",
+                                            href="https://github.com/zachpinto/nyc-crashes",
+                                            # replace with your link
+                                            target="_blank",
+                                            style={'color': '#636EFB', 'textDecoration': 'underline', 'fontSize': '0.85em'}
+                                        )
+                                    ]),
+                                    style={'backgroundColor': '#252e3f'}
                                 )
-                            ], className="mb-4"),
-
-                            html.Div([
-                                html.Label("Select Neighborhood:", className="text-white mb-1"),
-                                dcc.Dropdown(
-                                    id='neighborhood_selector',
-                                    options=[{'label': n, 'value': n}
-                                             for n in sorted(crashes['neighborhood'].dropna().unique())],
-                                    placeholder="All Neighborhoods",
-                                    clearable=True,
-                                    style={
-                                        'width':'100%',
-                                        'fontSize':'1.05em',
-                                        'color':'black',
-                                        'backgroundColor':'white'
-                                    }
+                            ],
+                            target="about-icon",
+                            trigger="click",
+                            placement="right"
+                        ),
+
+
+                        # Actual controls
+                        dbc.Row([
+
+                            # Data Type radios
+                            dbc.Col([
+                                html.Label(
+                                    "Historical or Forecast:",
+                                    className="text-white mb-1 mt-n1",
+                                    style={'fontSize':'1.05em'}
                                 ),
-                                # 2) show confidence level underneath
-                                html.Div(id='neighborhood_confidence', className="text-white mt-2")
-                            ])
 
-                        ], width=8,
-                           className="d-flex flex-column justify-content-center"),
+                                dcc.RadioItems(
+                                    id='data_type',
+                                    options=[
+                                        {'label': 'Historical', 'value': 'historical'},
+                                        {'label': 'Forecast',   'value': 'forecast'}
+                                    ],
+                                    value='historical',
+                                    inline=True,
+                                    labelStyle={'color':'white','fontSize':'1.1em','marginRight':'1.5rem'},
+                                    inputStyle={'marginRight':'0.5rem'}
+                                )
+                            ], width=4,
+                               className="d-flex flex-column justify-content-center",
+                               style={'fontSize':'1.05em'}),
 
-                    ], className="h-100")
+                            # Date range + neighborhood selector
+                            dbc.Col([
 
-                ], style={'color':'white'})
-            ], color='#252e3f', inverse=True, style={'height':'300px'}),  # moved down, made taller
-        width=6),
+                                html.Div([
+                                    html.Label("Date Range:", className="text-white mb-1"),
+                                    dcc.DatePickerRange(
+                                        id='date_picker',
+                                        min_date_allowed=min_date,
+                                        max_date_allowed=max_date,
+                                        start_date=min_date,
+                                        end_date=max_date,
+                                        display_format='YYYY-MM-DD',
+                                        style={'width':'100%','fontSize':'1.05em'}
+                                    )
+                                ], className="mb-4"),
 
+                                html.Div([
+                                    html.Label("Select Neighborhood:", className="text-white mb-1"),
+                                    dcc.Dropdown(
+                                        id='neighborhood_selector',
+                                        options=[{'label': n, 'value': n}
+                                                 for n in neighborhoods],
+                                        placeholder="All Neighborhoods",
+                                        clearable=True,
+                                        style={
+                                            'width':'100%',
+                                            'fontSize':'1.05em',
+                                            'color':'black',
+                                            'backgroundColor':'white'
+                                        }
+                                    ),
+                                    # 2) show confidence level underneath
+                                    html.Div(id='neighborhood_confidence', className="text-white mt-2")
+                                ])
+
+                            ], width=8,
+                               className="d-flex flex-column justify-content-center"),
+
+                        ], className="h-100")
+
+                    ], style={'color':'white'})
+                ], color='#252e3f', inverse=True, style={'height':'300px'}),  # moved down, made taller
+            width=6),
+
+
+            # Info cards (Right)
+            dbc.Col(
+                dbc.Row([
+                    dbc.Col(dbc.Card([
+                        dbc.CardBody([
+                            html.H6("Total Crashes", className="card-title text-center"),
+                            html.H4(
+                                id='total_crashes',
+                                className="text-center",
+                                style={'color':'#636EFB','fontSize':'2rem','marginTop':'5rem'}
+                            )
+                        ])
+                    ], color='#252e3f', inverse=True, style={'height':'300px'}), width=4),
+
+                    dbc.Col(dbc.Card([
+                        dbc.CardBody([
+                            html.H6("Total Injured", className="card-title text-center"),
+                            html.H4(
+                                id='total_injured',
+                                className="text-center",
+                                style={'color':'#636EFB','fontSize':'2rem','marginTop':'5rem'}
+                            )
+                        ])
+                    ], color='#252e3f', inverse=True, style={'height':'300px'}), width=4),
+
+                    dbc.Col(dbc.Card([
+                        dbc.CardBody([
+                            html.H6("Total Killed", className="card-title text-center"),
+                            html.H4(
+                                id='total_killed',
+                                className="text-center",
+                                style={'color':'#636EFB','fontSize':'2rem','marginTop':'5rem'}
+                            )
+                        ])
+                    ], color='#252e3f', inverse=True, style={'height':'300px'}), width=4),
+                ], className="g-3"),
+            width=6),
+        ], className="mt-4 mb-4"),
 
-        # Info cards (Right)
-        dbc.Col(
-            dbc.Row([
-                dbc.Col(dbc.Card([
-                    dbc.CardBody([
-                        html.H6("Total Crashes", className="card-title text-center"),
-                        html.H4(
-                            id='total_crashes',
-                            className="text-center",
-                            style={'color':'#636EFB','fontSize':'2rem','marginTop':'5rem'}
-                        )
-                    ])
-                ], color='#252e3f', inverse=True, style={'height':'300px'}), width=4),
-
-                dbc.Col(dbc.Card([
-                    dbc.CardBody([
-                        html.H6("Total Injured", className="card-title text-center"),
-                        html.H4(
-                            id='total_injured',
-                            className="text-center",
-                            style={'color':'#636EFB','fontSize':'2rem','marginTop':'5rem'}
-                        )
-                    ])
-                ], color='#252e3f', inverse=True, style={'height':'300px'}), width=4),
-
-                dbc.Col(dbc.Card([
-                    dbc.CardBody([
-                        html.H6("Total Killed", className="card-title text-center"),
-                        html.H4(
-                            id='total_killed',
-                            className="text-center",
-                            style={'color':'#636EFB','fontSize':'2rem','marginTop':'5rem'}
-                        )
-                    ])
-                ], color='#252e3f', inverse=True, style={'height':'300px'}), width=4),
-            ], className="g-3"),
-        width=6),
-    ], className="mt-4 mb-4"),
 
+        html.Hr(className="border-secondary"),
 
-    html.Hr(className="border-secondary"),
 
+        # Bottom row: Map | Time series
+        dbc.Row([
 
-    # Bottom row: Map | Time series
-    dbc.Row([
+            # Map panel
+            dbc.Col([
+                dcc.Graph(
+                    id='crash_map',
+                    config={'displayModeBar': False},
+                    style={'height':'425px'}
+                ),
+            ], width=6),
 
-        # Map panel
-        dbc.Col([
-            dcc.Graph(
-                id='crash_map',
-                config={'displayModeBar': False},
-                style={'height':'425px'}
-            ),
-        ], width=6),
 
+            # Time series panel
+            dbc.Col([
+                dcc.Graph(
+                    id='time_series_chart',
+                    config={'displayModeBar': False},
+                    style={'height':'425px','backgroundColor':'#252e3f'}
+                ),
+            ], width=6),
 
-        # Time series panel
-        dbc.Col([
-            dcc.Graph(
-                id='time_series_chart',
-                config={'displayModeBar': False},
-                style={'height':'425px','backgroundColor':'#252e3f'}
-            ),
-        ], width=6),
+        ]),
 
-    ]),
+    ])
 
-])
+
+# The layout is built per page load, so the cube is only read once a browser
+# asks for it; the data-free copy lets Dash validate callbacks at startup
+app.validation_layout = make_layout()
+app.layout = lambda: make_layout(data.cube.min_date, data.cube.max_date, data.cube.neighborhoods,
+                                 data.client_payload if CLIENTSIDE else None)
 
 
 # ─── Callbacks ─────────────────────────────────────────────────────────────────
 
-# 1) Infoboxes: handle Historical vs Forecast
-@app.callback(
-    [
-        Output('total_crashes','children'),
-        Output('total_killed','children'),
-        Output('total_injured','children'),
-    ],
-    [
-        Input('date_picker','start_date'),
-        Input('date_picker','end_date'),
-        Input('neighborhood_selector','value'),
-        Input('data_type','value'),
-    ]
-)
-def update_infoboxes(start_date,end_date,neighborhood,data_type):
-    sd = pd.to_datetime(start_date).date()
-    ed = pd.to_datetime(end_date).date()
-    min_d = crashes['crash_date'].min().date()
-    max_d = crashes['crash_date'].max().date()
+FILTER_INPUTS = [
+    Input('date_picker','start_date'),
+    Input('date_picker','end_date'),
+    Input('neighborhood_selector','value'),
+    Input('data_type','value'),
+]
+INFOBOX_OUTPUTS = [
+    Output('total_crashes','children'),
+    Output('total_killed','children'),
+    Output('total_injured','children'),
+]
 
-    # Historical + full range + no neighborhood
-    if data_type=='historical' and sd==min_d and ed==max_d and not neighborhood:
-        return "2,171,175","3,367","699,348"
 
-    # Historical + any filter
+# 1) Infoboxes: handle Historical vs Forecast
+@cache.memoize(normalize_date, normalize_date, normalize_choice, normalize_choice)
+def update_infoboxes(start_date,end_date,neighborhood,data_type):
+    # Historical: prefix-sum lookup for any date range / neighborhood
     if data_type=='historical':
-        dff = crashes[(crashes['crash_date'].dt.date>=sd)&(crashes['crash_date'].dt.date<=ed)]
-        if neighborhood:
-            dff = dff[dff['neighborhood']==neighborhood]
-        return f"{len(dff):,}",f"{int(dff['killed'].sum()):,}",f"{int(dff['injured'].sum()):,}"
+        t = data.cube.totals(start_date,end_date,neighborhood)
+        return f"{t['crashes']:,}",f"{t['killed']:,}",f"{t['injured']:,}"
 
     # Forecast mode
-    if neighborhood:
-        df_nb = crashes[crashes['neighborhood']==neighborhood]
-        ratio_i = df_nb['injured'].sum()/len(df_nb) if len(df_nb)>0 else 0
-        ratio_k = df_nb['killed'].sum()/len(df_nb)  if len(df_nb)>0 else 0
-        ts = df_nb.groupby('crash_date').size().asfreq('D').fillna(0)
-        model = SARIMAX(ts,order=(1,1,1),seasonal_order=(1,1,1,7),
-                        enforce_stationarity=False,enforce_invertibility=False).fit(disp=False)
-        fc = model.get_forecast(365).predicted_mean
-    else:
-        fc = city_model.get_forecast(365).predicted_mean
-        ratio_i = crashes['injured'].sum()/len(crashes)
-        ratio_k = crashes['killed'].sum()/len(crashes)
-
-    total_fc = fc.sum()
+    fc = data.forecasts.get(neighborhood or CITY_KEY)
+    if fc is None:
+        return "N/A","N/A","N/A"
+    t = data.cube.totals(data.cube.min_date,data.cube.max_date,neighborhood)
+    ratio_i = t['injured']/t['crashes'] if t['crashes']>0 else 0
+    ratio_k = t['killed']/t['crashes']  if t['crashes']>0 else 0
+
+    total_fc = fc['mean'].sum()
     injured_fc = int(round(total_fc*ratio_i))
     killed_fc  = int(round(total_fc*ratio_k))
     return f"{int(round(total_fc)):,}",f"{killed_fc:,}",f"{injured_fc:,}"
 
 
+if CLIENTSIDE:
+    app.clientside_callback(ClientsideFunction('crashes', 'infoboxes'),
+                            INFOBOX_OUTPUTS, FILTER_INPUTS + [Input('client_cube','data')])
+else:
+    app.callback(INFOBOX_OUTPUTS, FILTER_INPUTS)(timed_callback(update_infoboxes))
+
+
 # 2) Map callback with bounds zoom
+def _map_geojson(neighborhood):
+    # City view at the coarsest outlines; a selected NTA is drawn in more detail
+    return data.geometry.collection(data.confidence['neighborhood'], level='z9',
+                                    detail=neighborhood, detail_level='z14')
+
+
+def _strip_geojson(fig):
+    # The outlines are most of a map figure and cheap to look up again, so cached maps go without them
+    for trace in fig['data']:
+        trace.pop('geojson', None)
+    return fig
+
+
+def _restore_geojson(fig, start_date, end_date, neighborhood):
+    geojson = _map_geojson(neighborhood)
+    for trace in fig['data']:
+        trace['geojson'] = geojson
+    return fig
+
+
 @app.callback(
     Output('crash_map','figure'),
     [
@@ -295,17 +386,21 @@ def update_infoboxes(start_date,end_date,neighborhood,data_type):
         Input('neighborhood_selector','value'),
     ]
 )
+@timed_callback
+@cache.memoize(normalize_date, normalize_date, normalize_choice, detach=(_strip_geojson, _restore_geojson))
 def update_map(start_date,end_date,neighborhood):
-    dff = crashes[(crashes['crash_date']>=start_date)&(crashes['crash_date']<=end_date)]
-    if neighborhood:
-        dff = dff[dff['neighborhood']==neighborhood]
+    # plotly.express takes about a second to import; keep it off the startup path
+    import plotly.express as px
 
-    agg = dff.groupby('neighborhood').size().reset_index(name='value')
-    all_nb = pd.DataFrame({'neighborhood':confidence['neighborhood']})
+    agg = data.cube.by_neighborhood(start_date,end_date)
+    if neighborhood:
+        agg = agg[agg.index==neighborhood]
+    agg = agg.rename('value').reset_index()
+    all_nb = pd.DataFrame({'neighborhood':data.confidence['neighborhood']})
     agg = all_nb.merge(agg,on='neighborhood',how='left').fillna(0)
 
     fig = px.choropleth_mapbox(
-        agg, geojson=geojson_nbhd,
+        agg, geojson=_map_geojson(neighborhood),
         locations='neighborhood', featureidkey='properties.NTAName',
         color='value', hover_data=['value'],
         mapbox_style='carto-darkmatter',
@@ -317,26 +412,9 @@ def update_map(start_date,end_date,neighborhood):
         paper_bgcolor='rgba(0,0,0,0)'
     )
 
-    if neighborhood:
-        feat = next(f for f in geojson_nbhd['features']
-                    if f['properties']['NTAName']==neighborhood)
-        pts = []
-        def _extract(c):
-            if isinstance(c[0],(list,tuple)) and not isinstance(c[0][0],(float,int)):
-                for part in c: _extract(part)
-            else:
-                for lon,lat in c: pts.append((lon,lat))
-
-        geom = feat['geometry']
-        coords = geom['coordinates']
-        if geom['type']=="Polygon":
-            _extract(coords)
-        else:
-            for poly in coords: _extract(poly)
-
-        lons,lats = zip(*pts)
-        bbox = {'west':min(lons),'south':min(lats),
-                'east':max(lons),'north':max(lats)}
+    # A selected NTA is framed from the precomputed bbox index
+    bbox = data.geometry.bounds(neighborhood) if neighborhood else None
+    if bbox:
         fig.update_layout(mapbox=dict(bounds=bbox))
     else:
         fig.update_layout(mapbox=dict(center={"lat":40.7128,"lon":-74.0060},zoom=9))
@@ -345,22 +423,11 @@ def update_map(start_date,end_date,neighborhood):
 
 
 # 3) Time series + 7-day rolling + forecast overlay
-@app.callback(
-    Output('time_series_chart','figure'),
-    [
-        Input('date_picker','start_date'),
-        Input('date_picker','end_date'),
-        Input('neighborhood_selector','value'),
-        Input('data_type','value'),
-    ]
-)
+@cache.memoize(normalize_date, normalize_date, normalize_choice, normalize_choice)
 def update_time_series(start_date,end_date,neighborhood,data_type):
-    dff = crashes[(crashes['crash_date']>=start_date)&(crashes['crash_date']<=end_date)]
-    if neighborhood:
-        dff = dff[dff['neighborhood']==neighborhood]
+    import plotly.express as px
 
-    daily = dff.groupby('crash_date').size().rename('value')
-    daily = daily.asfreq('D',fill_value=0)
+    daily = data.cube.daily(start_date,end_date,neighborhood).rename('value')
     smoothed = daily.rolling(window=7,center=True,min_periods=1).mean()
     hist = smoothed.reset_index()
 
@@ -368,17 +435,11 @@ def update_time_series(start_date,end_date,neighborhood,data_type):
                   labels={'crash_date':'Date','value':'Crashes'},
                   template='plotly_dark')
 
-    if data_type=='forecast':
+    fc = data.forecasts.get(neighborhood or CITY_KEY) if data_type=='forecast' else None
+    if fc is not None:
         last = hist['crash_date'].max()
-        future = pd.date_range(last+pd.Timedelta(days=1),periods=365,freq='D')
-        if neighborhood:
-            df_nb = crashes[crashes['neighborhood']==neighborhood]
-            ts = df_nb.groupby('crash_date').size().asfreq('D').fillna(0)
-            model = SARIMAX(ts,order=(1,1,1),seasonal_order=(1,1,1,7),
-                            enforce_stationarity=False,enforce_invertibility=False).fit(disp=False)
-            vals = model.get_forecast(365).predicted_mean.values
-        else:
-            vals = city_model.get_forecast(365).predicted_mean.values
+        future = pd.date_range(last+pd.Timedelta(days=1),periods=len(fc),freq='D')
+        vals = fc['mean'].values
 
         fc_df = pd.DataFrame({'crash_date':future,'value':vals})
         fc_df['smoothed'] = fc_df['value'].rolling(window=7, center=True, min_periods=1).mean()
@@ -397,15 +458,23 @@ def update_time_series(start_date,end_date,neighborhood,data_type):
     return fig
 
 
+if CLIENTSIDE:
+    app.clientside_callback(ClientsideFunction('crashes', 'time_series'),
+                            Output('time_series_chart','figure'), FILTER_INPUTS + [Input('client_cube','data')])
+else:
+    app.callback(Output('time_series_chart','figure'), FILTER_INPUTS)(timed_callback(update_time_series))
+
+
 # 4) Auto-set start-date when Forecast selected
 @app.callback(
     Output('date_picker','start_date'),
     Input('data_type','value')
 )
+@timed_callback
 def _auto_set_start(data_type):
     if data_type=='forecast':
         return '2021-04-22'
-    return crashes['crash_date'].min().date().isoformat()
+    return data.cube.min_date.date().isoformat()
 
 
 # 5) Neighborhood confidence display
@@ -413,9 +482,10 @@ def _auto_set_start(data_type):
     Output('neighborhood_confidence','children'),
     Input('neighborhood_selector','value')
 )
+@timed_callback
 def update_confidence(neighborhood):
     if neighborhood:
-        lvl = confidence.loc[confidence['neighborhood']==neighborhood,'confidence_level'].iloc[0]
+        lvl = data.confidence.loc[data.confidence['neighborhood']==neighborhood,'confidence_level'].iloc[0]
         return f"Forecast: {lvl}"
     return ""
 
@@ -0,0 +1,224 @@
+// Clientside filtering for the dashboard (DASHBOARD_CLIENTSIDE=1).
+// The server ships a packed (date x neighborhood) cube once, see
+// client_payload() in src/visualization/dashboard_data.py; date range and
+// neighborhood changes are then answered here without a server round trip.
+
+(function () {
+    const DAY_MS = 86400000;
+    const TYPES = {
+        uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array,
+        int32: Int32Array, float32: Float32Array, float64: Float64Array
+    };
+
+    function unpack(packed) {
+        const bytes = Uint8Array.from(atob(packed.data), c => c.charCodeAt(0));
+        return new TYPES[packed.dtype](bytes.buffer);
+    }
+
+    function unpackCounts(packed) {
+        // Dense arrays as they are; sparse ones from gaps between nonzero positions
+        if (packed.format !== 'sparse') {
+            return unpack(packed);
+        }
+        const gaps = unpack(packed.gaps);
+        const values = unpack(packed.values);
+        const out = new TYPES[packed.values.dtype](packed.shape.reduce((a, b) => a * b, 1));
+        let position = -1;
+        for (let i = 0; i < gaps.length; i++) {
+            position += gaps[i];
+            out[position] = values[i];
+        }
+        return out;
+    }
+
+    function unpackQuantized(packed) {
+        const steps = unpack(packed);
+        return Float32Array.from(steps, q => packed.offset + q * packed.scale);
+    }
+
+    function dayNumber(value) {
+        return Math.floor(Date.parse(String(value).slice(0, 10)) / DAY_MS);
+    }
+
+    function isoDate(day) {
+        return new Date(day * DAY_MS).toISOString().slice(0, 10);
+    }
+
+    function formatCount(n) {
+        return Math.round(n).toLocaleString('en-US');
+    }
+
+    // Decoded once per payload object and kept for later interactions
+    let cache = {payload: null, cube: null};
+
+    function decode(payload) {
+        if (cache.payload === payload) {
+            return cache.cube;
+        }
+        const measures = {};
+        for (const name in payload.measures) {
+            measures[name] = unpackCounts(payload.measures[name]);
+        }
+        const width = payload.neighborhoods.length;
+        // City totals per day, summed once so city queries are a single pass
+        const city = {};
+        for (const name in measures) {
+            const values = measures[name];
+            const total = new Float64Array(payload.days);
+            for (let i = 0; i < payload.days; i++) {
+                let sum = 0;
+                for (let j = 0; j < width; j++) {
+                    sum += values[i * width + j];
+                }
+                total[i] = sum;
+            }
+            city[name] = total;
+        }
+        const index = {};
+        payload.neighborhoods.forEach((n, j) => { index[n] = j; });
+        const forecastIndex = {};
+        payload.forecast_keys.forEach((k, i) => { forecastIndex[k] = i; });
+
+        cache = {
+            payload: payload,
+            cube: {
+                start: dayNumber(payload.start), days: payload.days, width: width,
+                measures: measures, city: city, index: index,
+                forecastIndex: forecastIndex, forecastLength: payload.forecast_length,
+                forecastMean: unpackQuantized(payload.forecast_mean),
+                horizon: payload.forecast_mean.shape[1], template: payload.template
+            }
+        };
+        return cache.cube;
+    }
+
+    function bounds(cube, startDate, endDate) {
+        // Inclusive calendar-day range -> half-open row range, clipped to the cube
+        const i0 = Math.max(0, dayNumber(startDate) - cube.start);
+        const i1 = Math.min(cube.days, dayNumber(endDate) - cube.start + 1);
+        return [i0, Math.max(i0, i1)];
+    }
+
+    function series(cube, measure, neighborhood, i0, i1) {
+        // Daily values for rows [i0, i1), or null for an unknown neighborhood
+        if (!neighborhood) {
+            return cube.city[measure].subarray(i0, i1);
+        }
+        const j = cube.index[neighborhood];
+        if (j === undefined) {
+            return null;
+        }
+        const values = cube.measures[measure];
+        const out = new Float64Array(i1 - i0);
+        for (let i = i0; i < i1; i++) {
+            out[i - i0] = values[i * cube.width + j];
+        }
+        return out;
+    }
+
+    function total(cube, measure, neighborhood, i0, i1) {
+        const values = series(cube, measure, neighborhood, i0, i1);
+        let sum = 0;
+        if (values) {
+            for (let i = 0; i < values.length; i++) {
+                sum += values[i];
+            }
+        }
+        return sum;
+    }
+
+    function forecastMeans(cube, key) {
+        const i = cube.forecastIndex[key];
+        if (i === undefined) {
+            return null;
+        }
+        return cube.forecastMean.subarray(i * cube.horizon, i * cube.horizon + cube.forecastLength[i]);
+    }
+
+    function rolling7(values) {
+        // pandas rolling(window=7, center=True, min_periods=1).mean()
+        const out = new Array(values.length);
+        for (let i = 0; i < values.length; i++) {
+            let sum = 0;
+            let n = 0;
+            for (let k = Math.max(0, i - 3); k <= Math.min(values.length - 1, i + 3); k++) {
+                sum += values[k];
+                n++;
+            }
+            out[i] = sum / n;
+        }
+        return out;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        crashes: {
+            infoboxes: function (startDate, endDate, neighborhood, dataType, payload) {
+                if (!payload) {
+                    return [window.dash_clientside.no_update, window.dash_clientside.no_update,
+                            window.dash_clientside.no_update];
+                }
+                const cube = decode(payload);
+                if (dataType === 'historical') {
+                    const [i0, i1] = bounds(cube, startDate, endDate);
+                    return ['crashes', 'killed', 'injured'].map(
+                        m => formatCount(total(cube, m, neighborhood, i0, i1)));
+                }
+
+                const fc = forecastMeans(cube, neighborhood || payload.city_key);
+                if (!fc) {
+                    return ['N/A', 'N/A', 'N/A'];
+                }
+                const crashes = total(cube, 'crashes', neighborhood, 0, cube.days);
+                const ratioI = crashes > 0 ? total(cube, 'injured', neighborhood, 0, cube.days) / crashes : 0;
+                const ratioK = crashes > 0 ? total(cube, 'killed', neighborhood, 0, cube.days) / crashes : 0;
+                const totalFc = fc.reduce((a, b) => a + b, 0);
+                return [formatCount(totalFc), formatCount(totalFc * ratioK), formatCount(totalFc * ratioI)];
+            },
+
+            time_series: function (startDate, endDate, neighborhood, dataType, payload) {
+                if (!payload) {
+                    return window.dash_clientside.no_update;
+                }
+                const cube = decode(payload);
+                const [i0, i1] = bounds(cube, startDate, endDate);
+                let values = series(cube, 'crashes', neighborhood, i0, i1) || [];
+
+                // Trimmed to the first and last day with any crashes, like the server side
+                let first = 0;
+                let last = values.length - 1;
+                while (first <= last && values[first] === 0) first++;
+                while (last >= first && values[last] === 0) last--;
+                values = Array.from(values.slice(first, last + 1));
+                const x = values.map((_, k) => isoDate(cube.start + i0 + first + k));
+
+                const traces = [{
+                    type: 'scatter', mode: 'lines', x: x, y: rolling7(values),
+                    line: {color: '#636efa'}, showlegend: false,
+                    hovertemplate: 'Date=%{x}<br>Crashes=%{y}<extra></extra>'
+                }];
+
+                const fc = dataType === 'forecast' ? forecastMeans(cube, neighborhood || payload.city_key) : null;
+                if (fc && x.length) {
+                    const lastDay = dayNumber(x[x.length - 1]);
+                    traces.push({
+                        type: 'scatter', mode: 'lines',
+                        x: Array.from(fc, (_, k) => isoDate(lastDay + 1 + k)),
+                        y: rolling7(Array.from(fc)),
+                        line: {shape: 'spline', color: 'orange'},
+                        name: 'Forecast (7d MA)'
+                    });
+                }
+
+                return {
+                    data: traces,
+                    layout: {
+                        template: cube.template,
+                        xaxis: {title: {text: 'Date'}}, yaxis: {title: {text: 'Crashes'}},
+                        margin: {r: 0, t: 0, l: 0, b: 0},
+                        paper_bgcolor: 'rgba(0,0,0,0)', plot_bgcolor: 'rgba(0,0,0,0)'
+                    }
+                };
+            }
+        }
+    });
+})();
@@ -0,0 +1,363 @@
+import click
+import inspect
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from src.benchmarks.synthetic import BASE_ROWS, write_synthetic_dataset
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+# Regressions beyond this fraction of the baseline fail the run
+TOLERANCE = 0.25
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS = 0.05
+MIN_RSS_MB = 20
+MAX_NEIGHBORHOODS = 8
+FEATURES_DIR = 'data/processed/calendar_features'
+CALLBACK_REPEATS = 5
+
+
+# ─── Stages ──────────────────────────────────────────────────────────────────
+# Each runs in a fresh process with the synthetic dataset root as working
+# directory, and returns row counts (and any sub-measurements) for the report.
+
+def stage_ingest_parse(root):
+    # Synthetic API page bodies, parsed into the raw store schema one page at
+    # a time by the parser the downloader hands to fetch_pages
+    from src.data.nyc_motor_vehicle_collisions import parse_page
+
+    rows = 0
+    for path in sorted(Path('data/raw/pages').glob('page-*.csv')):
+        rows += len(parse_page(path.read_text()))
+    return {'rows_in': rows, 'rows_out': rows}
+
+
+def stage_create_crashes(root):
+    from src.features.nyc_motor_vehicle_collisions.create_crashes import (
+        create_crashes)
+
+    create_crashes(
+        input_file='data/interim/crashes.csv',
+        output_dir='data/processed/crashes',
+        geojson_file='data/external/neighborhoods.geojson',
+        index_cache='data/interim/neighborhood_index.npz',
+        full=True
+    )
+    rows_in = json.loads(Path('synthetic.json').read_text())['rows']
+    rows_out = ds.dataset('data/processed/crashes', format='parquet',
+                          partitioning='hive').count_rows()
+    return {'rows_in': rows_in, 'rows_out': rows_out}
+
+
+def stage_timeseries_features(root):
+    from src.features.build_timeseries_features import (
+        build_timeseries_features)
+
+    build_timeseries_features(
+        input_file='data/processed/crashes',
+        output_dir='data/processed',
+        geojson_file='data/external/neighborhoods.geojson'
+    )
+    daily = pd.read_parquet(
+        'data/processed/daily_neighborhood_crashes.parquet',
+        columns=['total_crashes'])
+    return {'rows_in': int(daily['total_crashes'].sum()),
+            'rows_out': len(daily)}
+
+
+def stage_city_sarima(root):
+    from src.features.build_features import (build_calendar_features,
+                                             load_calendar, model_exog)
+    from src.models.forecast_crash_counts import SEASONAL_ORDER, fit_full
+
+    daily_city = pd.read_parquet('data/processed/daily_city_crashes.parquet')
+    daily_city['crash_date'] = pd.to_datetime(daily_city['crash_date'])
+    daily_city = daily_city.set_index('crash_date').asfreq('D')
+    build_calendar_features(FEATURES_DIR, start=daily_city.index[0],
+                            end=daily_city.index[-1])
+    exog = load_calendar(FEATURES_DIR).frame(
+        daily_city.index, groups=model_exog(SEASONAL_ORDER))
+    fit_full(daily_city, exog)
+    return {'rows_in': len(daily_city), 'rows_out': 1}
+
+
+def stage_neighborhood_sarima(root, max_neighborhoods=MAX_NEIGHBORHOODS):
+    from src.features.build_features import build_calendar_features
+    from src.models.forecast_neighborhood_crashes import evaluate_neighborhood
+    from src.models.training_engine import run_fits, split_series
+
+    daily = pd.read_parquet(
+        'data/processed/daily_neighborhood_crashes.parquet')
+    daily['crash_date'] = pd.to_datetime(daily['crash_date'])
+    series = split_series(daily)
+    # The busiest neighborhoods, so every one of them is actually fitted
+    busiest = sorted(series,
+                     key=lambda k: -series[k].sum())[:max_neighborhoods]
+    build_calendar_features(FEATURES_DIR, start=daily['crash_date'].min(),
+                            end=daily['crash_date'].max())
+    with tempfile.TemporaryDirectory() as checkpoints:
+        records = run_fits({k: series[k] for k in busiest},
+                           partial(evaluate_neighborhood,
+                                   features_dir=FEATURES_DIR),
+                           checkpoints, desc="Benchmark fits")
+    return {'rows_in': sum(len(series[k]) for k in busiest),
+            'rows_out': sum(r['status'] == 'ok' for r in records.values())}
+
+
+def stage_dashboard_callbacks(root, repeats=CALLBACK_REPEATS):
+    # Latency of every app.py callback over a few typical filter states,
+    # computed uncached (through __wrapped__) and then served from the
+    # callback cache
+    os.environ['DASHBOARD_STARTUP'] = 'eager'
+    os.environ['DASHBOARD_CACHE'] = str(
+        Path('data/interim/benchmark_callback_cache.sqlite').resolve())
+    sys.path.insert(0, str(REPO_ROOT))
+    import app
+
+    app.cache.clear()
+    cube = app.data.cube
+    busiest = cube.by_neighborhood(cube.min_date, cube.max_date).idxmax()
+    last = cube.max_date
+    ranges = [(cube.min_date, last),
+              (last - pd.Timedelta(days=365), last),
+              (last - pd.Timedelta(days=30), last)]
+    states = [(str(s.date()), str(e.date()), n)
+              for s, e in ranges for n in (None, busiest)]
+    with_tabs = [s + (t,) for s in states for t in ('historical', 'forecast')]
+
+    calls = {
+        'update_infoboxes': with_tabs,
+        'update_map': states,
+        'update_time_series': with_tabs,
+        'update_confidence': [(None,), (busiest,)],
+    }
+    callbacks = {}
+    for name, arg_sets in calls.items():
+        fn = getattr(app, name)
+        compute = inspect.unwrap(fn)
+        latencies = []
+        for args in arg_sets:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                compute(*args)
+                latencies.append(time.perf_counter() - start)
+        callbacks[name] = {'seconds': float(np.median(latencies)),
+                           'p95_seconds': float(np.percentile(latencies, 95))}
+
+        if compute is not fn:
+            for args in arg_sets:
+                fn(*args)
+            cached = []
+            for args in arg_sets:
+                start = time.perf_counter()
+                fn(*args)
+                cached.append(time.perf_counter() - start)
+            callbacks[f"{name} (cached)"] = {
+                'seconds': float(np.median(cached)),
+                'p95_seconds': float(np.percentile(cached, 95))}
+    return {'rows_in': int(cube.values.shape[0] * cube.values.shape[1]),
+            'rows_out': len(calls), 'callbacks': callbacks}
+
+
+STAGES = {
+    'ingest_parse': stage_ingest_parse,
+    'create_crashes': stage_create_crashes,
+    'timeseries_features': stage_timeseries_features,
+    'city_sarima': stage_city_sarima,
+    'neighborhood_sarima': stage_neighborhood_sarima,
+    'dashboard_callbacks': stage_dashboard_callbacks,
+}
+
+
+def prepare_dashboard(root):
+    """ Dashboard inputs the pipeline stages do not produce: simplified
+        geometry, a confidence table and a seasonal-naive forecast store in
+        the real layout.
+    """
+    from src.features.build_neighborhood_geometry import (
+        build_neighborhood_geometry)
+    from src.models.forecast_store import (CITY_KEY, HORIZON, MODEL_VERSION,
+                                           STORE_COLUMNS)
+    from src.models.training_engine import split_series
+
+    root = Path(root)
+    build_neighborhood_geometry(root / 'data/external/neighborhoods.geojson',
+                                root / 'data/processed/neighborhood_geometry')
+
+    daily = pd.read_parquet(
+        root / 'data/processed/daily_neighborhood_crashes.parquet')
+    daily['crash_date'] = pd.to_datetime(daily['crash_date'])
+    series = split_series(daily)
+    confidence = pd.DataFrame({'neighborhood': list(series),
+                               'confidence_level': 'Medium'})
+    confidence.to_csv(
+        root / 'data/processed/neighborhood_forecast_confidence.csv',
+        index=False)
+
+    city = daily.groupby('crash_date')['total_crashes'].sum()
+    series[CITY_KEY] = city.asfreq('D', fill_value=0)
+    frames = []
+    for key, ts in series.items():
+        # Last week repeated over the horizon
+        dates = pd.date_range(ts.index[-1] + pd.Timedelta(days=1),
+                              periods=HORIZON, freq='D')
+        mean = np.resize(ts.iloc[-7:].to_numpy(dtype=np.float32), HORIZON)
+        frames.append(pd.DataFrame({'key': key, 'model_version': MODEL_VERSION,
+                                    'step': np.arange(1, HORIZON + 1),
+                                    'date': dates, 'mean': mean,
+                                    'lower': mean * 0.8,
+                                    'upper': mean * 1.2}))
+    store = pd.concat(frames, ignore_index=True)
+    store[STORE_COLUMNS].to_parquet(
+        root / 'models/forecast_store/reconciled_forecasts.parquet',
+        index=False)
+
+
+# ─── Measurement ─────────────────────────────────────────────────────────────
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS; children covers pool
+    # workers
+    unit = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / unit
+
+
+def _measure(name, root, options):
+    # Runs inside a fresh process, so peak RSS belongs to this stage alone
+    os.chdir(root)
+    start = time.perf_counter()
+    info = STAGES[name](root, **options)
+    seconds = time.perf_counter() - start
+    return dict(info, seconds=seconds, peak_rss_mb=_peak_rss_mb())
+
+
+def run_stage(name, root, **options):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_measure, name, str(root), options).result()
+
+
+def flatten(results):
+    # Callback latencies become their own rows, next to the stages
+    rows = {}
+    for name, info in results.items():
+        rows[name] = {k: v for k, v in info.items() if k != 'callbacks'}
+        for callback, timing in info.get('callbacks', {}).items():
+            rows[f"callback:{callback}"] = timing
+    return rows
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """ Stages slower, or with a higher peak RSS, than
+        baseline x (1 + tolerance).
+    """
+    regressions = []
+    for name, now in current.items():
+        then = baseline.get(name)
+        if then is None:
+            continue
+        for metric, floor in (('seconds', MIN_SECONDS),
+                              ('peak_rss_mb', MIN_RSS_MB)):
+            if metric not in now or metric not in then:
+                continue
+            if (now[metric] > then[metric] * (1 + tolerance)
+                    and now[metric] - then[metric] > floor):
+                regressions.append(f"{name}: {metric} {then[metric]:.3f} "
+                                   f"-> {now[metric]:.3f}")
+    return regressions
+
+
+def _report(label, rows, baseline):
+    print(f"\n{label}")
+    print(f"{'stage':<42}{'seconds':>10}{'baseline':>10}{'peak MB':>10}"
+          f"{'rows in':>14}{'rows out':>12}")
+    for name, row in rows.items():
+        then = baseline.get(name, {}).get('seconds')
+        then = '' if then is None else f'{then:.3f}'
+        print(f"{name:<42}{row['seconds']:>10.3f}{then:>10}"
+              f"{row.get('peak_rss_mb', float('nan')):>10.0f}"
+              f"{row.get('rows_in', ''):>14}{row.get('rows_out', ''):>12}")
+
+
+@click.command()
+@click.option('--scale', 'scales', type=float, multiple=True, default=(1,),
+              show_default=True,
+              help=f'Multiples of {BASE_ROWS:,} crash rows; repeat for '
+                   'several (e.g. 1, 10, 100).')
+@click.option('--stage', 'stages', type=click.Choice(list(STAGES)),
+              multiple=True,
+              help='Stages to run, in pipeline order (default: all).')
+@click.option('--workdir', default='data/benchmarks', show_default=True,
+              help='Where synthetic data is kept.')
+@click.option('--base-rows', type=int, default=BASE_ROWS, show_default=True)
+@click.option('--max-neighborhoods', type=int, default=MAX_NEIGHBORHOODS,
+              show_default=True,
+              help='Neighborhoods fitted by the neighborhood_sarima stage.')
+@click.option('--baseline', 'baseline_file',
+              default='reports/benchmarks/baseline.json', show_default=True)
+@click.option('--update-baseline', is_flag=True,
+              help='Store these results as the new baseline.')
+@click.option('--tolerance', type=float, default=TOLERANCE, show_default=True)
+def main(scales, stages, workdir, base_rows, max_neighborhoods,
+         baseline_file, update_baseline, tolerance):
+    """ Times each pipeline stage and dashboard callback on synthetic data and
+        compares time and peak memory with the stored baseline. Exits 1 on a
+        regression.
+    """
+    stages = [s for s in STAGES if s in stages] if stages else list(STAGES)
+    baseline_path = Path(baseline_file)
+    baselines = {}
+    if baseline_path.exists():
+        baselines = json.loads(baseline_path.read_text())
+
+    all_rows, regressions = {}, []
+    for scale in scales:
+        label = f"{scale:g}x"
+        root = Path(workdir).resolve() / f"scale_{label}"
+        n_rows = write_synthetic_dataset(root, scale, base_rows=base_rows)
+
+        results = {}
+        for name in stages:
+            if name == 'dashboard_callbacks':
+                prepare_dashboard(root)
+            options = {}
+            if name == 'neighborhood_sarima':
+                options['max_neighborhoods'] = max_neighborhoods
+            results[name] = run_stage(name, root, **options)
+
+        rows = flatten(results)
+        baseline = baselines.get(label, {})
+        _report(f"{label} ({n_rows:,} rows)", rows, baseline)
+        regressions += [f"{label} {r}"
+                        for r in compare(rows, baseline, tolerance)]
+        all_rows[label] = rows
+
+    output_dir = Path('reports/benchmarks')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / 'latest.json').write_text(json.dumps(all_rows, indent=2))
+    if update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps({**baselines, **all_rows},
+                                            indent=2, sort_keys=True))
+        print(f"\nBaseline updated: {baseline_path}")
+
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Rows in the real interim crashes table; scale 1 matches it
+BASE_ROWS = 2_100_000
+CHUNK_ROWS = 1_000_000
+
+# NYC bounding box, split into a grid of NTA-like cells
+WEST, EAST, SOUTH, NORTH = -74.25, -73.70, 40.49, 40.92
+GRID_COLS, GRID_ROWS = 20, 13
+# Points per cell edge; real NTA outlines have a few hundred vertices
+EDGE_POINTS = 16
+# Corner and edge wiggle as fractions of the cell size; together they stay
+# under a quarter cell, so crashes placed in a cell's middle half never leave
+# it
+CORNER_JITTER = 0.12
+EDGE_JITTER = 0.06
+BOROUGHS = ['Staten Island', 'Brooklyn', 'Manhattan', 'Bronx', 'Queens']
+
+START_DATE = pd.Timestamp('2012-07-01')
+DAYS = 4700
+# Crashes by hour of day, shaped like the real feed (low overnight, evening
+# peak)
+HOUR_WEIGHTS = np.array([2, 1.5, 1, 1, 1, 1.5, 3, 4, 5, 4.5, 4.5, 5,
+                         5.5, 5.5, 6.5, 7, 7, 7, 6, 5, 4, 3.5, 3, 2.5])
+WEEKDAY_WEIGHTS = np.array([1.0, 1.02, 1.03, 1.04, 1.1, 0.9, 0.8])
+# Share of rows with no usable coordinates
+MISSING_COORDS = 0.07
+
+# Rows per API page, as the downloader requests them
+PAGE_ROWS = 50_000
+# Values for the API's free-text columns, and the share of rows that fill each
+STREETS = ['BROADWAY', 'ATLANTIC AVENUE', 'BELT PARKWAY', 'GRAND CONCOURSE',
+           'QUEENS BOULEVARD', 'BROOKLYN BRIDGE', 'WEST 42 STREET']
+FACTORS = ['Unspecified', 'Driver Inattention/Distraction',
+           'Following Too Closely', 'Failure to Yield Right-of-Way',
+           'Unsafe Speed']
+VEHICLES = ['Sedan', 'Station Wagon/Sport Utility Vehicle', 'Taxi', 'Bike',
+            'Box Truck']
+FILL_SHARES = [1.0, 0.8, 0.08, 0.02, 0.01]
+
+
+def _edge_points(a, b, seed):
+    # Jittered points strictly between corners a and b; seeded by the edge, so
+    # the two cells sharing it get the same outline
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, EDGE_POINTS + 1)[1:-1]
+    points = a + np.outer(t, b - a)
+    normal = np.array([-(b - a)[1], (b - a)[0]])
+    offsets = (rng.uniform(-EDGE_JITTER, EDGE_JITTER, len(t))
+               * np.sin(np.pi * t))
+    return points + np.outer(offsets, normal)
+
+
+def synthetic_neighborhoods(seed=0):
+    """ GeoJSON FeatureCollection of GRID_COLS x GRID_ROWS cells tiling the NYC
+        bounding box. Corners and edges are jittered and shared between
+        neighbors, so the cells form a gap-free coverage like the NTA layer.
+    """
+    rng = np.random.default_rng(seed)
+    dx, dy = (EAST - WEST) / GRID_COLS, (NORTH - SOUTH) / GRID_ROWS
+    corners = np.stack(np.meshgrid(WEST + dx * np.arange(GRID_COLS + 1),
+                                   SOUTH + dy * np.arange(GRID_ROWS + 1),
+                                   indexing='ij'), axis=-1)
+    inner = corners[1:-1, 1:-1]
+    inner += rng.uniform(-CORNER_JITTER, CORNER_JITTER, inner.shape) * [dx, dy]
+
+    def edge(c0, c1):
+        # Canonical direction per edge so both neighbors draw the same points
+        if c0 > c1:
+            return edge(c1, c0)[::-1]
+        return _edge_points(corners[c0], corners[c1], [seed, *c0, *c1])
+
+    features = []
+    for i in range(GRID_COLS):
+        for j in range(GRID_ROWS):
+            ring_corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1)]
+            ring = []
+            for k in range(4):
+                c0, c1 = ring_corners[k], ring_corners[(k + 1) % 4]
+                ring.append(corners[c0][None])
+                ring.append(edge(c0, c1))
+            ring = np.vstack(ring + [corners[ring_corners[0]][None]])
+            features.append({
+                'type': 'Feature',
+                'properties': {
+                    'NTAName': f"Synthetic NTA {i:02d}-{j:02d}",
+                    'BoroName': BOROUGHS[i * len(BOROUGHS) // GRID_COLS],
+                },
+                'geometry': {'type': 'Polygon',
+                             'coordinates': [ring.round(6).tolist()]},
+            })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def _cell_centers(seed):
+    # Cell interiors used to place crashes: the center of each grid cell, away
+    # from its jittered edges
+    dx, dy = (EAST - WEST) / GRID_COLS, (NORTH - SOUTH) / GRID_ROWS
+    i, j = np.meshgrid(np.arange(GRID_COLS), np.arange(GRID_ROWS),
+                       indexing='ij')
+    centers = np.stack([WEST + dx * (i.ravel() + 0.5),
+                        SOUTH + dy * (j.ravel() + 0.5)], axis=1)
+    # Uneven activity across neighborhoods, as in the real data
+    weights = np.random.default_rng(seed + 1).lognormal(0, 0.8, len(centers))
+    return centers, weights / weights.sum(), (dx, dy)
+
+
+def synthetic_crashes(n_rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """ Yields interim-table chunks (the columns create_crashes reads) with a
+        trend, weekly and yearly seasonality, an hourly profile, uneven
+        neighborhood activity and some rows without coordinates.
+        Deterministic for a given `n_rows` and `seed`.
+    """
+    centers, cell_weights, (dx, dy) = _cell_centers(seed)
+    days = np.arange(DAYS)
+    weekday = (START_DATE.dayofweek + days) % 7
+    day_weights = ((1 + 0.3 * np.sin(2 * np.pi * days / 365.25))
+                   * WEEKDAY_WEIGHTS[weekday] * (1 - days / (3 * DAYS)))
+    day_weights /= day_weights.sum()
+    hour_weights = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+    for k, start in enumerate(range(0, n_rows, chunk_rows)):
+        rng = np.random.default_rng([seed, k])
+        n = min(chunk_rows, n_rows - start)
+
+        day = rng.choice(DAYS, n, p=day_weights)
+        cell = rng.choice(len(centers), n, p=cell_weights)
+        # Within the middle half of the cell, which the jittered outline
+        # never reaches
+        lon = centers[cell, 0] + rng.uniform(-0.25, 0.25, n) * dx
+        lat = centers[cell, 1] + rng.uniform(-0.25, 0.25, n) * dy
+        missing = rng.random(n) < MISSING_COORDS
+        lon[missing] = np.nan
+        lat[missing] = np.nan
+
+        dates = START_DATE + pd.to_timedelta(day, unit='D')
+        hours = rng.choice(24, n, p=hour_weights)
+        minutes = rng.integers(0, 60, n)
+        # Socrata spells boroughs in capitals
+        borough = cell // GRID_ROWS * len(BOROUGHS) // GRID_COLS
+        yield pd.DataFrame({
+            'collision_id': np.arange(start, start + n, dtype=np.int64) + 1,
+            'crash_date': dates.strftime('%Y-%m-%d'),
+            'crash_time': [f"{h}:{m:02d}" for h, m in zip(hours, minutes)],
+            'borough': np.char.upper(BOROUGHS)[borough],
+            'latitude': lat.round(6),
+            'longitude': lon.round(6),
+            'number_of_persons_injured': rng.poisson(0.28, n),
+            'number_of_persons_killed': (rng.random(n)
+                                         < 0.0013).astype(np.int8),
+        })
+
+
+def api_page(crashes, seed=0):
+    """ `crashes` (a synthetic_crashes chunk) as the Socrata CSV endpoint
+        returns it to the downloader: `:updated_at` and every dataset column,
+        dates as 2022-06-29T00:00:00.000, and sparse street, contributing
+        factor and vehicle type fields.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(crashes)
+
+    def sparse(values, share):
+        picked = np.asarray(values, dtype=object)[
+            rng.integers(0, len(values), n)]
+        picked[rng.random(n) >= share] = None
+        return picked
+
+    located = crashes['latitude'].notna()
+    location = ('(' + crashes['latitude'].astype(str) + ', '
+                + crashes['longitude'].astype(str) + ')')
+    no_counts = np.zeros(n, dtype=np.int64)
+    page = {
+        ':updated_at': '2024-01-01T00:00:00.000',
+        'crash_date': crashes['crash_date'] + 'T00:00:00.000',
+        'crash_time': crashes['crash_time'],
+        'borough': crashes['borough'],
+        'zip_code': rng.integers(10001, 11698, n).astype(str),
+        'latitude': crashes['latitude'],
+        'longitude': crashes['longitude'],
+        'location': location.where(located),
+        'on_street_name': sparse(STREETS, 0.7),
+        'off_street_name': sparse(STREETS, 0.5),
+        'cross_street_name': sparse(STREETS, 0.3),
+        'number_of_persons_injured': crashes['number_of_persons_injured'],
+        'number_of_persons_killed': crashes['number_of_persons_killed'],
+        'number_of_pedestrians_injured': no_counts,
+        'number_of_pedestrians_killed': no_counts,
+        'number_of_cyclist_injured': no_counts,
+        'number_of_cyclist_killed': no_counts,
+        'number_of_motorist_injured': crashes['number_of_persons_injured'],
+        'number_of_motorist_killed': crashes['number_of_persons_killed'],
+    }
+    for i, share in enumerate(FILL_SHARES, start=1):
+        page[f'contributing_factor_vehicle_{i}'] = sparse(FACTORS, share)
+    page['collision_id'] = crashes['collision_id']
+    # The dataset spells the first two without the underscore
+    for i, share in enumerate(FILL_SHARES, start=1):
+        name = f'vehicle_type_code{i}' if i < 3 else f'vehicle_type_code_{i}'
+        page[name] = sparse(VEHICLES, share)
+    return pd.DataFrame(page)
+
+
+def write_synthetic_dataset(root, scale, seed=0, base_rows=BASE_ROWS):
+    """ Lays out a repo-shaped data directory under `root` for `scale` x
+        `base_rows` crashes. Reuses files already written for the same
+        parameters, since generating the large scales takes a while.
+    """
+    root = Path(root)
+    n_rows = int(base_rows * scale)
+    marker = root / 'synthetic.json'
+    params = {'rows': n_rows, 'seed': seed, 'grid': [GRID_COLS, GRID_ROWS],
+              'days': DAYS, 'page_rows': PAGE_ROWS}
+    if marker.exists() and json.loads(marker.read_text()) == params:
+        return n_rows
+
+    for sub in ('data/external', 'data/interim', 'data/processed',
+                'models/forecast_store'):
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    (root / 'data/external/neighborhoods.geojson').write_text(
+        json.dumps(synthetic_neighborhoods(seed)))
+
+    # The same crashes as API pages, for the ingest parsing stage
+    pages_dir = root / 'data/raw/pages'
+    shutil.rmtree(pages_dir, ignore_errors=True)
+    pages_dir.mkdir(parents=True)
+
+    csv_file = root / 'data/interim/crashes.csv'
+    page = 0
+    for k, chunk in enumerate(synthetic_crashes(n_rows, seed)):
+        chunk.to_csv(csv_file, mode='w' if k == 0 else 'a', header=k == 0,
+                     index=False)
+        for start in range(0, len(chunk), PAGE_ROWS):
+            rows = chunk.iloc[start:start + PAGE_ROWS]
+            api_page(rows, seed=[seed, page]).to_csv(
+                pages_dir / f"page-{page:05d}.csv", index=False)
+            page += 1
+
+    marker.write_text(json.dumps(params))
+    return n_rows
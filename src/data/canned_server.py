@@ -0,0 +1,90 @@
+import click
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.data.nyc_motor_vehicle_collisions import download_all_collisions
+
+
+def canned_collisions(n_rows, seed=0):
+    # Small Socrata-shaped frame, enough to exercise paging and parsing
+    rng = np.random.default_rng(seed)
+    days = rng.integers(0, 4500, n_rows)
+    dates = pd.Timestamp('2012-07-01') + pd.to_timedelta(days, unit='D')
+    return pd.DataFrame({
+        ':updated_at': '2024-01-01T00:00:00.000',
+        'crash_date': dates.strftime('%Y-%m-%dT00:00:00.000'),
+        'crash_time': '12:00',
+        'borough': rng.choice(['BROOKLYN', 'QUEENS', 'MANHATTAN', 'BRONX',
+                               'STATEN ISLAND'], n_rows),
+        'latitude': 40.5 + rng.random(n_rows) * 0.4,
+        'longitude': -74.2 + rng.random(n_rows) * 0.5,
+        'number_of_persons_injured': rng.poisson(0.3, n_rows),
+        'number_of_persons_killed': (rng.random(n_rows) < 0.002).astype(int),
+        'collision_id': np.arange(n_rows) + 1,
+    })
+
+
+@contextmanager
+def serve_canned_pages(frame, latency=0.0):
+    """ Local stand-in for the Socrata CSV endpoint. Serves `frame` in
+        `$limit/$offset` pages, sleeping `latency` seconds per request to
+        imitate the network round trip. Yields the endpoint URL.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            offset = int(query.get('$offset', ['0'])[0])
+            limit = int(query.get('$limit', ['1000'])[0])
+            time.sleep(latency)
+            page = frame.iloc[offset:offset + limit]
+            body = page.to_csv(index=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield (f"http://127.0.0.1:{server.server_address[1]}"
+               "/resource/h9gi-nx95.csv")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@click.command()
+@click.option('--rows', type=int, default=400000, show_default=True)
+@click.option('--latency', type=float, default=0.5, show_default=True,
+              help='Seconds per page.')
+@click.option('--max-in-flight', type=int, multiple=True, default=(1, 4, 8),
+              show_default=True)
+def main(rows, latency, max_in_flight):
+    """ Times a full pull against the canned server for each in-flight
+        setting.
+    """
+    frame = canned_collisions(rows)
+    with serve_canned_pages(frame, latency) as url:
+        for n in max_in_flight:
+            with tempfile.TemporaryDirectory() as tmp:
+                start = time.perf_counter()
+                download_all_collisions(store_dir=f"{tmp}/collisions",
+                                        endpoint=url, max_in_flight=n)
+                print(f"max_in_flight={n}: "
+                      f"{time.perf_counter() - start:.2f}s for {rows:,} rows")
+
+
+if __name__ == '__main__':
+    main()
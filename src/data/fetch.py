@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """ Spaces request starts so no more than `max_rps` begin per second,
+        shared across all fetch threads.
+    """
+
+    def __init__(self, max_rps=None):
+        self.interval = 1.0 / max_rps if max_rps else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def make_session(pool_size=8):
+    # One pooled keep-alive session, so pages after the first skip the TLS
+    # handshake
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    token = os.environ.get('SOCRATA_APP_TOKEN')
+    if token:
+        session.headers['X-App-Token'] = token
+    return session
+
+
+def get_with_retry(session, url, params, limiter, retries=4, backoff=1.0,
+                   timeout=120):
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+            if response.status_code not in RETRY_STATUS:
+                response.raise_for_status()
+                return response.text
+            retry_after = response.headers.get('Retry-After')
+            error = requests.HTTPError(f"{response.status_code} from {url}",
+                                       response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            retry_after, error = None, e
+
+        if attempt == retries:
+            raise error
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = backoff * 2 ** attempt
+        time.sleep(delay)
+
+
+def fetch_pages(url, params, page_size, parse, max_in_flight=4, max_rps=None,
+                retries=4, backoff=1.0, session=None):
+    """ Yields parsed `$limit/$offset` pages in offset order while keeping up
+        to `max_in_flight` requests running at once on a pooled session.
+
+        Paging stops at the first page shorter than `page_size`; requests
+        already in flight past that point are discarded.
+    """
+    session = session or make_session(max_in_flight)
+    limiter = RateLimiter(max_rps)
+
+    def fetch(offset):
+        page_params = dict(params,
+                           **{'$limit': page_size, '$offset': offset})
+        return parse(get_with_retry(session, url, page_params, limiter,
+                                    retries, backoff))
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = {}
+        next_offset = 0
+        for _ in range(max_in_flight):
+            in_flight[next_offset] = pool.submit(fetch, next_offset)
+            next_offset += page_size
+
+        offset = 0
+        try:
+            while True:
+                page = in_flight.pop(offset).result()
+                yield page
+                if len(page) < page_size:
+                    break
+                in_flight[next_offset] = pool.submit(fetch, next_offset)
+                next_offset += page_size
+                offset += page_size
+        finally:
+            for future in in_flight.values():
+                future.cancel()
@@ -1,26 +1,188 @@
 # -*- coding: utf-8 -*-
 import click
+import hashlib
+import json
 import logging
+import os
+import re
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
 from pathlib import Path
 from dotenv import find_dotenv, load_dotenv
 
+from src.data.nyc_motor_vehicle_collisions import COLLISION_DTYPES
+from src.instrumentation import stage, stage_rows
+
+CHUNK_SIZE = 500_000
+
+# Raw columns the cleaning reads; the schema is fixed up front, so no column
+# comes back as mixed types and nothing has to be detected per cell
+RAW_COLUMNS = ['collision_id', 'crash_date', 'crash_time', 'borough',
+               'latitude', 'longitude', 'on_street_name', 'off_street_name',
+               'cross_street_name',
+               'number_of_persons_injured', 'number_of_persons_killed',
+               'updated_at']
+# updated_at is passed through so enrichment can skip rows it has already seen
+OUTPUT_COLUMNS = ['collision_id', 'crash_date', 'crash_time', 'borough',
+                  'latitude', 'longitude', 'on_street_name',
+                  'number_of_persons_injured', 'number_of_persons_killed',
+                  'updated_at']
+
+# Spelling fixes applied to street names, in order (case-insensitive), as in
+# notebooks/01_preprocessing.ipynb
+STREET_RULES = [
+    (r'\s+', ' '),
+    (r'\b(BRG|BRDG|BR)\b', 'BRIDGE'),
+    (r'\b(TNL|TUNNEL)\b', 'TUNNEL'),
+]
+
+
+class StreetNames:
+    """ Raw street name -> normalized name, for every name seen so far. Kept
+        in a JSON file between runs, so the regexes only run over names that
+        are new; cleaning time tracks distinct names rather than rows.
+        Changing STREET_RULES discards the saved names.
+    """
+
+    RULES_DIGEST = hashlib.sha1(repr(STREET_RULES).encode()).hexdigest()[:12]
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.names = {}
+        self.added = 0
+        if self.path and self.path.exists():
+            saved = json.loads(self.path.read_text())
+            if saved.get('rules') == self.RULES_DIGEST:
+                self.names = saved['names']
+
+    def _learn(self, raw):
+        normalized = pd.Series(raw, dtype=object)
+        for pattern, replacement in STREET_RULES:
+            normalized = normalized.str.replace(pattern, replacement,
+                                                regex=True,
+                                                flags=re.IGNORECASE)
+        self.names.update(zip(raw, normalized.str.strip()))
+        self.added += len(raw)
+
+    def normalize(self, values):
+        """ Normalized `values` as a Categorical, built from the distinct
+            values and mapped back to the rows by their codes.
+        """
+        codes, uniques = pd.factorize(values)
+        uniques = [str(u) for u in uniques]
+        new = [u for u in uniques if u not in self.names]
+        if new:
+            self._learn(new)
+
+        normalized = pd.Index([self.names[u] for u in uniques], dtype=object)
+        categories = pd.Index(normalized.unique())
+        remap = categories.get_indexer(normalized)
+        row_codes = np.where(codes >= 0,
+                             remap[codes] if len(remap) else codes, -1)
+        return pd.Categorical.from_codes(row_codes, categories=categories)
+
+    def save(self):
+        if self.path is None or not self.added:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'rules': self.RULES_DIGEST,
+                                   'names': self.names}))
+        os.replace(tmp, self.path)
+
+
+def read_raw_chunks(input_path, chunksize=CHUNK_SIZE):
+    """ Raw collisions in chunks, from either the partitioned Parquet store
+        (already typed) or a Socrata CSV export read with the store's dtypes.
+    """
+    if Path(input_path).is_dir():
+        dataset = ds.dataset(input_path, format='parquet', partitioning='hive')
+        for batch in dataset.to_batches(columns=RAW_COLUMNS,
+                                        batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    dtypes = {col: COLLISION_DTYPES[col] for col in RAW_COLUMNS
+              if col not in ('crash_date', 'collision_id')}
+    # Exports carry no updated_at; it is left missing there
+    for chunk in pd.read_csv(input_path, usecols=lambda c: c in RAW_COLUMNS,
+                             dtype=dtypes, chunksize=chunksize):
+        chunk = chunk.reindex(columns=RAW_COLUMNS).astype(
+            {'updated_at': 'string'})
+        # Exports spell dates as 2022-06-29T00:00:00.000
+        chunk['crash_date'] = pd.to_datetime(chunk['crash_date'].str[:10],
+                                             format='%Y-%m-%d')
+        chunk['collision_id'] = chunk['collision_id'].astype('int64')
+        yield chunk
+
+
+def clean_chunk(chunk, streets):
+    # The notebook first keeps crashes it can locate (coordinates, a bridge or
+    # tunnel, an intersection, or an address), then drops every row without
+    # coordinates; only the coordinates decide what survives both
+    located = chunk['latitude'].notna() & chunk['longitude'].notna()
+    chunk = chunk.loc[located, OUTPUT_COLUMNS]
+    chunk = chunk.assign(
+        on_street_name=streets.normalize(chunk['on_street_name']))
+    chunk = chunk.fillna({'number_of_persons_injured': 0,
+                          'number_of_persons_killed': 0})
+    return chunk.astype({
+        'number_of_persons_injured': 'int16',
+        'number_of_persons_killed': 'int8',
+    })
+
+
+@stage('clean_collisions')
+def clean_collisions(input_path: str, output_file: str,
+                     street_cache: str = None, chunksize: int = CHUNK_SIZE):
+    """ Streams the raw collisions through the notebook's cleaning rules and
+        writes the interim crashes table the spatial join reads.
+    """
+    streets = StreetNames(street_cache)
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    # Written beside the target and swapped in, so a failed run leaves the
+    # old table
+    tmp = Path(output_file).with_name('.' + Path(output_file).name + '.tmp')
+
+    # Header first, so an empty input still yields a (header-only) table
+    pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(tmp, index=False)
+    for chunk in read_raw_chunks(input_path, chunksize):
+        stage_rows(rows_in=len(chunk))
+        chunk = clean_chunk(chunk, streets)
+        chunk.to_csv(tmp, mode='a', header=False, index=False,
+                     date_format='%Y-%m-%d')
+        stage_rows(rows_out=len(chunk))
+
+    os.replace(tmp, output_file)
+    streets.save()
+    print(f"Cleaned crashes saved to {output_file} ({streets.added} new "
+          f"street names, {len(streets.names)} known)")
+
 
 @click.command()
 @click.argument('input_filepath', type=click.Path(exists=True))
 @click.argument('output_filepath', type=click.Path())
-def main(input_filepath, output_filepath):
+@click.option('--street-cache', default=None,
+              help='Street name normalization cache (default: '
+                   'street_names.json beside the output).')
+def main(input_filepath, output_filepath, street_cache):
     """ Runs data processing scripts to turn raw data from (../raw) into
-        cleaned data ready to be analyzed (saved in ../processed).
+        cleaned data ready to be analyzed (saved in ../interim).
     """
     logger = logging.getLogger(__name__)
     logger.info('making final data set from raw data')
 
+    street_cache = street_cache or Path(output_filepath).with_name(
+        'street_names.json')
+    clean_collisions(input_filepath, output_filepath, street_cache)
+
 
 if __name__ == '__main__':
     log_fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     logging.basicConfig(level=logging.INFO, format=log_fmt)
 
-    # not used in this stub but often useful for finding various files
+    # not used here but often useful for finding various files
     project_dir = Path(__file__).resolve().parents[2]
 
     # find .env automagically by walking up directories until it's found, then
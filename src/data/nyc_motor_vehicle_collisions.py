@@ -1,42 +1,249 @@
-import requests
+import click
+import json
+import os
+import shutil
 import pandas as pd
 from pathlib import Path
-from datetime import datetime
 import io
 
+from src.data.fetch import fetch_pages
+from src.instrumentation import stage, stage_rows
+
 API_ENDPOINT = "https://data.cityofnewyork.us/resource/h9gi-nx95.csv"
 SAVE_DIR = Path("../../data/raw/")
+STORE_DIR = SAVE_DIR / "collisions"
+WATERMARK_FILE = "_watermark.json"
 CHUNK_SIZE = 50000
+MAX_IN_FLIGHT = 4
+MAX_REQUESTS_PER_SECOND = 4
+
+BOROUGHS = ['BRONX', 'BROOKLYN', 'MANHATTAN', 'QUEENS', 'STATEN ISLAND']
+
+# Fixed up front so every page, and every Parquet file, has the same schema
+# no matter which values happen to be missing from it.
+COLLISION_DTYPES = {
+    'updated_at': 'string',
+    'crash_date': 'datetime64[ns]',
+    'crash_time': 'string',
+    'borough': pd.CategoricalDtype(BOROUGHS),
+    'zip_code': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'location': 'string',
+    'on_street_name': 'string',
+    'off_street_name': 'string',
+    'cross_street_name': 'string',
+    'number_of_persons_injured': 'Int16',
+    'number_of_persons_killed': 'Int8',
+    'number_of_pedestrians_injured': 'Int16',
+    'number_of_pedestrians_killed': 'Int8',
+    'number_of_cyclist_injured': 'Int16',
+    'number_of_cyclist_killed': 'Int8',
+    'number_of_motorist_injured': 'Int16',
+    'number_of_motorist_killed': 'Int8',
+    'contributing_factor_vehicle_1': 'string',
+    'contributing_factor_vehicle_2': 'string',
+    'contributing_factor_vehicle_3': 'string',
+    'contributing_factor_vehicle_4': 'string',
+    'contributing_factor_vehicle_5': 'string',
+    'collision_id': 'int64',
+    'vehicle_type_code1': 'string',
+    'vehicle_type_code2': 'string',
+    'vehicle_type_code_3': 'string',
+    'vehicle_type_code_4': 'string',
+    'vehicle_type_code_5': 'string',
+}
+
+
+def parse_page(text):
+    # Read one API page straight into the fixed store schema
+    csv_dtypes = {col: dtype for col, dtype in COLLISION_DTYPES.items()
+                  if dtype not in ('datetime64[ns]', 'int64')}
+    csv_dtypes[':updated_at'] = 'string'
+    chunk = pd.read_csv(io.StringIO(text), dtype=csv_dtypes,
+                        parse_dates=['crash_date'])
+    chunk = chunk.rename(columns={':updated_at': 'updated_at'})
+    return (chunk.reindex(columns=list(COLLISION_DTYPES))
+            .astype(COLLISION_DTYPES))
+
+
+def partition_dir(store_dir, year, month):
+    return Path(store_dir) / f"year={year}" / f"month={month:02d}"
+
+
+def _partitions(chunk):
+    return chunk.groupby([chunk['crash_date'].dt.year,
+                          chunk['crash_date'].dt.month])
 
 
-def download_all_collisions():
-    SAVE_DIR.mkdir(parents=True, exist_ok=True)
-    today = datetime.today().strftime("%Y-%m-%d")
-    save_path = SAVE_DIR / f"collisions_full_{today}.csv"
+def _pages(endpoint, params, max_in_flight):
+    return fetch_pages(
+        endpoint, params, CHUNK_SIZE, parse_page,
+        max_in_flight=max_in_flight, max_rps=MAX_REQUESTS_PER_SECOND
+    )
 
-    all_chunks = []
+
+@stage('download_all_collisions')
+def download_all_collisions(store_dir=STORE_DIR, endpoint=API_ENDPOINT,
+                            max_in_flight=MAX_IN_FLIGHT):
+    """ Full backfill. Each page is written straight to its year/month
+        partitions as its own Parquet file, so peak memory is bounded by the
+        pages in flight no matter how large the history is. The new store is
+        built next to the old one and swapped in only once the download has
+        finished.
+    """
+    store_dir = Path(store_dir)
+    build_dir = store_dir.with_name(store_dir.name + '.backfill')
+    shutil.rmtree(build_dir, ignore_errors=True)
+    build_dir.mkdir(parents=True)
+
+    watermark = None
     offset = 0
+    params = {
+        "$select": ":updated_at, *",
+        "$order": "collision_id"
+    }
+
+    for chunk in _pages(endpoint, params, max_in_flight):
+        if chunk.empty:
+            break
+
+        for (year, month), rows in _partitions(chunk):
+            path = (partition_dir(build_dir, year, month)
+                    / f"part-{offset:09d}.parquet")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            rows.to_parquet(path, index=False)
+        stage_rows(rows_in=len(chunk), rows_out=len(chunk))
+
+        page_max = chunk['updated_at'].max()
+        watermark = page_max if watermark is None else max(watermark, page_max)
+        offset += CHUNK_SIZE
+        print(f"Downloaded {offset - CHUNK_SIZE + len(chunk)} rows...")
 
-    while True:
-        params = {
-            "$limit": CHUNK_SIZE,
-            "$offset": offset
-        }
-        response = requests.get(API_ENDPOINT, params=params)
-        response.raise_for_status()
+    if watermark is not None:
+        write_watermark(build_dir, watermark)
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(build_dir, store_dir)
+    print(f"Saved full collision dataset: {store_dir}")
 
-        chunk = pd.read_csv(io.StringIO(response.text))
+
+def read_watermark(store_dir):
+    path = Path(store_dir) / WATERMARK_FILE
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())['updated_at']
+
+
+def write_watermark(store_dir, updated_at):
+    path = Path(store_dir) / WATERMARK_FILE
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'updated_at': updated_at}))
+    os.replace(tmp, path)
+
+
+def stored_partitions(store_dir, ids):
+    # Partition directories already holding any of `ids`. The id filter is
+    # checked against each file's row-group statistics first, so only files
+    # whose id range overlaps `ids` are read, and only their id column
+    if not any(Path(store_dir).glob('year=*/month=*/*.parquet')):
+        return set()
+    found = pd.read_parquet(store_dir,
+                            columns=['collision_id', 'year', 'month'],
+                            filters=[('collision_id', 'in', list(ids))])
+    keys = found[['year', 'month']].drop_duplicates()
+    return {partition_dir(store_dir, y, int(m))
+            for y, m in zip(keys['year'], keys['month'])}
+
+
+def merge_into_store(store_dir, chunk):
+    """ Upserts rows into their year/month partition, replacing earlier
+        versions of the same collision_id wherever they are stored; a crash
+        whose date was corrected moves partitions. Only the partitions
+        involved are rewritten, each compacted back into a single file.
+    """
+    targets = {partition_dir(store_dir, year, month): rows
+               for (year, month), rows in _partitions(chunk)}
+    previous = stored_partitions(store_dir, chunk['collision_id'].unique())
+    for part_dir in set(targets) | previous:
+        rows = targets.get(part_dir, chunk.iloc[:0])
+        part_dir.mkdir(parents=True, exist_ok=True)
+        target = part_dir / 'part-0.parquet'
+        # The compacted file first, so its rows win over any left beside it
+        old_files = sorted(part_dir.glob('*.parquet'),
+                           key=lambda f: (f != target, f.name))
+        if old_files:
+            existing = pd.concat([pd.read_parquet(f) for f in old_files],
+                                 ignore_index=True)
+            existing = existing.drop_duplicates('collision_id')
+            replaced = existing['collision_id'].isin(chunk['collision_id'])
+            existing = existing[~replaced]
+            rows = pd.concat([existing, rows], ignore_index=True)
+
+        if not rows.empty:
+            # Dot-prefixed temp files are ignored by Parquet dataset readers.
+            # The compacted file goes in before the old ones go, so a failure
+            # in between leaves duplicates for the next merge to fold, never a
+            # gap
+            tmp = part_dir / '.compact.tmp'
+            rows.sort_values('collision_id').to_parquet(tmp, index=False)
+            os.replace(tmp, target)
+        for f in old_files:
+            if f != target or rows.empty:
+                f.unlink()
+
+
+@stage('download_incremental')
+def download_incremental(store_dir=STORE_DIR, endpoint=API_ENDPOINT,
+                         max_in_flight=MAX_IN_FLIGHT):
+    """ Fetches only rows created or changed since the last run, using the
+        Socrata `:updated_at` system field as the watermark, and merges them
+        into the year/month partitioned Parquet store. Without a watermark
+        this falls back to a full backfill.
+    """
+    watermark = read_watermark(store_dir)
+    if watermark is None:
+        download_all_collisions(store_dir, endpoint, max_in_flight)
+        return
+
+    # Rows sharing the watermark timestamp are fetched again; the merge is
+    # idempotent
+    offset = 0
+    params = {
+        "$select": ":updated_at, *",
+        "$where": f":updated_at >= '{watermark}'",
+        "$order": ":updated_at, collision_id"
+    }
+
+    for chunk in _pages(endpoint, params, max_in_flight):
         if chunk.empty:
             break
 
-        all_chunks.append(chunk)
+        merge_into_store(store_dir, chunk)
+        stage_rows(rows_in=len(chunk), rows_out=len(chunk))
+
+        # Pages arrive in :updated_at order, so an interrupted run resumes
+        # from here
+        write_watermark(store_dir, chunk['updated_at'].max())
         offset += CHUNK_SIZE
-        print(f"Downloaded {offset} rows...")
+        print(f"Merged {offset - CHUNK_SIZE + len(chunk)} new or changed "
+              "rows...")
+
+    print(f"Collision store up to date: {store_dir} "
+          f"(watermark {read_watermark(store_dir)})")
+
 
-    full_data = pd.concat(all_chunks, ignore_index=True)
-    full_data.to_csv(save_path, index=False)
-    print(f"Saved full collision dataset: {save_path}")
+@click.command()
+@click.option('--incremental', is_flag=True,
+              help='Fetch only new or changed rows into the existing store.')
+@click.option('--max-in-flight', type=int, default=MAX_IN_FLIGHT,
+              show_default=True,
+              help='Pages requested concurrently.')
+def main(incremental, max_in_flight):
+    if incremental:
+        download_incremental(max_in_flight=max_in_flight)
+    else:
+        download_all_collisions(max_in_flight=max_in_flight)
 
 
 if __name__ == "__main__":
-    download_all_collisions()
+    main()
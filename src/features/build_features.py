@@ -0,0 +1,227 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+from src.instrumentation import stage, stage_rows
+
+CALENDAR_START = '2012-07-01'
+# Days kept past the last observation, enough for a 365-day forecast made a
+# year from now without rebuilding
+FORWARD_DAYS = 730
+TIMEZONE = 'America/New_York'
+YEAR_DAYS = 365.25
+FOURIER_ORDER = 2
+# Days flagged from each DST change on, covering the week of disrupted sleep
+DST_WINDOW = 7
+
+
+# ─── Feature groups ──────────────────────────────────────────────────────────
+# Each builder maps a DatetimeIndex of days to a DataFrame of columns.
+# Builders are pure functions of the date, so the store can compute any range
+# on its own.
+
+def day_of_week(dates):
+    # Dummies with Monday as the baseline, as in notebook 03
+    dow = dates.dayofweek
+    return pd.DataFrame({f'dow_{d}': (dow == d).astype(np.int8)
+                         for d in range(1, 7)}, index=dates)
+
+
+def holidays(dates):
+    # Federal holidays on their observed days
+    observed = USFederalHolidayCalendar().holidays(dates.min(), dates.max())
+    return pd.DataFrame({'holiday': dates.isin(observed).astype(np.int8)},
+                        index=dates)
+
+
+def dst_transitions(dates):
+    # Local UTC offset at noon; it changes on the day of each transition.
+    # Looks back DST_WINDOW days so a range starting mid-window is flagged the
+    # same
+    days = pd.date_range(dates.min() - pd.Timedelta(days=DST_WINDOW),
+                         dates.max(), freq='D')
+    noon = (days + pd.Timedelta(hours=12)).tz_localize(TIMEZONE)
+    offset = pd.Series(noon.tz_localize(None)
+                       - noon.tz_convert('UTC').tz_localize(None), index=days)
+    change = offset.diff().dt.total_seconds().fillna(0)
+    flags = pd.DataFrame({
+        'dst_spring': (change > 0).astype(np.int8),
+        'dst_fall': (change < 0).astype(np.int8),
+    }).rolling(DST_WINDOW, min_periods=1).max().astype(np.int8)
+    return flags.reindex(dates)
+
+
+def fourier_year(dates):
+    # Yearly sine/cosine pairs on absolute time, so any slice lines up with
+    # the rest
+    t = (dates - pd.Timestamp(0)).days.to_numpy() / YEAR_DAYS
+    columns = {}
+    for k in range(1, FOURIER_ORDER + 1):
+        columns[f'year_sin_{k}'] = np.sin(2 * np.pi * k * t).astype(np.float32)
+        columns[f'year_cos_{k}'] = np.cos(2 * np.pi * k * t).astype(np.float32)
+    return pd.DataFrame(columns, index=dates)
+
+
+# New groups are added here; building the store computes just the new ones
+FEATURE_GROUPS = {
+    'dow': day_of_week,
+    'holiday': holidays,
+    'dst': dst_transitions,
+    'fourier_year': fourier_year,
+}
+# Groups the city and neighborhood models regress on
+MODEL_EXOG = ['dow', 'holiday', 'dst', 'fourier_year']
+
+
+def model_exog(seasonal_order, groups=MODEL_EXOG):
+    # A weekly seasonal difference leaves the day-of-week dummies unidentified
+    # (their effect is absorbed by the seasonal states), so those models go
+    # without
+    D, s = seasonal_order[1], seasonal_order[3]
+    return [g for g in groups if not (g == 'dow' and D > 0 and s == 7)]
+
+
+def _builder_digest(builder):
+    # A group is recomputed when its builder's code changes
+    return hashlib.sha1(inspect.getsource(builder).encode()).hexdigest()[:12]
+
+
+def exog_digest(groups=MODEL_EXOG):
+    # Names checkpoint directories of fits that used these groups, so changed
+    # features never reuse fits made with the old ones
+    key = json.dumps([[g, _builder_digest(FEATURE_GROUPS[g])] for g in groups])
+    return 'exog-' + hashlib.sha1(key.encode()).hexdigest()[:8]
+
+
+def _save_array(path, values):
+    tmp = path.with_name('.' + path.name)
+    with open(tmp, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp, path)
+
+
+@stage('build_calendar_features')
+def build_calendar_features(output_dir: str, end, start=CALENDAR_START,
+                            groups=FEATURE_GROUPS):
+    """ Makes sure the calendar feature store under `output_dir` covers every
+        day from `start` to `end`. Each group is one (days x columns) .npy,
+        row-aligned to the store's start date. Existing groups are only
+        extended by the days they lack; new or changed groups are computed
+        over the whole range. A no-op when the store is already complete.
+    """
+    output_dir = Path(output_dir)
+    index_file = output_dir / 'index.json'
+    index = {'start': None, 'days': 0, 'groups': {}}
+    if index_file.exists():
+        index = json.loads(index_file.read_text())
+
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if index['start'] is not None and pd.Timestamp(index['start']) <= start:
+        start = pd.Timestamp(index['start'])
+    else:
+        # Nothing stored, or it starts too late: every group from scratch
+        index = {'start': None, 'days': 0, 'groups': {}}
+    stored_days = index['days']
+    days = max((end - start).days + 1, stored_days)
+    dates = pd.date_range(start, periods=days, freq='D')
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for name, builder in groups.items():
+        digest = _builder_digest(builder)
+        entry = index['groups'].get(name)
+        if (entry and entry['digest'] == digest
+                and (output_dir / entry['file']).exists()):
+            if stored_days == days:
+                continue
+            # Rows past the index's day count are from a run that never
+            # committed its index
+            tail = builder(dates[stored_days:])
+            stored = np.load(output_dir / entry['file'])[:stored_days]
+            values = np.concatenate([stored, tail.to_numpy()])
+            written += len(tail)
+        else:
+            frame = builder(dates)
+            entry = {'file': f'{name}.npy', 'columns': list(frame.columns),
+                     'digest': digest}
+            values = frame.to_numpy()
+            written += len(frame)
+        _save_array(output_dir / entry['file'], values)
+        index['groups'][name] = entry
+
+    index.update(start=str(start.date()), days=days)
+    stage_rows(rows_out=written)
+    # The index goes last, so readers never see it ahead of its arrays
+    tmp = index_file.with_name('.index.json')
+    tmp.write_text(json.dumps(index, indent=1))
+    os.replace(tmp, index_file)
+
+
+class CalendarFeatures:
+    """ Read side of the calendar feature store: memory-mapped group arrays,
+        looked up by day offset from the store's start date.
+    """
+
+    def __init__(self, start, days, arrays, columns):
+        self.start = pd.Timestamp(start)
+        self.days = days
+        self.arrays = arrays
+        self.columns = columns
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        index = json.loads((path / 'index.json').read_text())
+        arrays = {name: np.load(path / g['file'], mmap_mode='r')
+                  for name, g in index['groups'].items()}
+        columns = {name: g['columns'] for name, g in index['groups'].items()}
+        return cls(index['start'], index['days'], arrays, columns)
+
+    def column_names(self, groups=MODEL_EXOG):
+        return [c for g in groups for c in self.columns[g]]
+
+    def frame(self, dates, groups=MODEL_EXOG):
+        """ Exog for `dates` (float64, one row per date, indexed by date) from
+            the given groups, ready to pass to SARIMAX.
+        """
+        dates = pd.DatetimeIndex(dates)
+        rows = (dates - self.start).days.to_numpy()
+        if len(rows) and (rows.min() < 0 or rows.max() >= self.days):
+            raise ValueError(f"calendar features cover {self.start.date()} "
+                             f"+ {self.days} days, not {dates.min().date()} "
+                             f"to {dates.max().date()}; rerun "
+                             "build_calendar_features")
+        values = np.hstack([self.arrays[g][rows]
+                            for g in groups]).astype(np.float64)
+        return pd.DataFrame(values, index=dates,
+                            columns=self.column_names(groups))
+
+
+@functools.lru_cache(maxsize=4)
+def _load_calendar(path, version):
+    return CalendarFeatures.load(path)
+
+
+def load_calendar(path):
+    # Once per process (and per store version), so every fit in a worker
+    # shares the same mapped arrays
+    version = (Path(path) / 'index.json').stat().st_mtime_ns
+    return _load_calendar(str(path), version)
+
+
+def forecast_dates(last_obs, steps):
+    return pd.date_range(pd.Timestamp(last_obs) + pd.Timedelta(days=1),
+                         periods=steps, freq='D')
+
+
+if __name__ == "__main__":
+    build_calendar_features(
+        output_dir='../../data/processed/calendar_features',
+        end=pd.Timestamp.today().normalize() + pd.Timedelta(days=FORWARD_DAYS)
+    )
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+
+import shapely
+from shapely.geometry import mapping, shape
+
+from src.instrumentation import stage, stage_rows
+
+# Simplification tolerance in degrees per map zoom; about one screen pixel at
+# NYC's latitude, so the simplified outlines look the same as the originals
+LEVELS = {'z9': 0.001, 'z12': 0.0002, 'z14': 0.00005}
+# ~1 m; more digits only add payload
+COORD_DIGITS = 5
+
+
+def _round_coords(coords):
+    if isinstance(coords[0], (list, tuple)):
+        return [_round_coords(c) for c in coords]
+    return [round(x, COORD_DIGITS) for x in coords]
+
+
+def _feature(name, polygon):
+    # Only the name the map joins on is kept as a property
+    geometry = mapping(polygon)
+    return {'type': 'Feature', 'properties': {'NTAName': name},
+            'geometry': {'type': geometry['type'],
+                         'coordinates': _round_coords(
+                             geometry['coordinates'])}}
+
+
+def simplify_coverage(polygons, tolerance):
+    # coverage_simplify moves shared edges together, so neighbors keep meeting
+    # without gaps or overlaps
+    return list(shapely.coverage_simplify(polygons, tolerance))
+
+
+@stage('build_neighborhood_geometry')
+def build_neighborhood_geometry(geojson_file: str, output_dir: str,
+                                levels=LEVELS):
+    with open(geojson_file) as f:
+        features = json.load(f)['features']
+    names = [feat['properties']['NTAName'] for feat in features]
+    polygons = [shape(feat['geometry']) for feat in features]
+    stage_rows(rows_in=len(polygons))
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # One compact FeatureCollection per zoom level
+    for level, tolerance in levels.items():
+        simplified = simplify_coverage(polygons, tolerance)
+        collection = {'type': 'FeatureCollection',
+                      'features': [_feature(name, poly) for name, poly
+                                   in zip(names, simplified)]}
+        (output_dir / f"{level}.geojson").write_text(
+            json.dumps(collection, separators=(',', ':')))
+
+    # Bounding box and centroid per NTA, from the full-resolution polygons
+    index = {}
+    for name, poly in zip(names, polygons):
+        west, south, east, north = poly.bounds
+        centroid = poly.centroid
+        index[name] = {'west': west, 'south': south, 'east': east,
+                       'north': north, 'lon': centroid.x, 'lat': centroid.y}
+    stage_rows(rows_out=len(index))
+    (output_dir / 'index.json').write_text(
+        json.dumps(index, separators=(',', ':')))
+
+
+if __name__ == "__main__":
+    build_neighborhood_geometry(
+        geojson_file='../../data/external/neighborhoods.geojson',
+        output_dir='../../data/processed/neighborhood_geometry'
+    )
@@ -1,37 +1,140 @@
+import json
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
 from pathlib import Path
 
-def build_timeseries_features(input_file: str, output_dir: str):
-    # Load processed crashes
-    crashes = pd.read_csv(input_file, parse_dates=['crash_date'])
-
-    # Aggregate citywide daily crash counts
-    daily_city = (
-        crashes
-        .groupby('crash_date')
-        .size()
-        .reset_index(name='total_crashes')
-        .sort_values('crash_date')
-    )
+from src.instrumentation import stage, stage_rows
+
+CUBE_MEASURES = ['crashes', 'injured', 'killed']
+MEASURE_COLUMNS = ['total_crashes', 'total_injured', 'total_killed']
+CHUNK_SIZE = 500_000
+
+# rollup name -> grouping keys
+ROLLUPS = {
+    'city': ['crash_date'],
+    'neighborhood': ['crash_date', 'neighborhood'],
+    'borough': ['crash_date', 'borough'],
+    'hour_of_week': ['hour_of_week'],
+}
+
+
+def load_borough_lookup(geojson_file):
+    # NTA name -> borough, taken from the same polygons used for the spatial
+    # join
+    with open(geojson_file) as f:
+        features = json.load(f)['features']
+    return {feat['properties']['NTAName']: feat['properties']['BoroName']
+            for feat in features}
+
+
+def read_chunks(input_path, columns, chunksize=CHUNK_SIZE):
+    # Processed crashes are either a partitioned Parquet store or a flat CSV
+    if Path(input_path).is_dir():
+        dataset = ds.dataset(input_path, format='parquet', partitioning='hive')
+        for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(input_path, usecols=columns,
+                               chunksize=chunksize)
+
+
+def _prepare_chunk(chunk, borough_lookup):
+    crash_date = pd.to_datetime(chunk['crash_date'])
+    hour = pd.to_numeric(chunk['crash_time'].str.split(':').str[0],
+                         errors='coerce').fillna(0)
+    return pd.DataFrame({
+        'crash_date': crash_date,
+        'neighborhood': chunk['neighborhood'],
+        'borough': chunk['neighborhood'].map(borough_lookup),
+        'hour_of_week': crash_date.dt.dayofweek * 24 + hour.astype('int64'),
+        'total_crashes': 1,
+        'total_injured': chunk['number_of_persons_injured'].fillna(0),
+        'total_killed': chunk['number_of_persons_killed'].fillna(0),
+    })
+
+
+def aggregate_rollups(chunks, borough_lookup):
+    """ One pass over the crash rows, emitting every rollup in ROLLUPS with
+        crash, injured and killed totals. Only the running aggregates and the
+        current chunk are held in memory.
+    """
+    totals = dict.fromkeys(ROLLUPS)
+    for chunk in chunks:
+        stage_rows(rows_in=len(chunk))
+        frame = _prepare_chunk(chunk, borough_lookup)
+        for name, keys in ROLLUPS.items():
+            partial = frame.groupby(keys)[MEASURE_COLUMNS].sum()
+            if totals[name] is None:
+                totals[name] = partial
+            else:
+                totals[name] = totals[name].add(partial, fill_value=0)
 
-    # Aggregate daily crash counts per neighborhood
-    daily_neighborhood = (
-        crashes
-        .groupby(['crash_date', 'neighborhood'])
-        .size()
-        .reset_index(name='total_crashes')
-        .sort_values(['neighborhood', 'crash_date'])
+    return {
+        name: (agg.astype('int64').reset_index()
+               .sort_values(ROLLUPS[name][::-1]))
+        for name, agg in totals.items() if agg is not None
+    }
+
+
+def build_daily_cube(daily_neighborhood):
+    # Dense (date x neighborhood x measure) counts over the full calendar range
+    dates = pd.date_range(daily_neighborhood['crash_date'].min(),
+                          daily_neighborhood['crash_date'].max(), freq='D')
+    neighborhoods = np.sort(daily_neighborhood['neighborhood'].unique())
+
+    date_idx = (daily_neighborhood['crash_date']
+                - dates[0]).dt.days.to_numpy()
+    nbhd_idx = np.searchsorted(neighborhoods,
+                               daily_neighborhood['neighborhood'].to_numpy())
+
+    values = np.zeros((len(dates), len(neighborhoods), len(CUBE_MEASURES)),
+                      dtype=np.int32)
+    values[date_idx, nbhd_idx] = daily_neighborhood[MEASURE_COLUMNS].to_numpy()
+
+    return (dates.values.astype('datetime64[D]'), neighborhoods.astype(str),
+            values)
+
+
+@stage('build_timeseries_features')
+def build_timeseries_features(input_file: str, output_dir: str,
+                              geojson_file: str, chunksize: int = CHUNK_SIZE):
+    # Stream processed crashes in chunks, aggregating everything in one pass
+    chunks = read_chunks(
+        input_file,
+        columns=['crash_date', 'crash_time', 'neighborhood',
+                 'number_of_persons_injured', 'number_of_persons_killed'],
+        chunksize=chunksize
     )
+    rollups = aggregate_rollups(chunks, load_borough_lookup(geojson_file))
+    stage_rows(rows_out=sum(len(rollup) for rollup in rollups.values()))
+
+    # Daily crashes/injured/killed cube read by the dashboard
+    dates, neighborhoods, values = build_daily_cube(rollups['neighborhood'])
 
     # Ensure output directory exists
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     # Save
-    daily_city.to_parquet(Path(output_dir) / 'daily_city_crashes.parquet', index=False)
-    daily_neighborhood.to_parquet(Path(output_dir) / 'daily_neighborhood_crashes.parquet', index=False)
+    output_dir = Path(output_dir)
+    rollups['city'].to_parquet(output_dir / 'daily_city_crashes.parquet',
+                               index=False)
+    rollups['neighborhood'].to_parquet(
+        output_dir / 'daily_neighborhood_crashes.parquet', index=False)
+    rollups['borough'].to_parquet(
+        output_dir / 'daily_borough_crashes.parquet', index=False)
+    rollups['hour_of_week'].to_parquet(
+        output_dir / 'hour_of_week_crashes.parquet', index=False)
+    np.savez(
+        output_dir / 'daily_neighborhood_cube.npz',
+        dates=dates, neighborhoods=neighborhoods, values=values,
+        measures=np.array(CUBE_MEASURES)
+    )
+
 
 if __name__ == "__main__":
     build_timeseries_features(
-        input_file='../../data/processed/crashes.csv',
-        output_dir='../../data/processed'
+        input_file='../../data/processed/crashes',
+        output_dir='../../data/processed',
+        geojson_file='../../data/external/neighborhoods.geojson'
     )
@@ -1,27 +1,225 @@
+import click
+import shutil
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
+from datetime import datetime
+from pathlib import Path
 
-crashes = pd.read_csv('../../../data/interim/crashes.csv')
-neighborhoods = gpd.read_file('../../../data/external/neighborhoods.geojson')
+from src.data.nyc_motor_vehicle_collisions import (read_watermark,
+                                                   write_watermark)
+from src.features.nyc_motor_vehicle_collisions.neighborhood_index import (
+    NeighborhoodIndex)
+from src.instrumentation import stage, stage_rows
 
-crashes_gdf = gpd.GeoDataFrame(
-    crashes,
-    geometry=gpd.points_from_xy(crashes.longitude, crashes.latitude),
-    crs='EPSG:4326'
-)
+CHUNK_SIZE = 500_000
 
-crashes_with_neighborhood = gpd.sjoin(
-    crashes_gdf, neighborhoods[['NTAName', 'geometry']],
-    how='left',
-    predicate='within'
-)
+# Fixed schema so every appended partition file lines up with the others
+PROCESSED_DTYPES = {
+    'collision_id': 'int64',
+    'crash_date': 'datetime64[ns]',
+    'crash_time': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'number_of_persons_injured': 'int16',
+    'number_of_persons_killed': 'int8',
+    'neighborhood': 'string',
+    'row_hash': 'uint64',
+}
+# Input columns a crash is enriched from; a change to any of them redoes it
+SOURCE_COLUMNS = [c for c in PROCESSED_DTYPES
+                  if c not in ('neighborhood', 'row_hash')]
+# Crashes no neighborhood matched, kept so they are not retried every run.
+# Underscore-prefixed files are ignored by Parquet dataset readers
+UNMATCHED_FILE = '_unmatched.parquet'
 
-# Drop crashes with no matched neighborhood
-crashes_with_neighborhood = crashes_with_neighborhood.dropna(subset=['NTAName'])
 
-# Drop spatial columns and rename
-crashes_with_neighborhood = crashes_with_neighborhood.drop(columns=['geometry', 'index_right'])
-crashes_with_neighborhood = crashes_with_neighborhood.rename(columns={'NTAName': 'neighborhood'})
+def _read_unmatched(output_dir):
+    path = Path(output_dir) / UNMATCHED_FILE
+    if path.exists():
+        return pd.read_parquet(path)
+    return pd.DataFrame({'collision_id': pd.Series(dtype='int64'),
+                         'row_hash': pd.Series(dtype='uint64')})
 
-crashes_with_neighborhood.to_csv('../../data/processed/crashes.csv', index=False)
+
+def _write_unmatched(output_dir, unmatched, redone):
+    # Revised crashes drop their old entries; the new ones are in `unmatched`
+    previous = _read_unmatched(output_dir)
+    if redone:
+        previous = previous[~previous['collision_id'].isin(pd.concat(redone))]
+    unmatched = pd.concat([previous] + unmatched, ignore_index=True)
+    tmp = Path(output_dir) / f".{UNMATCHED_FILE}.tmp"
+    unmatched.to_parquet(tmp, index=False)
+    tmp.replace(Path(output_dir) / UNMATCHED_FILE)
+
+
+def enriched_rows(output_dir, ids):
+    """ collision_id, row_hash and partition directory of the crashes among
+        `ids` already handled: stored rows, plus unmatched ones (partition
+        None) from the sidecar. The id filter is checked against each file's
+        row-group statistics first, so only files whose id range overlaps
+        `ids` are read.
+    """
+    output_dir = Path(output_dir)
+    ids = list(ids)
+    unmatched = _read_unmatched(output_dir)
+    frames = [unmatched[unmatched['collision_id'].isin(ids)]
+              .assign(partition=None)]
+    if any(output_dir.glob('year=*/month=*/*.parquet')):
+        stored = pd.read_parquet(output_dir,
+                                 columns=['collision_id', 'row_hash', 'year',
+                                          'month'],
+                                 filters=[('collision_id', 'in', ids)])
+        # One directory name per partition, joined back onto its rows
+        keys = stored[['year', 'month']].drop_duplicates()
+        keys['partition'] = [f"year={y}/month={int(m):02d}"
+                             for y, m in zip(keys['year'], keys['month'])]
+        stored = stored.merge(keys, on=['year', 'month'])
+        frames.append(stored[['collision_id', 'row_hash', 'partition']])
+    return pd.concat(frames, ignore_index=True)
+
+
+def row_hashes(crashes):
+    # Content hash of the typed source columns, so an upstream revision of a
+    # crash (moved coordinates, corrected counts) gets it enriched again
+    return pd.util.hash_pandas_object(crashes[SOURCE_COLUMNS],
+                                      index=False).to_numpy()
+
+
+def _updated_since(crashes, watermark):
+    # Rows sharing the watermark are checked again; rows without an
+    # updated_at (CSV exports) always are. Also returns the newest stamp
+    if 'updated_at' not in crashes:
+        return crashes, None
+    stamps = crashes['updated_at']
+    if watermark is not None:
+        crashes = crashes[(stamps >= watermark).fillna(True).astype(bool)]
+    return crashes, stamps.max()
+
+
+def _drop_rows(output_dir, stale):
+    """ Removes revised crashes from the partitions their old versions are in.
+        `stale` maps collision_id -> partition directory.
+    """
+    for partition, ids in stale.groupby(stale):
+        for path in (Path(output_dir) / partition).glob('*.parquet'):
+            rows = pd.read_parquet(path)
+            keep = ~rows['collision_id'].isin(ids.index)
+            if keep.all():
+                continue
+            if keep.any():
+                tmp = path.with_name(f".{path.name}.tmp")
+                rows[keep].to_parquet(tmp, index=False)
+                tmp.replace(path)
+            else:
+                path.unlink()
+
+
+def _append_partitions(output_dir, crashes, part_name):
+    dates = crashes['crash_date'].dt
+    for (year, month), rows in crashes.groupby([dates.year, dates.month]):
+        part_dir = Path(output_dir) / f"year={year}" / f"month={month:02d}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        # Dot-prefixed temp files are ignored by Parquet dataset readers
+        tmp = part_dir / f".{part_name}.tmp"
+        rows.to_parquet(tmp, index=False)
+        tmp.replace(part_dir / f"{part_name}.parquet")
+
+
+@stage('create_crashes')
+def create_crashes(input_file: str, output_dir: str, geojson_file: str,
+                   index_cache: str, chunksize: int = CHUNK_SIZE,
+                   full: bool = False):
+    """ Assigns neighborhoods to cleaned crashes and appends them to the
+        year/month partitioned processed store. Only rows updated since the
+        last run (by their updated_at watermark) are hashed, and of those only
+        crashes that are new, or whose contents changed since they were
+        enriched, are processed, so a daily refresh touches just those rows;
+        crashes outside every neighborhood are remembered too. With `full`,
+        the store is rebuilt from scratch and swapped in at the end.
+    """
+    index = NeighborhoodIndex.from_geojson(geojson_file, index_cache)
+
+    target_dir = Path(output_dir)
+    if full:
+        target_dir = target_dir.with_name(target_dir.name + '.rebuild')
+        shutil.rmtree(target_dir, ignore_errors=True)
+    watermark = read_watermark(target_dir)
+    latest = watermark
+
+    run_id = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    added = 0
+    redone = []
+    unmatched = []
+
+    # Chunked so the join works on data larger than memory
+    reader = pd.read_csv(input_file, chunksize=chunksize,
+                         dtype={'updated_at': 'string'})
+    for i, crashes in enumerate(reader):
+        stage_rows(rows_in=len(crashes))
+        crashes, newest = _updated_since(crashes, watermark)
+        if pd.notna(newest) and (latest is None or newest > latest):
+            latest = newest
+        if crashes.empty:
+            continue
+
+        crashes = crashes[SOURCE_COLUMNS].fillna({
+            'number_of_persons_injured': 0,
+            'number_of_persons_killed': 0,
+        }).astype({c: PROCESSED_DTYPES[c] for c in SOURCE_COLUMNS})
+        crashes['row_hash'] = row_hashes(crashes)
+        seen = enriched_rows(target_dir, crashes['collision_id'])
+        keys = pd.MultiIndex.from_frame(crashes[['collision_id', 'row_hash']])
+        seen_keys = pd.MultiIndex.from_frame(seen[['collision_id',
+                                                   'row_hash']])
+        crashes = crashes[~keys.isin(seen_keys)]
+        if crashes.empty:
+            continue
+
+        # Revised crashes leave their old rows behind before the new ones go in
+        redone.append(crashes['collision_id'])
+        stale = (seen.dropna(subset=['partition'])
+                 .set_index('collision_id')['partition'])
+        _drop_rows(target_dir,
+                   stale[stale.index.isin(crashes['collision_id'])])
+
+        neighborhoods = index.assign(crashes['longitude'],
+                                     crashes['latitude'])
+        crashes = crashes.assign(neighborhood=neighborhoods.values)
+
+        # Crashes with no matched neighborhood are only recorded
+        matched = crashes['neighborhood'].notna()
+        unmatched.append(crashes.loc[~matched, ['collision_id', 'row_hash']])
+        crashes = crashes[matched].astype(PROCESSED_DTYPES)
+        crashes = crashes[list(PROCESSED_DTYPES)]
+
+        _append_partitions(target_dir, crashes, f"part-{run_id}-{i:05d}")
+        added += len(crashes)
+        stage_rows(rows_out=len(crashes))
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+    if redone or full:
+        _write_unmatched(target_dir, unmatched, redone)
+    # Advanced only once everything up to it is stored
+    if latest is not None and latest != watermark:
+        write_watermark(target_dir, latest)
+
+    if full:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        target_dir.replace(output_dir)
+    print(f"Added {added} crashes to {output_dir}")
+
+
+@click.command()
+@click.option('--full', is_flag=True,
+              help='Rebuild the processed store from scratch.')
+def main(full):
+    create_crashes(
+        input_file='../../../data/interim/crashes.csv',
+        output_dir='../../../data/processed/crashes',
+        geojson_file='../../../data/external/neighborhoods.geojson',
+        index_cache='../../../data/interim/neighborhood_index.npz',
+        full=full
+    )
+
+
+if __name__ == "__main__":
+    main()
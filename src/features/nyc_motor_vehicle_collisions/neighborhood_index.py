@@ -0,0 +1,208 @@
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+GRID_SIZE = 1024
+MEMO_LIMIT = 5_000_000
+# Coordinates are memoized at 1e-6 degree (~0.1 m) resolution
+COORD_SCALE = 1_000_000
+# Caps the (points x edges) matrix built per polygon test
+MAX_PAIR_ELEMENTS = 4_000_000
+
+
+def _file_hash(path):
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+class NeighborhoodIndex:
+    """ Grid-bucketed point-in-polygon index over the NTA polygons.
+
+        Grid cells that lie entirely inside one neighborhood answer directly;
+        only points in boundary cells are tested, with a vectorized even-odd
+        ray cast against the candidate polygons' edges. Works on plain lon/lat
+        arrays, so no per-row geometry objects are created.
+    """
+
+    def __init__(self, names, edge_ptr, edges, bounds, cell_owner, cand_ptr,
+                 cand_idx, source_hash):
+        self.names = np.asarray(names, dtype=str)
+        self.edge_ptr = edge_ptr
+        self.edges = edges
+        self.bounds = bounds
+        self.cell_owner = cell_owner
+        self.cand_ptr = cand_ptr
+        self.cand_idx = cand_idx
+        self.source_hash = source_hash
+        self.grid_size = cell_owner.shape[0]
+        self._memo = pd.Series(dtype='int32')
+
+    # ─── Building / persistence ──────────────────────────────────────────────
+
+    @classmethod
+    def build(cls, geojson_file, grid_size=GRID_SIZE):
+        with open(geojson_file) as f:
+            features = json.load(f)['features']
+        names = [feat['properties']['NTAName'] for feat in features]
+        polygons = [shape(feat['geometry']) for feat in features]
+
+        # Every ring edge of every polygon part, stored per neighborhood
+        edge_blocks = []
+        for poly in polygons:
+            parts = poly.geoms if poly.geom_type == 'MultiPolygon' else [poly]
+            rings = [np.asarray(r.coords)
+                     for p in parts for r in [p.exterior, *p.interiors]]
+            edge_blocks.append(np.vstack([np.hstack([r[:-1], r[1:]])
+                                          for r in rings]))
+        edge_ptr = np.cumsum([0] + [len(b) for b in edge_blocks])
+        edges = np.vstack(edge_blocks)
+
+        minx, miny, maxx, maxy = shapely.total_bounds(polygons)
+        bounds = np.array([minx, miny, maxx, maxy])
+        xs = np.linspace(minx, maxx, grid_size + 1)
+        ys = np.linspace(miny, maxy, grid_size + 1)
+        gx, gy = np.meshgrid(np.arange(grid_size), np.arange(grid_size),
+                             indexing='ij')
+        gx, gy = gx.ravel(), gy.ravel()
+        boxes = shapely.box(xs[gx], ys[gy], xs[gx + 1], ys[gy + 1])
+
+        tree = shapely.STRtree(boxes)
+        poly_hit, cell_hit = tree.query(polygons, predicate='intersects')
+        poly_in, cell_in = tree.query(polygons, predicate='contains_properly')
+
+        n_cells = grid_size * grid_size
+        cell_owner = np.full(n_cells, -1, dtype=np.int32)
+        cell_owner[cell_in] = poly_in
+
+        # Candidate polygons for the cells that straddle a boundary
+        boundary = cell_owner[cell_hit] < 0
+        cell_hit, poly_hit = cell_hit[boundary], poly_hit[boundary]
+        order = np.argsort(cell_hit, kind='stable')
+        cell_hit, poly_hit = cell_hit[order], poly_hit[order]
+        cand_ptr = np.zeros(n_cells + 1, dtype=np.int64)
+        np.add.at(cand_ptr, cell_hit + 1, 1)
+        cand_ptr = np.cumsum(cand_ptr)
+
+        return cls(names, edge_ptr, edges, bounds,
+                   cell_owner.reshape(grid_size, grid_size), cand_ptr,
+                   poly_hit.astype(np.int32), _file_hash(geojson_file))
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path, names=self.names, edge_ptr=self.edge_ptr, edges=self.edges,
+            bounds=self.bounds, cell_owner=self.cell_owner,
+            cand_ptr=self.cand_ptr, cand_idx=self.cand_idx,
+            source_hash=np.array(self.source_hash)
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz['names'], npz['edge_ptr'], npz['edges'],
+                       npz['bounds'], npz['cell_owner'], npz['cand_ptr'],
+                       npz['cand_idx'], str(npz['source_hash']))
+
+    @classmethod
+    def from_geojson(cls, geojson_file, cache_file):
+        # Reuse the cached index unless the polygons have changed since it
+        # was built
+        if Path(cache_file).exists():
+            index = cls.load(cache_file)
+            if index.source_hash == _file_hash(geojson_file):
+                return index
+        index = cls.build(geojson_file)
+        index.save(cache_file)
+        return index
+
+    # ─── Classification ──────────────────────────────────────────────────────
+
+    def _inside(self, poly, lon, lat):
+        # Even-odd rule over all rings (holes and multipolygon parts included)
+        e = self.edges[self.edge_ptr[poly]:self.edge_ptr[poly + 1]]
+        x1, y1, x2, y2 = e[:, 0], e[:, 1], e[:, 2], e[:, 3]
+        step = max(1, MAX_PAIR_ELEMENTS // len(e))
+        result = np.empty(len(lon), dtype=bool)
+        for s in range(0, len(lon), step):
+            px, py = lon[s:s + step, None], lat[s:s + step, None]
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crossings = np.count_nonzero(straddles & (px < x_cross), axis=1)
+            result[s:s + step] = crossings % 2 == 1
+        return result
+
+    def _classify(self, lon, lat):
+        minx, miny, maxx, maxy = self.bounds
+        out = np.full(len(lon), -1, dtype=np.int32)
+        valid = (lon >= minx) & (lon < maxx) & (lat >= miny) & (lat < maxy)
+        idx = np.flatnonzero(valid)
+        if not len(idx):
+            return out
+
+        gx = ((lon[idx] - minx) / (maxx - minx)
+              * self.grid_size).astype(np.int64)
+        gy = ((lat[idx] - miny) / (maxy - miny)
+              * self.grid_size).astype(np.int64)
+        owner = self.cell_owner[gx, gy]
+        out[idx] = owner
+
+        # Points in boundary cells: expand to (point, candidate polygon)
+        # pairs
+        pending = owner < 0
+        pts, cells = idx[pending], (gx * self.grid_size + gy)[pending]
+        counts = self.cand_ptr[cells + 1] - self.cand_ptr[cells]
+        pair_pt = np.repeat(pts, counts)
+        starts = np.repeat(self.cand_ptr[cells] - np.cumsum(counts) + counts,
+                           counts)
+        pair_poly = self.cand_idx[starts + np.arange(len(pair_pt))]
+
+        for poly in np.unique(pair_poly):
+            sel = pair_pt[pair_poly == poly]
+            sel = sel[out[sel] < 0]
+            if len(sel):
+                out[sel[self._inside(poly, lon[sel], lat[sel])]] = poly
+        return out
+
+    def lookup(self, lon, lat):
+        """ Neighborhood index for each lon/lat pair, -1 where none contains
+            it.
+
+            Coordinates are deduplicated before classification, and results
+            are memoized across calls, since many crashes share an
+            intersection.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        out = np.full(len(lon), -1, dtype=np.int32)
+        ok = np.isfinite(lon) & np.isfinite(lat)
+
+        lon_key = np.round((lon[ok] + 180) * COORD_SCALE).astype(np.int64)
+        lat_key = np.round((lat[ok] + 90) * COORD_SCALE).astype(np.int64)
+        keys = (lon_key << 32) | lat_key
+        uniq, inverse = np.unique(keys, return_inverse=True)
+
+        cached = self._memo.reindex(uniq).to_numpy(dtype=np.float64, copy=True)
+        miss = np.isnan(cached)
+        if miss.any():
+            mlon = (uniq[miss] >> 32) / COORD_SCALE - 180
+            mlat = (uniq[miss] & 0xFFFFFFFF) / COORD_SCALE - 90
+            cached[miss] = self._classify(mlon, mlat)
+            if len(self._memo) > MEMO_LIMIT:
+                self._memo = self._memo.iloc[:0]
+            fresh = pd.Series(cached[miss], index=uniq[miss], dtype='int32')
+            self._memo = pd.concat([self._memo, fresh])
+
+        out[ok] = cached.astype(np.int32)[inverse]
+        return out
+
+    def assign(self, lon, lat):
+        """ Neighborhood name per point, NaN where no polygon contains it. """
+        idx = self.lookup(lon, lat)
+        names = pd.Series(self.names[np.maximum(idx, 0)], dtype=object)
+        names[idx < 0] = np.nan
+        return names
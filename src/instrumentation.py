@@ -0,0 +1,223 @@
+import bisect
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger('nyc_crashes')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+# Pipeline stages run from about a second to a few hours
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200,
+                 14400)
+
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        created = datetime.fromtimestamp(record.created, timezone.utc)
+        event = {'ts': created.isoformat(), 'event': record.getMessage()}
+        event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, default=str)
+
+
+def configure_logging(path=None):
+    """ One JSON object per line on stderr, and appended to `path` (or
+        $NYC_CRASHES_METRICS_LOG) when given. Safe to call more than once.
+    """
+    if getattr(logger, '_configured', False):
+        return
+    handlers = [logging.StreamHandler(sys.stderr)]
+    path = path or os.environ.get('NYC_CRASHES_METRICS_LOG')
+    if path:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(logging.FileHandler(path))
+    for handler in handlers:
+        handler.setFormatter(_JsonFormatter())
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger._configured = True
+
+
+def log_event(event, **fields):
+    configure_logging()
+    logger.info(event, extra={'fields': fields})
+
+
+def peak_rss_mb():
+    # High-water mark of this process; ru_maxrss is KiB on Linux, bytes on
+    # macOS
+    try:
+        import resource
+    except ImportError:
+        return None
+    unit = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+
+
+# ─── Pipeline stages ─────────────────────────────────────────────────────────
+
+class stage:
+    """ Times a pipeline stage and logs wall time, rows in/out and peak RSS as
+        one 'stage' event. Works as a context manager or a decorator; code
+        inside reports its row counts with stage_rows().
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+
+    def __enter__(self):
+        self._token = _current_stage.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        _current_stage.reset(self._token)
+        observe("stage_seconds", seconds, buckets=STAGE_BUCKETS,
+                stage=self.name)
+        log_event('stage', stage=self.name,
+                  status='failed' if exc_type else 'ok',
+                  seconds=round(seconds, 3), rows_in=self.rows_in,
+                  rows_out=self.rows_out, peak_rss_mb=peak_rss_mb())
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(self.name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def stage_rows(rows_in=None, rows_out=None):
+    # Adds to the counts of the innermost running stage; a no-op outside one
+    current = _current_stage.get()
+    if current is None:
+        return
+    if rows_in is not None:
+        current.rows_in = (current.rows_in or 0) + int(rows_in)
+    if rows_out is not None:
+        current.rows_out = (current.rows_out or 0) + int(rows_out)
+
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+_histograms = {}
+_metrics_lock = threading.Lock()
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    # `buckets` only applies to the first observation of a series
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        _histograms[key].observe(value)
+
+
+def render_metrics():
+    """ Every histogram of this process in the Prometheus text format. """
+    lines = []
+    with _metrics_lock:
+        for (name, labels), hist in sorted(_histograms.items()):
+            base = ','.join(f'{k}="{v}"' for k, v in labels)
+            sep = ',' if base else ''
+            cumulative = 0
+            bounds = list(hist.buckets) + ['+Inf']
+            for bound, count in zip(bounds, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base}{sep}le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{{{base}}} {hist.total}')
+            lines.append(f'{name}_count{{{base}}} {hist.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed_callback(fn):
+    """ Records a Dash callback's latency in the callback_seconds histogram.
+        Apply below @app.callback (and above any cache, to count hits too).
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            observe('callback_seconds', time.perf_counter() - start,
+                    callback=fn.__name__)
+    return wrapper
+
+
+# ─── Profiling ───────────────────────────────────────────────────────────────
+
+def install_request_profiler(server, threshold_ms,
+                             output_dir='reports/profiles', captures=1):
+    """ Profiles each Flask request with cProfile and saves the first
+        `captures` requests slower than `threshold_ms` as .prof files (open
+        with snakeviz or pstats). Opt-in: profiling slows every request.
+    """
+    from flask import g, request
+
+    state = {'left': captures}
+    lock = threading.Lock()
+
+    @server.before_request
+    def _start_profile():
+        if state['left'] > 0:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request's profiler is running (one at a time on
+                # Python 3.12+)
+                return
+            g._profiler = profiler
+            g._profile_start = time.perf_counter()
+
+    @server.after_request
+    def _stop_profile(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g._profile_start) * 1000
+        if elapsed_ms >= threshold_ms:
+            with lock:
+                if state['left'] <= 0:
+                    return response
+                state['left'] -= 1
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            slug = request.path.strip('/').replace('/', '_')
+            path = (Path(output_dir)
+                    / f"{datetime.now():%Y%m%dT%H%M%S}-{slug}.prof")
+            profiler.dump_stats(path)
+            log_event('profile_captured', path=str(path),
+                      request_path=request.path, ms=round(elapsed_ms, 1))
+        return response
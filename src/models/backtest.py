@@ -0,0 +1,232 @@
+import click
+import numpy as np
+import pandas as pd
+from functools import partial
+from pathlib import Path
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from src.features.build_features import (build_calendar_features,
+                                         exog_digest, forecast_dates,
+                                         load_calendar, model_exog)
+from src.instrumentation import stage, stage_rows
+from src.models.forecast_store import CITY_KEY, HORIZON
+from src.models.order_search import load_specs, spec_for
+from src.models.training_engine import run_fits, split_series
+
+SPEC = {'order': (1, 1, 1), 'seasonal_order': (1, 1, 1, 7), 'trend': 'n'}
+HORIZONS = (7, 28, 91, 365)
+N_FOLDS = 4
+FOLD_STEP = 91
+# Folds always forecast this far, so new horizons up to it reuse cached fits
+FOLD_STEPS = HORIZON
+
+MIN_LENGTH = 400
+MIN_MEAN = 0.5
+
+# Metrics over the first `h` forecast days; add entries here, no refits needed
+METRICS = {
+    'mae': lambda err: np.abs(err).mean(),
+    'rmse': lambda err: np.sqrt((err ** 2).mean()),
+    'bias': lambda err: err.mean(),
+}
+
+
+def spec_id(spec=SPEC):
+    order = ''.join(map(str, spec['order']))
+    seasonal = ''.join(map(str, spec['seasonal_order']))
+    trend = '' if spec['trend'] == 'n' else f"_{spec['trend']}"
+    return f"sarima_{order}_{seasonal}{trend}"
+
+
+def fold_key(series_key, cutoff):
+    return f"{series_key}@{pd.Timestamp(cutoff).date()}"
+
+
+def cutoffs(last_date, n_folds=N_FOLDS, step=FOLD_STEP, horizon=FOLD_STEPS):
+    # Rolling origins, newest first, each leaving `horizon` days of actuals
+    # after it. `horizon` is the fold length, not the scored horizons, so
+    # changing those never moves the origins. Origins snap to a fixed
+    # `step`-day grid so a few new days of data keep the same folds (and
+    # their cached fits)
+    last = pd.Timestamp(last_date) - pd.Timedelta(days=horizon)
+    last -= pd.Timedelta(days=(last - pd.Timestamp(0)).days % step)
+    return [last - pd.Timedelta(days=step * k) for k in range(n_folds)]
+
+
+def make_folds(series, fold_cutoffs):
+    """ {fold key: training slice} for every series and cutoff. Series that
+        are too short or too quiet are left out, as in the holdout evaluation.
+    """
+    folds = {}
+    for key, ts in series.items():
+        if key != CITY_KEY and (len(ts) < MIN_LENGTH or ts.mean() < MIN_MEAN):
+            continue
+        for cutoff in fold_cutoffs:
+            train = ts.loc[:cutoff]
+            if len(train) >= MIN_LENGTH:
+                folds[fold_key(key, cutoff)] = train
+    return folds
+
+
+def fit_fold(key, train, spec=SPEC, steps=FOLD_STEPS, features_dir=None):
+    # Calendar exog from the shared feature store, when given, as the
+    # consumers fit
+    exog = future_exog = None
+    if features_dir is not None:
+        calendar = load_calendar(features_dir)
+        groups = model_exog(spec['seasonal_order'])
+        exog = calendar.frame(train.index, groups)
+        future_exog = calendar.frame(forecast_dates(train.index[-1], steps),
+                                     groups)
+    model = SARIMAX(
+        train,
+        exog=exog,
+        order=tuple(spec['order']),
+        seasonal_order=tuple(spec['seasonal_order']),
+        trend=spec.get('trend', 'n'),
+        enforce_stationarity=False,
+        enforce_invertibility=False
+    )
+    result = model.fit(disp=False)
+    forecast = result.get_forecast(steps=steps, exog=future_exog)
+    return {
+        'params': result.params.tolist(),
+        'forecast': forecast.predicted_mean.tolist(),
+    }
+
+
+def score_folds(series, records, horizons=HORIZONS, metrics=METRICS,
+                model=None):
+    """ Tidy metrics: one row per (series, cutoff, horizon, metric). """
+    rows = []
+    for fkey, record in records.items():
+        if record['status'] != 'ok':
+            continue
+        key, cutoff = fkey.rsplit('@', 1)
+        cutoff = pd.Timestamp(cutoff)
+        forecast = np.asarray(record['result']['forecast'])
+        actual = series[key].loc[cutoff + pd.Timedelta(days=1):].to_numpy()
+        for h in horizons:
+            if h > len(forecast) or h > len(actual):
+                continue
+            err = forecast[:h] - actual[:h]
+            for name, fn in metrics.items():
+                rows.append((key, model, cutoff, h, name, float(fn(err))))
+    return pd.DataFrame(rows, columns=['series', 'model', 'cutoff',
+                                       'horizon', 'metric', 'value'])
+
+
+def summarize(metrics, horizon=HORIZON):
+    """ Per-neighborhood metrics averaged over folds at one horizon, in the
+        neighborhood, mae, rmse layout of neighborhood_forecast_metrics.csv.
+    """
+    rows = metrics[(metrics['horizon'] == horizon)
+                   & (metrics['series'] != CITY_KEY)]
+    wide = rows.pivot_table(index='series', columns='metric', values='value',
+                            aggfunc='mean')
+    wide = wide.reset_index().rename(columns={'series': 'neighborhood'})
+    return wide[['neighborhood', 'mae', 'rmse']]
+
+
+@stage('backtest')
+def run_backtest(series, cache_dir, spec=SPEC, horizons=HORIZONS,
+                 n_folds=N_FOLDS, step=FOLD_STEP, n_workers=None,
+                 timeout=None, specs=None, features_dir=None):
+    """ Rolling-origin backtest of `spec` over every series on a process pool.
+
+        With `specs` from the order search, each neighborhood is backtested
+        with its own spec instead (the city keeps `spec`). With `features_dir`,
+        folds regress on the calendar exog. Fold fits are cached under
+        `cache_dir`/<spec> keyed by series and cutoff, and are redone only
+        when that fold's training data or spec changes.
+    """
+    if max(horizons) > FOLD_STEPS:
+        raise ValueError(f"Horizons beyond {FOLD_STEPS} days are not cached "
+                         "by the fold fits")
+
+    last_date = max(ts.index[-1] for ts in series.values())
+    folds = make_folds(series, cutoffs(last_date, n_folds, step))
+    model = spec_id(spec)
+    task_kwargs = task_setup = None
+    if specs:
+        model = 'searched'
+        series_keys = {fkey: fkey.rsplit('@', 1)[0] for fkey in folds}
+        task_setup = {fkey: spec if key == CITY_KEY else spec_for(specs, key)
+                      for fkey, key in series_keys.items()}
+        task_kwargs = {fkey: {'spec': s} for fkey, s in task_setup.items()}
+    fold_dir = Path(cache_dir) / model
+    if features_dir is not None:
+        fold_dir = fold_dir / exog_digest()
+    records = run_fits(
+        folds, partial(fit_fold, spec=spec, features_dir=features_dir),
+        fold_dir, n_workers=n_workers, timeout=timeout,
+        desc="Backtesting folds", task_kwargs=task_kwargs,
+        task_setup=task_setup
+    )
+    stage_rows(rows_in=len(folds),
+               rows_out=sum(r['status'] == 'ok' for r in records.values()))
+    return score_folds(series, records, horizons, model=model)
+
+
+@click.command()
+@click.option('--folds', type=int, default=N_FOLDS, show_default=True,
+              help='Number of rolling origins.')
+@click.option('--step', type=int, default=FOLD_STEP, show_default=True,
+              help='Days between origins.')
+@click.option('--horizon', 'horizons', type=int, multiple=True,
+              default=HORIZONS, show_default=True,
+              help='Forecast horizons in days (repeatable).')
+@click.option('--workers', type=int, default=None,
+              help='Worker processes (default: all cores).')
+@click.option('--timeout', type=float, default=300, show_default=True,
+              help='Seconds allowed per fit.')
+@click.option('--write-summary', is_flag=True,
+              help='Also write neighborhood_forecast_metrics.csv from the '
+                   'longest horizon.')
+@click.option('--specs', 'specs_file', default=None,
+              help='Backtest each neighborhood with its orders from '
+                   'order_search.py (e.g. '
+                   '../../models/order_search/specs.json) instead of '
+                   '(1,1,1)(1,1,1,7).')
+@click.option('--features-dir',
+              default='../../data/processed/calendar_features',
+              show_default=True,
+              help='Calendar exog store (src/features/build_features.py); '
+                   'built or extended as needed.')
+def main(folds, step, horizons, workers, timeout, write_summary, specs_file,
+         features_dir):
+    # City and neighborhood daily series
+    daily_nbhd = pd.read_parquet(
+        '../../data/processed/daily_neighborhood_crashes.parquet')
+    daily_nbhd['crash_date'] = pd.to_datetime(daily_nbhd['crash_date'])
+    series = split_series(daily_nbhd)
+
+    daily_city = pd.read_parquet(
+        '../../data/processed/daily_city_crashes.parquet')
+    daily_city['crash_date'] = pd.to_datetime(daily_city['crash_date'])
+    city = daily_city.set_index('crash_date')['total_crashes'].sort_index()
+    series[CITY_KEY] = city.asfreq('D').fillna(0)
+    build_calendar_features(features_dir,
+                            start=min(ts.index[0] for ts in series.values()),
+                            end=max(ts.index[-1] for ts in series.values()))
+
+    metrics = run_backtest(
+        series, '../../models/backtest_cache',
+        horizons=horizons, n_folds=folds, step=step, n_workers=workers,
+        timeout=timeout, specs=load_specs(specs_file),
+        features_dir=features_dir
+    )
+
+    Path('../../reports/metrics').mkdir(parents=True, exist_ok=True)
+    metrics.to_csv('../../reports/metrics/backtest_metrics.csv', index=False)
+    if write_summary:
+        summarize(metrics, max(horizons)).to_csv(
+            '../../reports/metrics/neighborhood_forecast_metrics.csv',
+            index=False)
+
+    print("Backtest finished. Metrics saved to "
+          "reports/metrics/backtest_metrics.csv.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import click
+import pandas as pd
+from functools import partial
+from pathlib import Path
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from src.features.build_features import (FORWARD_DAYS,
+                                         build_calendar_features,
+                                         exog_digest, forecast_dates,
+                                         load_calendar, model_exog)
+from src.instrumentation import stage, stage_rows
+from src.models.forecast_store import (CITY_KEY, HORIZON, MODEL_VERSION,
+                                       STORE_COLUMNS)
+from src.models.order_search import fit_setup, load_specs, spec_for
+from src.models.sarima_artifact import SarimaArtifact
+from src.models.training_engine import (load_checkpoints, run_fits,
+                                        split_series)
+from src.models.warm_start import (DRIFT_THRESHOLD, REFIT_EVERY_DAYS,
+                                   drift_score, refit_due)
+
+
+def _forecast_record(forecast, alpha=0.05):
+    # JSON-friendly form of a statsmodels forecast, so it can be checkpointed
+    conf = forecast.conf_int(alpha=alpha)
+    return {
+        'date': [d.strftime('%Y-%m-%d')
+                 for d in forecast.predicted_mean.index],
+        'mean': forecast.predicted_mean.tolist(),
+        'lower': conf.iloc[:, 0].tolist(),
+        'upper': conf.iloc[:, 1].tolist(),
+    }
+
+
+def _artifact_record(artifact, horizon, calendar=None):
+    # Same layout as _forecast_record, from the NumPy forecast of a saved
+    # artifact
+    exog = None
+    if calendar is not None:
+        exog = calendar.frame(forecast_dates(artifact.last_obs, horizon))
+    forecast = artifact.forecast(steps=horizon, exog=exog)
+    return {
+        'date': [d.strftime('%Y-%m-%d') for d in forecast.index],
+        'mean': forecast['mean'].tolist(),
+        'lower': forecast['lower'].tolist(),
+        'upper': forecast['upper'].tolist(),
+    }
+
+
+def _forecast_frame(key, record):
+    # Flatten a forecast record into the long store layout
+    return pd.DataFrame({
+        'key': key,
+        'model_version': MODEL_VERSION,
+        'step': range(1, len(record['mean']) + 1),
+        'date': pd.to_datetime(record['date']),
+        'mean': record['mean'],
+        'lower': record['lower'],
+        'upper': record['upper'],
+    })
+
+
+# Checkpoint fields a warm start needs; the stored forecast itself stays
+# behind
+WARM_START_FIELDS = ['spec', 'params', 'fitted_on', 'last_obs']
+
+
+def forecast_neighborhood(nbhd, ts, prev=None, specs=None, horizon=HORIZON,
+                          refit_every=REFIT_EVERY_DAYS,
+                          drift_threshold=DRIFT_THRESHOLD,
+                          features_dir=None):
+    spec = spec_for(specs, nbhd)
+    # Calendar exog for the history and the forecast days, from the shared
+    # feature store
+    exog = future_exog = None
+    if features_dir is not None:
+        calendar = load_calendar(features_dir)
+        groups = model_exog(spec['seasonal_order'])
+        exog = calendar.frame(ts.index, groups)
+        future_exog = calendar.frame(forecast_dates(ts.index[-1], horizon),
+                                     groups)
+    model = SARIMAX(
+        ts,
+        exog=exog,
+        order=tuple(spec['order']),
+        seasonal_order=tuple(spec['seasonal_order']),
+        trend=spec['trend'],
+        enforce_stationarity=False,
+        enforce_invertibility=False
+    )
+
+    # Warm start: re-run the Kalman filter with last run's parameters, which is
+    # a fraction of the cost of MLE, unless the spec changed, a refit is due or
+    # the new days drifted
+    if (prev and prev['spec'] == spec
+            and len(prev['params']) == len(model.param_names)
+            and not refit_due(prev['fitted_on'], refit_every)):
+        result = model.filter(prev['params'])
+        if drift_score(result, since=prev['last_obs']) <= drift_threshold:
+            forecast = result.get_forecast(steps=horizon, exog=future_exog)
+            return dict(_forecast_record(forecast),
+                        spec=spec, params=prev['params'],
+                        fitted_on=prev['fitted_on'],
+                        last_obs=str(ts.index[-1].date()))
+
+    result = model.fit(disp=False)
+    forecast = result.get_forecast(steps=horizon, exog=future_exog)
+    return dict(_forecast_record(forecast),
+                spec=spec, params=result.params.tolist(),
+                fitted_on=str(pd.Timestamp.today().date()),
+                last_obs=str(ts.index[-1].date()))
+
+
+@stage('build_forecast_store')
+def build_forecast_store(daily_nbhd_file: str, city_model_file: str,
+                         output_file: str, checkpoint_dir: str,
+                         horizon: int = HORIZON, n_workers=None,
+                         timeout=None, warm_start: bool = True,
+                         refit_every: int = REFIT_EVERY_DAYS,
+                         drift_threshold: float = DRIFT_THRESHOLD,
+                         specs_file: str = None, features_dir: str = None):
+    # Load neighborhood-level crash counts
+    daily_nbhd = pd.read_parquet(daily_nbhd_file)
+    daily_nbhd['crash_date'] = pd.to_datetime(daily_nbhd['crash_date'])
+
+    # Every fit and forecast reads its calendar exog from one store, extended
+    # here if needed
+    calendar = None
+    if features_dir is not None:
+        forward = pd.Timedelta(days=max(FORWARD_DAYS, horizon))
+        build_calendar_features(features_dir,
+                                start=daily_nbhd['crash_date'].min(),
+                                end=daily_nbhd['crash_date'].max() + forward)
+        calendar = load_calendar(features_dir)
+
+    frames = []
+
+    # Citywide forecast comes from the already trained city model
+    city_model = SarimaArtifact.load(city_model_file)
+    frames.append(_forecast_frame(
+        CITY_KEY, _artifact_record(city_model, horizon, calendar)))
+
+    # Every neighborhood is fitted on its full history, as the dashboard used
+    # to do per click. Checkpoints are kept per model version (and calendar
+    # features) so a version bump never reuses stale fits, and last run's
+    # parameters seed the warm start. Orders come from the order search when
+    # it has run; each neighborhood's spec is part of its checkpoint
+    # fingerprint, so a new search refits only the neighborhoods whose orders
+    # changed.
+    specs = load_specs(specs_file)
+    version_dir = Path(checkpoint_dir) / MODEL_VERSION
+    if features_dir is not None:
+        version_dir = version_dir / exog_digest()
+    previous = {}
+    if warm_start:
+        previous = {k: {'prev': {f: r['result'][f]
+                                 for f in WARM_START_FIELDS}}
+                    for k, r in load_checkpoints(version_dir).items()
+                    if r['status'] == 'ok'
+                    and all(f in r['result'] for f in WARM_START_FIELDS)}
+    fit_fn = partial(forecast_neighborhood, specs=specs, horizon=horizon,
+                     refit_every=refit_every,
+                     drift_threshold=drift_threshold,
+                     features_dir=features_dir)
+    # Every neighborhood ends on the city model's last day (or the latest
+    # crash, if newer), so all forecasts cover the same dates and reconcile
+    # step by step
+    end = max(daily_nbhd['crash_date'].max(), city_model.last_obs)
+    series = split_series(daily_nbhd, end=end)
+    setups = {nbhd: fit_setup(spec_for(specs, nbhd), features_dir)
+              for nbhd in series}
+    records = run_fits(
+        series, fit_fn, version_dir, n_workers=n_workers, timeout=timeout,
+        desc="Building forecast store", task_kwargs=previous,
+        task_setup=setups
+    )
+    for nbhd, record in records.items():
+        if record['status'] == 'ok':
+            frames.append(_forecast_frame(nbhd, record['result']))
+
+    store = pd.concat(frames, ignore_index=True)
+    stage_rows(rows_in=len(daily_nbhd), rows_out=len(store))
+    store = store.astype({'step': 'int16', 'mean': 'float32',
+                          'lower': 'float32', 'upper': 'float32'})
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    store[STORE_COLUMNS].to_parquet(output_file, index=False)
+
+
+@click.command()
+@click.option('--workers', type=int, default=None,
+              help='Worker processes (default: all cores).')
+@click.option('--timeout', type=float, default=300, show_default=True,
+              help='Seconds allowed per fit.')
+@click.option('--full-refit', is_flag=True,
+              help='Ignore saved parameters and refit every neighborhood.')
+@click.option('--refit-every', type=int, default=REFIT_EVERY_DAYS,
+              show_default=True,
+              help='Days since a neighborhood was last fitted after which '
+                   'it is refitted.')
+@click.option('--drift-threshold', type=float, default=DRIFT_THRESHOLD,
+              show_default=True,
+              help='RMS standardized one-step error on new days that '
+                   'triggers a refit.')
+@click.option('--specs', 'specs_file',
+              default='../../models/order_search/specs.json',
+              show_default=True,
+              help='Per-neighborhood orders from order_search.py; missing '
+                   'ones use (1,1,1)(1,1,1,7).')
+def main(workers, timeout, full_refit, refit_every, drift_threshold,
+         specs_file):
+    build_forecast_store(
+        daily_nbhd_file=('../../data/processed/'
+                         'daily_neighborhood_crashes.parquet'),
+        city_model_file='../../models/crash_count_forecast/sarima_model.npz',
+        output_file='../../models/forecast_store/forecasts.parquet',
+        checkpoint_dir='../../models/forecast_store/checkpoints',
+        n_workers=workers,
+        timeout=timeout,
+        warm_start=not full_refit,
+        refit_every=refit_every,
+        drift_threshold=drift_threshold,
+        specs_file=specs_file,
+        features_dir='../../data/processed/calendar_features'
+    )
+    print("Forecast store saved to models/forecast_store/forecasts.parquet")
+
+
+if __name__ == "__main__":
+    main()
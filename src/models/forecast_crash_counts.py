@@ -1,34 +1,136 @@
+import click
 import pandas as pd
-import joblib
 from pathlib import Path
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
-def main():
-    # Load crash data
-    daily_city = pd.read_parquet('../../data/processed/daily_city_crashes.parquet')
+from src.features.build_features import (FORWARD_DAYS,
+                                         build_calendar_features,
+                                         load_calendar, model_exog)
+from src.instrumentation import stage, stage_rows
+from src.models.sarima_artifact import SarimaArtifact
+from src.models.warm_start import (DRIFT_THRESHOLD, REFIT_EVERY_DAYS,
+                                   drift_score, refit_due)
+
+MODEL_DIR = Path('../../models/crash_count_forecast')
+MODEL_FILE = MODEL_DIR / 'sarima_model.npz'
+DAILY_CITY_FILE = '../../data/processed/daily_city_crashes.parquet'
+FEATURES_DIR = '../../data/processed/calendar_features'
+ORDER = (1, 1, 1)
+SEASONAL_ORDER = (1, 1, 1, 7)
+
+
+def load_daily_city(daily_city_file=DAILY_CITY_FILE):
+    daily_city = pd.read_parquet(daily_city_file)
     daily_city['crash_date'] = pd.to_datetime(daily_city['crash_date'])
     daily_city = daily_city.set_index('crash_date')
-    daily_city = daily_city.asfreq('D')
+    return daily_city.asfreq('D')
+
+
+@stage('city_sarima_fit')
+def fit_full(daily_city, exog=None):
+    # Trained through the last observed day, the same window a refresh rolls
+    # forward to, so the forecast starts the day after the data either way.
+    # Holdout accuracy is measured by src/models/backtest.py
+    stage_rows(rows_in=len(daily_city))
+
+    # Fit SARIMA model, with calendar regressors from the feature store when
+    # given
+    model = SARIMAX(
+        daily_city['total_crashes'],
+        exog=None if exog is None else exog.loc[daily_city.index],
+        order=ORDER,
+        seasonal_order=SEASONAL_ORDER,
+        enforce_stationarity=False,
+        enforce_invertibility=False
+    )
+    return model.fit(disp=False)
 
-    # Train-test split (1 year holdout)
-    train = daily_city.iloc[:-365]
-    # test = daily_city.iloc[-365:]  # not used here, just training model
 
-    # Fit SARIMA model
+@stage('city_sarima_refresh')
+def refresh(artifact, daily_city, exog=None):
+    # Roll the saved model forward through the Kalman filter; parameters stay
+    # fixed
+    y = daily_city.loc[artifact.first_obs:, 'total_crashes']
+    if exog is not None:
+        exog = exog.loc[y.index, artifact.exog_columns]
     model = SARIMAX(
-        train['total_crashes'],
-        order=(1,1,1),
-        seasonal_order=(1,1,1,7),
+        y,
+        exog=exog,
+        order=tuple(artifact.order),
+        seasonal_order=tuple(artifact.seasonal_order),
         enforce_stationarity=False,
         enforce_invertibility=False
     )
+    refreshed = model.filter(artifact.params)
+    return refreshed, drift_score(refreshed, since=artifact.last_obs)
 
-    sarima_result = model.fit(disp=False)
+
+def save(sarima_result, fitted_on, model_file=MODEL_FILE):
+    # Parameters, system matrices and final state only; see
+    # src/models/sarima_artifact.py
+    Path(model_file).parent.mkdir(parents=True, exist_ok=True)
+    SarimaArtifact.from_results(sarima_result, fitted_on).save(model_file)
+
+
+def train_city_model(daily_city_file=DAILY_CITY_FILE, model_file=MODEL_FILE,
+                     mode='refit', refit_every=REFIT_EVERY_DAYS,
+                     drift_threshold=DRIFT_THRESHOLD,
+                     features_dir=FEATURES_DIR):
+    """ Fits (or, outside 'refit' mode, refreshes) the city model and saves
+        it to `model_file`. Returns 'refit' or 'refresh'.
+    """
+    # Load crash data
+    daily_city = load_daily_city(daily_city_file)
+
+    # Calendar exog for the history and the forecast days, built once and
+    # shared
+    build_calendar_features(features_dir, start=daily_city.index[0],
+                            end=daily_city.index[-1]
+                            + pd.Timedelta(days=FORWARD_DAYS))
+    exog = load_calendar(features_dir).frame(
+        daily_city.index, groups=model_exog(SEASONAL_ORDER))
+
+    if mode != 'refit' and Path(model_file).exists():
+        artifact = SarimaArtifact.load(model_file)
+        if artifact.exog_columns != list(exog.columns):
+            print("Full refit: exogenous columns changed")
+        else:
+            refreshed, score = refresh(artifact, daily_city, exog)
+            due = refit_due(artifact.fitted_on, refit_every)
+
+            if mode == 'refresh' or not (due or score > drift_threshold):
+                save(refreshed, artifact.fitted_on, model_file)
+                print("SARIMA model refreshed through "
+                      f"{refreshed.model._index[-1].date()} "
+                      f"(drift {score:.2f}), saved to {model_file}")
+                return 'refresh'
+            print(f"Full refit: {'schedule' if due else f'drift {score:.2f}'}")
+
+    sarima_result = fit_full(daily_city, exog)
 
     # Save model
-    Path('../../models/crash_count_forecast').mkdir(parents=True, exist_ok=True)
-    joblib.dump(sarima_result, '../../models/crash_count_forecast/sarima_model.pkl')
-    print("SARIMA model trained and saved to models/crash_count_forecast/sarima_model.pkl")
+    save(sarima_result, pd.Timestamp.today(), model_file)
+    print(f"SARIMA model trained and saved to {model_file}")
+    return 'refit'
+
+
+@click.command()
+@click.option('--mode', type=click.Choice(['auto', 'refit', 'refresh']),
+              default='refit', show_default=True,
+              help="'refresh' appends new days with fixed parameters; 'auto' "
+                   "refreshes unless a refit is due or drift is detected.")
+@click.option('--refit-every', type=int, default=REFIT_EVERY_DAYS,
+              show_default=True,
+              help='Days since the last full fit after which auto mode '
+                   'refits.')
+@click.option('--drift-threshold', type=float, default=DRIFT_THRESHOLD,
+              show_default=True,
+              help='RMS standardized one-step error on new days that '
+                   'triggers a refit in auto mode.')
+def main(mode, refit_every, drift_threshold):
+    train_city_model(mode=mode, refit_every=refit_every,
+                     drift_threshold=drift_threshold)
+
 
 if __name__ == "__main__":
     main()
@@ -1,70 +1,157 @@
+import click
+import time
 import pandas as pd
+from functools import partial
+from pathlib import Path
 from statsmodels.tsa.statespace.sarimax import SARIMAX
-from tqdm import tqdm
 
-def main():
+from src.features.build_features import (build_calendar_features,
+                                         exog_digest, load_calendar,
+                                         model_exog)
+from src.instrumentation import log_event, stage, stage_rows
+from src.models.order_search import fit_setup, load_specs, spec_for
+from src.models.panel_sarima import evaluate_panel
+from src.models.training_engine import run_fits, split_series
+
+
+def evaluate_neighborhood(nbhd, ts, specs=None, features_dir=None):
+    # Skip neighborhoods with too little data
+    if len(ts) < 400:
+        return None
+
+    # Skip neighborhoods that are too empty (low activity)
+    if ts.mean() < 0.5:
+        return None
+
+    # Train-test split
+    train = ts.iloc[:-365]
+    test = ts.iloc[-365:]
+
+    # Searched orders, or the default (1,1,1)(1,1,1,7)
+    spec = spec_for(specs, nbhd)
+
+    # Calendar exog from the shared feature store, when given
+    train_exog = test_exog = None
+    if features_dir is not None:
+        calendar = load_calendar(features_dir)
+        groups = model_exog(spec['seasonal_order'])
+        train_exog = calendar.frame(train.index, groups)
+        test_exog = calendar.frame(test.index, groups)
+
+    # Fit SARIMA
+    model = SARIMAX(
+        train,
+        exog=train_exog,
+        order=tuple(spec['order']),
+        seasonal_order=tuple(spec['seasonal_order']),
+        trend=spec['trend'],
+        enforce_stationarity=False,
+        enforce_invertibility=False
+    )
+    start = time.perf_counter()
+    result = model.fit(disp=False)
+    fit_seconds = time.perf_counter() - start
+
+    # Forecast
+    forecast = result.get_forecast(steps=len(test), exog=test_exog)
+    forecast_mean = forecast.predicted_mean
+
+    # Evaluate
+    mae = (abs(forecast_mean - test)).mean()
+    rmse = ((forecast_mean - test) ** 2).mean() ** 0.5
+
+    return {
+        'mae': float(mae), 'rmse': float(rmse), 'fit_seconds': fit_seconds,
+        'iterations': result.mle_retvals.get('iterations'),
+        'converged': bool(result.mle_retvals.get('converged')),
+    }
+
+
+@click.command()
+@click.option('--workers', type=int, default=None,
+              help='Worker processes (default: all cores).')
+@click.option('--timeout', type=float, default=300, show_default=True,
+              help='Seconds allowed per fit.')
+@click.option('--checkpoint-dir',
+              default='../../models/neighborhood_checkpoints',
+              show_default=True)
+@click.option('--retry-failed', is_flag=True,
+              help='Refit neighborhoods that failed or timed out last run.')
+@click.option('--engine', type=click.Choice(['statsmodels', 'panel']),
+              default='statsmodels', show_default=True,
+              help="'panel' fits all neighborhoods in one batched NumPy "
+                   "pass.")
+@click.option('--shared-params', is_flag=True,
+              help='Panel engine: one parameter set for all neighborhoods.')
+@click.option('--specs', 'specs_file',
+              default='../../models/order_search/specs.json',
+              show_default=True,
+              help='Per-neighborhood orders from order_search.py; missing '
+                   'ones use (1,1,1)(1,1,1,7).')
+@click.option('--features-dir',
+              default='../../data/processed/calendar_features',
+              show_default=True,
+              help='Calendar exog store (src/features/build_features.py); '
+                   'built or extended as needed.')
+@stage('neighborhood_sarima')
+def main(workers, timeout, checkpoint_dir, retry_failed, engine,
+         shared_params, specs_file, features_dir):
     # Load neighborhood-level crash counts
-    daily_nbhd = pd.read_parquet('../../data/processed/daily_neighborhood_crashes.parquet')
+    daily_nbhd = pd.read_parquet(
+        '../../data/processed/daily_neighborhood_crashes.parquet')
 
-    # Ensure datetime and sorted
+    # Ensure datetime, then split into one daily series per neighborhood
     daily_nbhd['crash_date'] = pd.to_datetime(daily_nbhd['crash_date'])
-    daily_nbhd = daily_nbhd.sort_values(['neighborhood', 'crash_date'])
-
-    neighborhoods = daily_nbhd['neighborhood'].unique()
-
-    results = []  # to store evaluation metrics
-
-    for nbhd in tqdm(neighborhoods, desc="Training SARIMA models"):
-        nbhd_df = daily_nbhd[daily_nbhd['neighborhood'] == nbhd]
-
-        # Pivot to time series (daily frequency)
-        ts = nbhd_df.set_index('crash_date')['total_crashes'].asfreq('D').fillna(0)
-
-        # Skip neighborhoods with too little data
-        if len(ts) < 400:
-            continue
-
-        # Skip neighborhoods that are too empty (low activity)
-        if ts.mean() < 0.5:
-            continue
-
-        # Train-test split
-        train = ts.iloc[:-365]
-        test = ts.iloc[-365:]
-
-        # Fit SARIMA
-        try:
-            model = SARIMAX(
-                train,
-                order=(1,1,1),
-                seasonal_order=(1,1,1,7),
-                enforce_stationarity=False,
-                enforce_invertibility=False
-            )
-            result = model.fit(disp=False)
-
-            # Forecast
-            forecast = result.get_forecast(steps=len(test))
-            forecast_mean = forecast.predicted_mean
-
-            # Evaluate
-            mae = (abs(forecast_mean - test)).mean()
-            rmse = ((forecast_mean - test) ** 2).mean() ** 0.5
-
-            results.append({
-                'neighborhood': nbhd,
-                'mae': mae,
-                'rmse': rmse
-            })
-
-        except Exception as e:
-            print(f"Failed on {nbhd}: {e}")
+    series = split_series(daily_nbhd)
+
+    if engine == 'panel':
+        results = [
+            {'neighborhood': nbhd, **metrics}
+            for nbhd, metrics in evaluate_panel(
+                series, shared=shared_params).items()
+        ]
+    else:
+        specs = load_specs(specs_file)
+        build_calendar_features(features_dir,
+                                start=daily_nbhd['crash_date'].min(),
+                                end=daily_nbhd['crash_date'].max())
+        # Each neighborhood's spec is part of its checkpoint fingerprint, so a
+        # new search refits only the neighborhoods whose orders changed
+        setups = {nbhd: fit_setup(spec_for(specs, nbhd), features_dir)
+                  for nbhd in series}
+        records = run_fits(
+            series, partial(evaluate_neighborhood, specs=specs,
+                            features_dir=features_dir),
+            Path(checkpoint_dir) / exog_digest(),
+            n_workers=workers, timeout=timeout, retry_failed=retry_failed,
+            desc="Training SARIMA models", task_setup=setups
+        )
+        results = [
+            {'neighborhood': nbhd, **record['result']}
+            for nbhd, record in records.items() if record['status'] == 'ok'
+        ]
+        # Fits ran in worker processes; their timings come back in the
+        # checkpoint records
+        for nbhd, record in records.items():
+            result = record['result'] or {}
+            log_event('neighborhood_fit', neighborhood=nbhd,
+                      status=record['status'], error=record['error'],
+                      fit_seconds=result.get('fit_seconds'),
+                      iterations=result.get('iterations'),
+                      converged=result.get('converged'))
+
+    stage_rows(rows_in=len(daily_nbhd), rows_out=len(results))
 
     # Save results
-    metrics_df = pd.DataFrame(results)
-    metrics_df.to_csv('../../reports/metrics/neighborhood_forecast_metrics.csv', index=False)
+    metrics_df = pd.DataFrame(results,
+                              columns=['neighborhood', 'mae', 'rmse'])
+    metrics_df.to_csv(
+        '../../reports/metrics/neighborhood_forecast_metrics.csv',
+        index=False)
+
+    print("Finished training and evaluation. Metrics saved to "
+          "reports/metrics/neighborhood_forecast_metrics.csv.")
 
-    print("Finished training and evaluation. Metrics saved to reports/metrics/neighborhood_forecast_metrics.csv.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,28 @@
+import pandas as pd
+
+# Bump whenever the model spec or training window changes so the dashboard
+# never mixes forecasts from different model generations.
+MODEL_VERSION = 'sarima_111_1117_calendar_v2'
+HORIZON = 365
+CITY_KEY = '__city__'
+BOROUGH_PREFIX = '__borough__:'
+
+STORE_COLUMNS = ['key', 'model_version', 'step', 'date', 'mean', 'lower',
+                 'upper']
+
+
+def borough_key(borough):
+    # Store key for a borough total, kept apart from NTA names
+    return BOROUGH_PREFIX + borough
+
+
+def load_forecast_store(path, model_version=MODEL_VERSION):
+    # Returns {key: DataFrame[step, date, mean, lower, upper]} for one model
+    # version
+    store = pd.read_parquet(path)
+    store = store[store['model_version'] == model_version]
+    return {
+        key: (frame.drop(columns=['key', 'model_version'])
+              .sort_values('step').reset_index(drop=True))
+        for key, frame in store.groupby('key')
+    }
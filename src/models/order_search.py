@@ -0,0 +1,250 @@
+import itertools
+import json
+import warnings
+
+import click
+import numpy as np
+import pandas as pd
+from functools import partial
+from pathlib import Path
+from statsmodels.tsa.seasonal import STL
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+from statsmodels.tsa.stattools import kpss
+
+from src.features.build_features import (build_calendar_features,
+                                         exog_digest, load_calendar,
+                                         model_exog)
+from src.instrumentation import stage, stage_rows
+from src.models.training_engine import run_fits, split_series
+
+SEASON = 7
+# The spec every model used before the search existed, and the fallback
+DEFAULT_SPEC = {'order': [1, 1, 1], 'seasonal_order': [1, 1, 1, SEASON],
+                'trend': 'n'}
+
+# ARMA orders searched once the differencing is fixed
+GRID = {'p': (0, 1, 2), 'q': (0, 1, 2), 'P': (0, 1), 'Q': (0, 1)}
+# Recent history used for the search, to keep a nightly run short
+SEARCH_WINDOW = 3 * 365
+# Seasonal strength above which a seasonal difference is taken (as in
+# auto.arima)
+SEASONAL_STRENGTH = 0.64
+KPSS_ALPHA = 0.05
+MAXITER = 50
+# Candidates get a few optimizer iterations first and are dropped when their
+# AIC is already this far behind the best one
+PARTIAL_ITER = 5
+PRUNE_MARGIN = 10.0
+
+MIN_LENGTH = 400
+MIN_MEAN = 0.5
+
+
+def load_specs(path):
+    # {neighborhood: spec} written by the search; empty when it has not run
+    if path is None or not Path(path).exists():
+        return {}
+    return json.loads(Path(path).read_text())
+
+
+def spec_for(specs, key):
+    # The searched spec, or the default for a series the search skipped
+    spec = (specs or {}).get(key)
+    if spec is None:
+        return dict(DEFAULT_SPEC)
+    if 'trend' not in spec:
+        raise ValueError(f"Spec for {key} has no trend; rerun the order "
+                         "search")
+    return spec
+
+
+def trend_for(d, D):
+    # A constant only for undifferenced series; differencing removes the level
+    return 'c' if d + D == 0 else 'n'
+
+
+def fit_setup(spec, features_dir=None):
+    # What a consumer's fit depends on besides the series: the spec, and the
+    # calendar groups it regresses on when a feature store is used
+    if features_dir is None:
+        return spec
+    return dict(spec, exog=model_exog(spec['seasonal_order']))
+
+
+class Differences:
+    """ Memoized (1 - L)^d (1 - L^7)^D differences of one series (or of
+        the columns of an exog array), each built from the next-lower one, so
+        tests and candidate fits share them.
+    """
+
+    def __init__(self, values):
+        self._cache = {(0, 0): np.asarray(values, dtype=np.float64)}
+
+    def get(self, d, D):
+        if (d, D) not in self._cache:
+            if D > 0:
+                x = self.get(d, D - 1)
+                self._cache[(d, D)] = x[SEASON:] - x[:-SEASON]
+            else:
+                self._cache[(d, D)] = np.diff(self.get(d - 1, D), axis=0)
+        return self._cache[(d, D)]
+
+
+def seasonal_strength(values):
+    parts = STL(values, period=SEASON).fit()
+    return max(0.0, 1 - np.var(parts.resid)
+               / np.var(parts.resid + parts.seasonal))
+
+
+def choose_differencing(diffs):
+    D = int(seasonal_strength(diffs.get(0, 0)) > SEASONAL_STRENGTH)
+    with warnings.catch_warnings():
+        # kpss warns when the statistic is outside its lookup table
+        warnings.simplefilter('ignore')
+        p_value = kpss(diffs.get(0, D), regression='c', nlags='auto')[1]
+    return int(p_value < KPSS_ALPHA), D
+
+
+def _fit(w, p, q, P, Q, constant, maxiter=MAXITER, warm=None, exog=None):
+    # `warm`: fitted params of a larger model, by name; shared coefficients
+    # start from there and the dropped ones are simply left out
+    model = SARIMAX(
+        w,
+        exog=exog,
+        order=(p, 0, q),
+        seasonal_order=(P, 0, Q, SEASON),
+        trend='c' if constant else 'n',
+        enforce_stationarity=False,
+        enforce_invertibility=False
+    )
+    start_params = None
+    if warm is not None:
+        start_params = [warm.get(name, 0.0) for name in model.param_names]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return model.fit(disp=False, maxiter=maxiter,
+                         start_params=start_params)
+
+
+def search_orders(key, ts, grid=GRID, window=SEARCH_WINDOW,
+                  features_dir=None):
+    """ Lowest-AIC (p,d,q)(P,D,Q,7) spec for one series.
+
+        d and D are chosen first (seasonal strength, then KPSS), and every
+        candidate is fitted to the same memoized differenced series, with the
+        calendar exog the consumers use (differenced alike) when
+        `features_dir` is given. The largest candidate is fitted first:
+        nested candidates cannot beat its log-likelihood, so
+        -2 llf_max + 2k bounds their AIC from below.
+        Candidates run in order of parameter count, and the search stops once
+        that bound reaches the best AIC found. Each remaining candidate starts
+        from the largest fit's coefficients, gets PARTIAL_ITER iterations, and
+        is only fitted to convergence if its AIC is within PRUNE_MARGIN of
+        the best.
+    """
+    # Skip neighborhoods with too little data or too little activity
+    if len(ts) < MIN_LENGTH or ts.mean() < MIN_MEAN:
+        return None
+
+    diffs = Differences(ts.iloc[-window:].to_numpy())
+    d, D = choose_differencing(diffs)
+    w = diffs.get(d, D)
+    trend = trend_for(d, D)
+    constant = trend == 'c'
+
+    # Regression on differenced exog is the consumers' regression with ARIMA
+    # errors
+    x = None
+    if features_dir is not None:
+        groups = model_exog([0, D, 0, SEASON])
+        exog = load_calendar(features_dir).frame(ts.index[-window:], groups)
+        x = Differences(exog.to_numpy()).get(d, D)
+    k_exog = 0 if x is None else x.shape[1]
+
+    candidates = sorted(itertools.product(grid['p'], grid['q'], grid['P'],
+                                          grid['Q']), key=sum)
+    largest = candidates[-1]
+    fitted = {largest: _fit(w, *largest, constant, exog=x)}
+    llf_max = fitted[largest].llf
+    warm = dict(zip(fitted[largest].model.param_names, fitted[largest].params))
+
+    best_aic = fitted[largest].aic
+    for orders in candidates[:-1]:
+        n_params = sum(orders) + 1 + constant + k_exog
+        if -2 * llf_max + 2 * n_params >= best_aic:
+            break
+        partial_fit = _fit(w, *orders, constant, maxiter=PARTIAL_ITER,
+                           warm=warm, exog=x)
+        if partial_fit.aic > best_aic + PRUNE_MARGIN:
+            continue
+        fitted[orders] = _fit(w, *orders, constant, exog=x,
+                              warm=dict(zip(partial_fit.model.param_names,
+                                            partial_fit.params)))
+        best_aic = min(best_aic, fitted[orders].aic)
+
+    (p, q, P, Q), best = min(fitted.items(), key=lambda item: item[1].aic)
+    return {
+        'order': [p, d, q],
+        'seasonal_order': [P, D, Q, SEASON],
+        'trend': trend,
+        'aic': float(best.aic),
+        'fitted': len(fitted),
+        'pruned': len(candidates) - len(fitted),
+    }
+
+
+@click.command()
+@click.option('--workers', type=int, default=None,
+              help='Worker processes (default: all cores).')
+@click.option('--timeout', type=float, default=600, show_default=True,
+              help='Seconds allowed per neighborhood.')
+@click.option('--window', type=int, default=SEARCH_WINDOW, show_default=True,
+              help='Days of history searched.')
+@click.option('--features-dir',
+              default='../../data/processed/calendar_features',
+              show_default=True,
+              help='Calendar exog store (src/features/build_features.py); '
+                   'built or extended as needed.')
+@stage('order_search')
+def main(workers, timeout, window, features_dir):
+    # Load neighborhood-level crash counts
+    daily_nbhd = pd.read_parquet(
+        '../../data/processed/daily_neighborhood_crashes.parquet')
+    daily_nbhd['crash_date'] = pd.to_datetime(daily_nbhd['crash_date'])
+    series = split_series(daily_nbhd)
+    build_calendar_features(features_dir,
+                            start=daily_nbhd['crash_date'].min(),
+                            end=daily_nbhd['crash_date'].max())
+
+    # Searches with a different window or calendar features are kept apart
+    # from each other's checkpoints
+    checkpoint_dir = (Path('../../models/order_search/checkpoints')
+                      / f'window_{window}' / exog_digest())
+    records = run_fits(
+        series, partial(search_orders, window=window,
+                        features_dir=features_dir),
+        checkpoint_dir, n_workers=workers, timeout=timeout,
+        desc="Searching SARIMA orders"
+    )
+
+    specs = {
+        nbhd: {'order': r['result']['order'],
+               'seasonal_order': r['result']['seasonal_order'],
+               'trend': r['result']['trend']}
+        for nbhd, r in records.items() if r['status'] == 'ok'
+    }
+    stage_rows(rows_in=len(series), rows_out=len(specs))
+    output_file = Path('../../models/order_search/specs.json')
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    output_file.write_text(json.dumps(specs, indent=2, sort_keys=True))
+
+    done = [r['result'] for r in records.values() if r['status'] == 'ok']
+    fitted = sum(result['fitted'] for result in done)
+    pruned = sum(result['pruned'] for result in done)
+    print(f"Specs for {len(specs)} neighborhoods saved to "
+          f"models/order_search/specs.json ({fitted} candidate fits, "
+          f"{pruned} pruned)")
+
+
+if __name__ == "__main__":
+    main()
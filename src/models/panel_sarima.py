@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+# Same specification as the per-neighborhood statsmodels fits: (1,1,1)(1,1,1,7)
+SEASON = 7
+PARAM_NAMES = ['ar.L1', 'ma.L1', 'ar.S.L7', 'ma.S.L7']
+START_PARAMS = np.array([0.1, -0.5, 0.1, -0.5])
+# Keeps the AR part stationary for the initial state covariance
+PARAM_BOUND = 0.999
+FD_STEP = 1e-6
+# Per-observation log-likelihood assigned where the filter breaks down
+BAD_LOGLIKE = 1e3
+# State dimension of the differenced ARMA: max(p, q + 1) with p = q = 8
+STATES = SEASON + 2
+# Covariance change below which the Kalman gain is taken as converged
+GAIN_TOL = 1e-9
+
+HOLDOUT = 365
+MIN_LENGTH = 400
+MIN_MEAN = 0.5
+
+
+def stack_series(series):
+    """ Aligns {key: daily Series} on one calendar as a (days x series) array.
+
+        Days before a series starts are zero and excluded from its likelihood
+        through `start`; days after a series ends are NaN, i.e. missing.
+    """
+    keys = list(series)
+    dates = pd.date_range(min(ts.index[0] for ts in series.values()),
+                          max(ts.index[-1] for ts in series.values()),
+                          freq='D')
+    values = np.full((len(dates), len(keys)), np.nan)
+    start = np.empty(len(keys), dtype=np.int64)
+    for j, key in enumerate(keys):
+        ts = series[key]
+        start[j] = dates.get_loc(ts.index[0])
+        values[:start[j], j] = 0
+        values[start[j]:start[j] + len(ts), j] = ts.to_numpy(dtype=np.float64)
+    return keys, dates, values, start
+
+
+def difference(values):
+    # (1 - L)(1 - L^7) y, aligned so row t is the difference ending at y[t + 8]
+    return values[8:] - values[7:-1] - values[1:-7] + values[:-8]
+
+
+def _state_space(params):
+    """ Harvey-form ARMA(8, 8) of the differenced series for each row of
+        `params`.
+
+        Returns the first column of the transition (AR coefficients) and the
+        selection vector (1 and MA coefficients), both (rows x STATES).
+    """
+    phi, theta, sphi, stheta = params.T
+    ar = np.zeros((len(params), STATES))
+    ma = np.zeros((len(params), STATES))
+    # (1 - phi L)(1 - Phi L^7) and (1 + theta L)(1 + Theta L^7), multiplied out
+    ar[:, 0], ar[:, SEASON - 1], ar[:, SEASON] = phi, sphi, -phi * sphi
+    ma[:, 0], ma[:, 1] = 1, theta
+    ma[:, SEASON], ma[:, SEASON + 1] = stheta, theta * stheta
+    return ar, ma
+
+
+def _transition(ar, m):
+    # T @ m for T = [ar | shifted identity], on (rows x STATES x ...) arrays
+    out = np.zeros_like(m)
+    out[:, :-1] = m[:, 1:]
+    out += ar.reshape(ar.shape + (1,) * (m.ndim - 2)) * m[:, :1]
+    return out
+
+
+def _stationary_cov(ar, ma):
+    # Solves P = T P T' + R R' for every row at once through the Kronecker form
+    n = len(ar)
+    trans = np.zeros((n, STATES, STATES))
+    trans[:, np.arange(STATES - 1), np.arange(1, STATES)] = 1
+    trans[:, :, 0] = ar
+    kron = np.einsum('bij,bkl->bikjl', trans, trans).reshape(
+        n, STATES ** 2, STATES ** 2)
+    rhs = np.einsum('bi,bj->bij', ma, ma).reshape(n, STATES ** 2, 1)
+    cov = np.linalg.solve(np.eye(STATES ** 2) - kron, rhs)
+    return cov.reshape(n, STATES, STATES)
+
+
+def kalman_filter(w, start, params, tol=GAIN_TOL):
+    """ Exact one-step-ahead innovations of the differenced series, all
+        columns at once.
+
+        `w` is (days x columns), `params` is (columns x 4) in PARAM_NAMES
+        order. Rows before a column's `start` are treated as not yet
+        observed. NaN rows are missing: the state is only predicted through
+        them, and their innovation is minus the one-step prediction
+        (0 - prediction). Starting from the stationary covariance, each
+        step's covariance change has rank one, so the gains follow from
+        Chandrasekhar recursions in O(states) per step; once they have
+        converged for every column they are frozen. Returns the innovations,
+        their variances (unit noise variance) and the predicted state after
+        the last row.
+    """
+    ar, ma = _state_space(params)
+    init_cov = _stationary_cov(ar, ma)
+    # (states x columns) layout, so each state row is contiguous
+    ar = np.ascontiguousarray(ar.T)
+
+    # F: innovation variance, tpz: T P Z', and the rank-one factor W M W' of
+    # the next covariance change
+    f0 = init_cov[:, 0, 0]
+    tpz0 = np.ascontiguousarray(_transition(ar.T, init_cov)[:, :, 0].T)
+    f, tpz, fac, scale = f0.copy(), tpz0.copy(), tpz0.copy(), -1 / f0
+
+    state = np.zeros_like(tpz)
+    resid = np.zeros_like(w)
+    var = np.ones_like(w)
+    has_gaps = np.isnan(w).any()
+    steady = False
+    all_live = False
+    for t in range(len(w)):
+        if not all_live:
+            live = t >= start
+            all_live = live.all()
+
+        v = w[t] - state[0]
+        if not all_live:
+            v[~live] = 0
+        resid[t], var[t] = v, f
+        if has_gaps:
+            missing = np.isnan(v)
+            resid[t, missing] = -state[0, missing]
+            v[missing] = 0
+
+        # state <- T state + K v, with K = T P Z' / F
+        head = state[0].copy()
+        state[:-1] = state[1:]
+        state[-1] = 0
+        state += ar * head + tpz * (v / f)
+        if not all_live:
+            state[:, ~live] = 0
+
+        if not steady:
+            z = fac[0].copy()
+            sz = scale * z
+            fac[:-1] = fac[1:]
+            fac[-1] = 0
+            fac += ar * z
+            new_f = f + sz * z
+            tpz += sz * fac
+            step = np.abs(sz).max() * np.abs(fac).max()
+            fac -= tpz * (z / new_f)
+            scale += sz * sz / f
+            f = new_f
+            # Columns not yet started stay at the initial covariance
+            if not all_live:
+                f[~live], scale[~live] = f0[~live], -1 / f0[~live]
+                tpz[:, ~live], fac[:, ~live] = tpz0[:, ~live], tpz0[:, ~live]
+            steady = all_live and step < tol
+    return resid, var, state.T
+
+
+def _valid_mask(w, start):
+    # Rows from each column's start on that are not missing
+    return (np.arange(len(w))[:, None] >= start[None, :]) & ~np.isnan(w)
+
+
+def _loglike_terms(w, start, params):
+    # Exact Gaussian log-likelihood per column with the noise variance
+    # concentrated out
+    resid, var, _ = kalman_filter(w, start, params)
+    valid = _valid_mask(w, start)
+    n_obs = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = np.maximum(
+            np.where(valid, resid ** 2 / var, 0).sum(axis=0) / n_obs, 1e-12)
+        log_var = np.where(valid, np.log(var), 0).sum(axis=0)
+        terms = -0.5 * (n_obs * (np.log(2 * np.pi * sigma2) + 1) + log_var)
+    # Degenerate parameters at the bounds; steer the line search away from them
+    return np.where(np.isfinite(terms), terms, -BAD_LOGLIKE * n_obs)
+
+
+def fit_panel(values, start, shared=False, maxiter=500):
+    """ Fits every column of `values` in one batched optimisation.
+
+        Each likelihood evaluation filters the base parameters and their four
+        finite-difference perturbations together, so the gradient costs one
+        pass. With `shared`, one parameter set is estimated for the whole
+        panel.
+    """
+    w = difference(values)
+    n_rows, n_series = w.shape
+    n_params = len(PARAM_NAMES)
+    # Per-observation scale for each optimised series, as statsmodels uses
+    scale = _valid_mask(w, start).sum() / (1 if shared else n_series)
+
+    # Base + one perturbed copy per parameter, stacked side by side
+    w_rep = np.tile(w, n_params + 1)
+    start_rep = np.tile(start, n_params + 1)
+    bump = np.repeat(np.vstack([np.zeros(n_params),
+                                np.eye(n_params) * FD_STEP]),
+                     n_series, axis=0)
+
+    def objective(x):
+        params = np.broadcast_to(x.reshape(-1, n_params),
+                                 (n_series, n_params))
+        terms = _loglike_terms(w_rep, start_rep,
+                               np.tile(params, (n_params + 1, 1)) + bump)
+        terms = terms.reshape(n_params + 1, n_series)
+        grad = (terms[1:] - terms[0]) / FD_STEP
+        grad = grad.sum(axis=1) if shared else grad.T.ravel()
+        return -terms[0].sum() / scale, -grad / scale
+
+    x0 = START_PARAMS if shared else np.tile(START_PARAMS, n_series)
+    result = minimize(objective, x0, jac=True, method='L-BFGS-B',
+                      bounds=[(-PARAM_BOUND, PARAM_BOUND)] * len(x0),
+                      options={'maxiter': maxiter})
+
+    params = np.broadcast_to(result.x.reshape(-1, n_params),
+                             (n_series, n_params)).copy()
+    return params, result
+
+
+def forecast_panel(values, start, params, horizon):
+    """ Mean forecasts (horizon x series) for the `horizon` days after the
+        last row, continuing series that ended earlier through their missing
+        days.
+    """
+    w = difference(values)
+    ar, _ = _state_space(params)
+    resid, _, state = kalman_filter(w, start, params)
+
+    # Missing days take their one-step predictions (-resid there),
+    # undifferenced
+    lags = SEASON + 1
+    values = values.copy()
+    for t in np.flatnonzero(np.isnan(values[lags:]).any(axis=1)) + lags:
+        missing = np.isnan(values[t])
+        values[t, missing] = (-resid[t - lags, missing]
+                              + values[t - 1, missing]
+                              + values[t - SEASON, missing]
+                              - values[t - lags, missing])
+
+    # Future innovations are zero: roll the predicted state forward, then undo
+    # the (1 - L)(1 - L^7) difference
+    y = np.vstack([values[-lags:], np.zeros((horizon, values.shape[1]))])
+    for t in range(lags, lags + horizon):
+        y[t] = state[:, 0] + y[t - 1] + y[t - SEASON] - y[t - SEASON - 1]
+        state = _transition(ar, state[:, :, None])[:, :, 0]
+    return y[lags:]
+
+
+def evaluate_panel(series, shared=False, holdout=HOLDOUT):
+    """ Holdout MAE/RMSE for every neighborhood from one batched fit.
+
+        Applies the same skip rules and last-`holdout`-days split as
+        `evaluate_neighborhood`, and returns the same {'mae', 'rmse'} records.
+    """
+    # Skip neighborhoods with too little data or too little activity
+    series = {k: ts for k, ts in series.items()
+              if len(ts) >= MIN_LENGTH and ts.mean() >= MIN_MEAN}
+    if not series:
+        return {}
+
+    keys, _, values, start = stack_series(series)
+    train, test = values[:-holdout], values[-holdout:]
+    params, _ = fit_panel(train, start, shared=shared)
+    forecast = forecast_panel(train, start, params, horizon=len(test))
+
+    # Scored on the days each series has; one that ended before the holdout
+    # is left out
+    observed = ~np.isnan(test)
+    errors = np.where(observed, forecast - np.nan_to_num(test), 0)
+    n_obs = observed.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mae = np.abs(errors).sum(axis=0) / n_obs
+        rmse = np.sqrt((errors ** 2).sum(axis=0) / n_obs)
+    return {key: {'mae': float(mae[j]), 'rmse': float(rmse[j])}
+            for j, key in enumerate(keys) if n_obs[j]}
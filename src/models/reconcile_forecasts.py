@@ -0,0 +1,165 @@
+import click
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from src.features.build_timeseries_features import load_borough_lookup
+from src.instrumentation import stage, stage_rows
+from src.models.forecast_store import CITY_KEY, STORE_COLUMNS, borough_key
+
+# Normal quantile of the store's 95% bands
+Z_95 = 1.959963984540054
+# Variance given to aggregate levels with no base forecast for a date, so they
+# leave the neighborhood forecasts untouched there
+NO_BASE_VARIANCE = 1e12
+
+
+def summing_matrix(neighborhoods, borough_lookup):
+    """ Rows: city, each borough, each neighborhood. Columns: neighborhoods.
+
+        Neighborhoods missing from the lookup only roll up into the city.
+    """
+    boroughs = sorted({borough_lookup[n] for n in neighborhoods
+                       if n in borough_lookup})
+    keys = ([CITY_KEY] + [borough_key(b) for b in boroughs]
+            + list(neighborhoods))
+    member = np.array([[borough_lookup.get(n) == b for n in neighborhoods]
+                       for b in boroughs], dtype=float)
+    summing = np.vstack([np.ones((1, len(neighborhoods))),
+                         member.reshape(-1, len(neighborhoods)),
+                         np.eye(len(neighborhoods))])
+    return keys, summing
+
+
+def _pivot(store, keys, dates, column):
+    frame = store[store['key'].isin(keys)].pivot(index='date', columns='key',
+                                                 values=column)
+    return frame.reindex(index=dates, columns=keys).to_numpy(dtype=np.float64)
+
+
+def reconcile(base_mean, base_var, agg_mean, agg_var, aggregation):
+    """ MinT with a diagonal (forecast-variance) weight matrix, one horizon
+        step per row.
+
+        `base_*` are (steps x neighborhoods); `agg_*` are base forecasts for
+        the rows of `aggregation` (steps x aggregates), NaN where there is
+        none. Each neighborhood absorbs a share of every aggregate's
+        disagreement proportional to its own variance. Returns the reconciled
+        neighborhood means along with A D and (V + A D A')^-1 A D, from which
+        the reconciled variances follow.
+    """
+    missing = np.isnan(agg_mean)
+    agg_var = np.where(missing, NO_BASE_VARIANCE, agg_var)
+    gap = np.where(missing, 0, agg_mean - base_mean @ aggregation.T)
+
+    diag = np.arange(len(aggregation))
+    ad = base_var[:, None, :] * aggregation[None]      # A D, per step
+    inner = np.einsum('sij,kj->sik', ad, aggregation)   # A D A'
+    inner[:, diag, diag] += agg_var
+    solved = np.linalg.solve(inner, ad)                  # (V + A D A')^-1 A D
+
+    mean = base_mean + np.einsum('sik,si->sk', solved, gap)
+    return mean, ad, solved
+
+
+def _row_variances(summing, base_var, ad, solved):
+    # Var(s'b) = s' D s - (A D s)' (V + A D A')^-1 (A D s) for every summing
+    # row s
+    own = base_var @ (summing ** 2).T
+    shared = (np.einsum('skn,mn->skm', ad, summing)
+              * np.einsum('skn,mn->skm', solved, summing))
+    return own - shared.sum(axis=1)
+
+
+def _bands(mean, var):
+    sd = np.sqrt(np.maximum(var, 0))
+    return mean - Z_95 * sd, mean + Z_95 * sd
+
+
+@stage('reconcile_forecasts')
+def reconcile_store(store, borough_lookup, method='bottom_up'):
+    """ Coherent city, borough and neighborhood forecasts from one store.
+
+        'bottom_up' sums the neighborhood forecasts; 'mint' also uses the
+        city forecast where its dates overlap, reconciled by variance. Bands
+        assume independent neighborhood base errors.
+    """
+    neighborhoods = sorted(k for k in store['key'].unique() if k != CITY_KEY)
+    keys, summing = summing_matrix(neighborhoods, borough_lookup)
+    aggregation = summing[:-len(neighborhoods)]
+
+    # The store aligns every neighborhood to one last day, so they share their
+    # forecast dates; anything else would mix horizons within a step
+    nbhd_rows = store[store['key'].isin(neighborhoods)]
+    dates = pd.DatetimeIndex(np.sort(nbhd_rows['date'].unique()))
+    if (nbhd_rows.groupby('key')['date'].nunique() != len(dates)).any():
+        raise ValueError("neighborhood forecasts cover different dates; "
+                         "rebuild the forecast store")
+    base_mean = np.nan_to_num(_pivot(store, neighborhoods, dates, 'mean'))
+    base_var = np.nan_to_num(
+        ((_pivot(store, neighborhoods, dates, 'upper')
+          - _pivot(store, neighborhoods, dates, 'lower')) / (2 * Z_95)) ** 2)
+
+    agg_mean = np.full((len(dates), len(aggregation)), np.nan)
+    agg_var = np.full_like(agg_mean, np.nan)
+    if method == 'mint':
+        city_dates = store.loc[store['key'] == CITY_KEY, 'date']
+        if not city_dates.isin(dates).any():
+            raise ValueError("'mint' needs a city forecast over the "
+                             "neighborhood forecast dates; retrain the city "
+                             "model on the same data as the forecast store")
+        agg_mean[:, 0] = _pivot(store, [CITY_KEY], dates, 'mean')[:, 0]
+        agg_var[:, 0] = ((_pivot(store, [CITY_KEY], dates, 'upper')[:, 0]
+                          - _pivot(store, [CITY_KEY], dates, 'lower')[:, 0])
+                         / (2 * Z_95)) ** 2
+
+    mean, ad, solved = reconcile(base_mean, base_var, agg_mean, agg_var,
+                                 aggregation)
+    var = _row_variances(summing, base_var, ad, solved)
+    all_mean = mean @ summing.T
+    lower, upper = _bands(all_mean, var)
+
+    model_version = store['model_version'].iloc[0]
+    steps = np.arange(1, len(dates) + 1)
+    frames = [
+        pd.DataFrame({'key': key, 'model_version': model_version,
+                      'step': steps, 'date': dates, 'mean': all_mean[:, i],
+                      'lower': lower[:, i], 'upper': upper[:, i]})
+        for i, key in enumerate(keys)
+    ]
+    out = pd.concat(frames, ignore_index=True)
+    stage_rows(rows_in=len(store), rows_out=len(out))
+    out = out.astype({'step': 'int16', 'mean': 'float32',
+                      'lower': 'float32', 'upper': 'float32'})
+    return out[STORE_COLUMNS]
+
+
+def reconcile_forecasts(store_file: str, geojson_file: str, output_file: str,
+                        method='bottom_up'):
+    store = pd.read_parquet(store_file)
+    borough_lookup = load_borough_lookup(geojson_file)
+
+    reconciled = reconcile_store(store, borough_lookup, method=method)
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    reconciled.to_parquet(output_file, index=False)
+    print(f"Reconciled ({method}) city, borough and neighborhood forecasts "
+          f"saved to {output_file}")
+
+
+@click.command()
+@click.option('--method', type=click.Choice(['bottom_up', 'mint']),
+              default='bottom_up', show_default=True,
+              help="'mint' also draws on the separately fitted city "
+                   "forecast.")
+def main(method):
+    reconcile_forecasts(
+        store_file='../../models/forecast_store/forecasts.parquet',
+        geojson_file='../../data/external/neighborhoods.geojson',
+        output_file='../../models/forecast_store/reconciled_forecasts.parquet',
+        method=method
+    )
+
+
+if __name__ == "__main__":
+    main()
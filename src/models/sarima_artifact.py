@@ -0,0 +1,138 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# State-space matrices kept from the fitted model; all time-invariant for
+# SARIMA, except obs_intercept, which carries the exog regression, and
+# state_intercept, which carries the trend; both are rebuilt from the
+# coefficients when forecasting
+MATRICES = ['design', 'obs_intercept', 'obs_cov', 'transition',
+            'state_intercept', 'selection', 'state_cov']
+
+
+class SarimaArtifact:
+    """ Fitted SARIMA reduced to what a forecast needs: parameters, the system
+        matrices, and the one-step-ahead state mean and covariance after the
+        last observation. Saved as a plain .npz, so loading it runs no pickle
+        and imports no statsmodels.
+    """
+
+    def __init__(self, params, param_names, order, seasonal_order, first_obs,
+                 last_obs, fitted_on, state, predicted_cov, exog_columns=(),
+                 trend_powers=(), trend_start=0, trend_state=0, **matrices):
+        self.params = np.asarray(params, dtype=np.float64)
+        self.param_names = [str(n) for n in param_names]
+        self.order = [int(x) for x in order]
+        self.seasonal_order = [int(x) for x in seasonal_order]
+        self.first_obs = pd.Timestamp(str(first_obs))
+        self.last_obs = pd.Timestamp(str(last_obs))
+        self.fitted_on = pd.Timestamp(str(fitted_on))
+        self.state = np.asarray(state, dtype=np.float64)
+        self.predicted_cov = np.asarray(predicted_cov, dtype=np.float64)
+        self.exog_columns = [str(c) for c in exog_columns]
+        # Trend term k is params[i] * t**k for the i-th power, with t counted
+        # from trend_start on the first forecast day, added to state
+        # `trend_state`
+        self.trend_powers = [int(k) for k in trend_powers]
+        self.trend_start = int(trend_start)
+        self.trend_state = int(trend_state)
+        self.matrices = {name: np.asarray(matrices[name], dtype=np.float64)
+                         for name in MATRICES}
+
+    @classmethod
+    def from_results(cls, results, fitted_on):
+        # `results` is a SARIMAXResults; predicted_state[:, -1] is the state
+        # for the day after the data
+        model = results.model
+        filtered = results.filter_results
+        index = pd.DatetimeIndex(model._index)
+        if model.k_trend and model.hamilton_representation:
+            raise ValueError("a trend in the Hamilton representation cannot "
+                             "be exported")
+        trend_powers = []
+        if model.k_trend:
+            trend_powers = np.flatnonzero(model.polynomial_trend)
+        return cls(
+            params=results.params, param_names=model.param_names,
+            order=model.order, seasonal_order=model.seasonal_order,
+            first_obs=index[0].date(), last_obs=index[-1].date(),
+            fitted_on=pd.Timestamp(fitted_on).date(),
+            state=filtered.predicted_state[:, -1],
+            predicted_cov=filtered.predicted_state_cov[:, :, -1],
+            exog_columns=model.exog_names or [],
+            trend_powers=trend_powers,
+            trend_start=model.trend_offset + model.nobs,
+            trend_state=model._k_states_diff,
+            # statsmodels keeps a trailing time axis on every system matrix
+            **{name: np.asarray(getattr(filtered, name))[..., -1]
+               for name in MATRICES}
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(**{key: npz[key] for key in npz.files})
+
+    def save(self, path):
+        np.savez(
+            path,
+            params=self.params, param_names=np.array(self.param_names),
+            order=np.array(self.order),
+            seasonal_order=np.array(self.seasonal_order),
+            first_obs=np.array(str(self.first_obs.date())),
+            last_obs=np.array(str(self.last_obs.date())),
+            fitted_on=np.array(str(self.fitted_on.date())),
+            state=self.state, predicted_cov=self.predicted_cov,
+            exog_columns=np.array(self.exog_columns, dtype=str),
+            trend_powers=np.array(self.trend_powers, dtype=int),
+            trend_start=self.trend_start, trend_state=self.trend_state,
+            **self.matrices
+        )
+
+    def forecast(self, steps, alpha=0.05, exog=None):
+        """ Mean and (1 - alpha) bands for the `steps` days after `last_obs`,
+            by running the Kalman prediction recursion without observations.
+            A model fitted with exog needs `exog` for those days, as a
+            DataFrame holding (at least) its `exog_columns`.
+        """
+        m = self.matrices
+        Z, T, R = m['design'], m['transition'], m['selection']
+        RQR = R @ m['state_cov'] @ R.T
+        a, P = self.state, self.predicted_cov
+
+        if self.exog_columns:
+            if exog is None:
+                raise ValueError("model was fitted with exog "
+                                 f"{self.exog_columns}; pass exog for the "
+                                 "forecast days")
+            beta = self.params[[self.param_names.index(c)
+                                for c in self.exog_columns]]
+            x = np.asarray(exog[self.exog_columns], dtype=np.float64)
+            intercept = x[:steps] @ beta
+        else:
+            intercept = np.repeat(m['obs_intercept'][0], steps)
+
+        # Trend parameters come first in a SARIMAX parameter vector
+        t = self.trend_start + np.arange(steps, dtype=np.float64)
+        trend = (np.power.outer(t, self.trend_powers)
+                 @ self.params[:len(self.trend_powers)])
+        state_intercept = np.repeat(m['state_intercept'][None, :], steps,
+                                    axis=0)
+        if self.trend_powers:
+            state_intercept[:, self.trend_state] = trend
+
+        mean = np.empty(steps)
+        var = np.empty(steps)
+        for h in range(steps):
+            mean[h] = (Z @ a)[0] + intercept[h]
+            var[h] = (Z @ P @ Z.T + m['obs_cov'])[0, 0]
+            a = T @ a + state_intercept[h]
+            P = T @ P @ T.T + RQR
+
+        z = NormalDist().inv_cdf(1 - alpha / 2)
+        width = z * np.sqrt(np.maximum(var, 0))
+        dates = pd.date_range(self.last_obs + pd.Timedelta(days=1),
+                              periods=steps, freq='D')
+        return pd.DataFrame({'mean': mean, 'lower': mean - width,
+                             'upper': mean + width}, index=dates)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import re
+import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from tqdm import tqdm
+
+
+class FitTimeout(Exception):
+    pass
+
+
+def split_series(daily, key_col='neighborhood', date_col='crash_date',
+                 value_col='total_crashes', end=None):
+    # One groupby pass instead of re-filtering the full frame for every key.
+    # With `end`, every series runs to that day (days without crashes are
+    # zero), so keys whose last crash came earlier still forecast the same
+    # dates
+    series = {}
+    for key, group in daily.groupby(key_col, sort=True):
+        ts = group.set_index(date_col)[value_col].sort_index()
+        if end is not None:
+            ts = ts.reindex(pd.date_range(ts.index[0], end, freq='D'))
+        series[key] = ts.asfreq('D').fillna(0)
+    return series
+
+
+def checkpoint_path(checkpoint_dir, key):
+    # NTA names contain spaces, dashes and parentheses; keep filenames safe
+    # and unique
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', str(key)).strip('_')[:60]
+    digest = hashlib.sha1(str(key).encode('utf-8')).hexdigest()[:8]
+    return Path(checkpoint_dir) / f"{slug}-{digest}.json"
+
+
+def series_fingerprint(ts):
+    # Changes whenever new days arrive or history is revised, so stale fits
+    # are redone
+    hashed = pd.util.hash_pandas_object(ts, index=True).values
+    return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+
+def fit_fingerprint(ts, setup=None):
+    # The series plus how it is fitted (its orders, say), so changing one key's
+    # setup redoes that key's fit alone
+    fingerprint = series_fingerprint(ts)
+    if setup is not None:
+        encoded = json.dumps(setup, sort_keys=True).encode('utf-8')
+        fingerprint += '-' + hashlib.sha1(encoded).hexdigest()[:12]
+    return fingerprint
+
+
+def load_checkpoints(checkpoint_dir):
+    records = {}
+    for path in Path(checkpoint_dir).glob('*.json'):
+        try:
+            record = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # A half-written file from a killed run; the fit will simply be
+            # redone
+            continue
+        records[record['key']] = record
+    return records
+
+
+def _write_checkpoint(checkpoint_dir, record):
+    path = checkpoint_path(checkpoint_dir, record['key'])
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(record))
+    os.replace(tmp, path)
+
+
+def _on_alarm(signum, frame):
+    raise FitTimeout()
+
+
+def _run_fit(fit_fn, key, ts, timeout, fingerprint, kwargs=None):
+    # Runs inside a worker process. SIGALRM is only available on POSIX;
+    # elsewhere the timeout is not enforced.
+    record = {'key': key, 'fingerprint': fingerprint, 'status': None,
+              'result': None, 'error': None}
+    use_alarm = timeout and hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        record['result'] = fit_fn(key, ts, **(kwargs or {}))
+        record['status'] = 'ok' if record['result'] is not None else 'skipped'
+    except FitTimeout:
+        record.update(status='timeout', error=f"exceeded {timeout}s")
+    except Exception as e:
+        record.update(status='failed', error=str(e))
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return record
+
+
+def run_fits(series_by_key, fit_fn, checkpoint_dir, n_workers=None,
+             timeout=None, retry_failed=False, desc="Fitting models",
+             task_kwargs=None, task_setup=None):
+    """ Fits `fit_fn(key, ts)` for every series on a process pool.
+
+        Each finished fit is written to `checkpoint_dir` straight away, and
+        keys whose checkpoint matches the current series are not refitted, so
+        an interrupted run resumes where it stopped. `fit_fn` must be a
+        module-level function returning a JSON-serialisable dict, or None to
+        mark the key as skipped. `task_kwargs` maps a key to extra keyword
+        arguments for its own fit only, so per-key state is not shipped to
+        every task. `task_setup` maps a key to a JSON-serialisable
+        description of how it is fitted, which is part of its checkpoint
+        fingerprint.
+    """
+    Path(checkpoint_dir).mkdir(parents=True, exist_ok=True)
+    fingerprints = {key: fit_fingerprint(ts, (task_setup or {}).get(key))
+                    for key, ts in series_by_key.items()}
+    records = {
+        key: record
+        for key, record in load_checkpoints(checkpoint_dir).items()
+        if fingerprints.get(key) == record.get('fingerprint')
+    }
+    if retry_failed:
+        records = {k: r for k, r in records.items()
+                   if r['status'] not in ('failed', 'timeout')}
+
+    pending = [key for key in series_by_key if key not in records]
+    if records:
+        print(f"Resuming: {len(records)} checkpoints found, "
+              f"{len(pending)} fits left")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futures = [
+                pool.submit(_run_fit, fit_fn, key, series_by_key[key],
+                            timeout, fingerprints[key],
+                            (task_kwargs or {}).get(key))
+                for key in pending
+            ]
+            for future in tqdm(as_completed(futures), total=len(futures),
+                               desc=desc):
+                record = future.result()
+                _write_checkpoint(checkpoint_dir, record)
+                records[record['key']] = record
+                if record['status'] in ('failed', 'timeout'):
+                    print(f"Failed on {record['key']}: {record['error']}")
+
+    return {key: records[key] for key in series_by_key if key in records}
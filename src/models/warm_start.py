@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+# Full MLE refit at least this often (days since the last fit)
+REFIT_EVERY_DAYS = 28
+# RMS of standardized one-step-ahead errors on the new days; ~1 when the
+# model still fits
+DRIFT_THRESHOLD = 2.0
+
+
+def refit_due(fitted_on, refit_every=REFIT_EVERY_DAYS, today=None):
+    today = pd.Timestamp(today or pd.Timestamp.today().date())
+    return (today - pd.Timestamp(fitted_on)).days >= refit_every
+
+
+def drift_score(results, since):
+    """ RMS standardized one-step-ahead forecast error over observations after
+        `since`, from a results object whose parameters were held fixed.
+    """
+    index = pd.DatetimeIndex(results.model._index)
+    errors = results.filter_results.standardized_forecasts_error[0]
+    errors = errors[index > pd.Timestamp(since)]
+    errors = errors[np.isfinite(errors)]
+    if not len(errors):
+        return 0.0
+    return float(np.sqrt(np.mean(errors ** 2)))
@@ -0,0 +1,367 @@
+import ast
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import click
+
+from src.instrumentation import log_event
+
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+STATE_FILE = PROJECT_DIR / 'data/interim/pipeline_state.json'
+
+RAW_STORE = PROJECT_DIR / 'data/raw/collisions'
+INTERIM_CRASHES = PROJECT_DIR / 'data/interim/crashes.csv'
+GEOJSON = PROJECT_DIR / 'data/external/neighborhoods.geojson'
+PROCESSED_DIR = PROJECT_DIR / 'data/processed'
+CRASH_STORE = PROCESSED_DIR / 'crashes'
+DAILY_CITY = PROCESSED_DIR / 'daily_city_crashes.parquet'
+DAILY_NBHD = PROCESSED_DIR / 'daily_neighborhood_crashes.parquet'
+CITY_MODEL = PROJECT_DIR / 'models/crash_count_forecast/sarima_model.npz'
+FORECAST_STORE = PROJECT_DIR / 'models/forecast_store/forecasts.parquet'
+RECONCILED = PROJECT_DIR / 'models/forecast_store/reconciled_forecasts.parquet'
+SPECS = PROJECT_DIR / 'models/order_search/specs.json'
+# Extended by the training stages themselves as new days arrive
+CALENDAR_FEATURES = PROCESSED_DIR / 'calendar_features'
+
+HASH_BLOCK = 1 << 20
+# Top-level packages whose modules count as stage code
+PROJECT_PACKAGES = ('src',)
+
+
+class Stage:
+    """ One step of the pipeline. `fn` is a 'module:function' path, imported
+        only in the worker that runs it, and called with `args`. The stage's
+        fingerprint covers the contents of `inputs`, the source of `fn`'s
+        module and every src module it imports, and `args`; a stage whose
+        fingerprint is unchanged and whose `outputs` all exist is skipped.
+        Upstream stages are the ones whose outputs this stage reads.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), args=None,
+                 volatile=False):
+        self.name = name
+        self.fn = fn
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.args = args or {}
+        self.module = fn.split(':')[0]
+        # Reads the outside world, so the fingerprint can't tell when it is
+        # stale; runs only when asked for
+        self.volatile = volatile
+
+    def reads_from(self, other):
+        return any(i == o or o in i.parents or i in o.parents
+                   for i in self.inputs for o in other.outputs)
+
+
+STAGES = [
+    Stage('download',
+          'src.data.nyc_motor_vehicle_collisions:download_incremental',
+          outputs=[RAW_STORE], args={'store_dir': RAW_STORE}, volatile=True),
+    Stage('clean', 'src.data.make_dataset:clean_collisions',
+          inputs=[RAW_STORE], outputs=[INTERIM_CRASHES],
+          args={'input_path': RAW_STORE, 'output_file': INTERIM_CRASHES,
+                'street_cache':
+                    PROJECT_DIR / 'data/interim/street_names.json'}),
+    Stage('spatial_join',
+          'src.features.nyc_motor_vehicle_collisions.create_crashes:'
+          'create_crashes',
+          inputs=[INTERIM_CRASHES, GEOJSON], outputs=[CRASH_STORE],
+          args={'input_file': INTERIM_CRASHES, 'output_dir': CRASH_STORE,
+                'geojson_file': GEOJSON,
+                'index_cache':
+                    PROJECT_DIR / 'data/interim/neighborhood_index.npz'}),
+    Stage('aggregate',
+          'src.features.build_timeseries_features:build_timeseries_features',
+          inputs=[CRASH_STORE, GEOJSON],
+          outputs=[DAILY_CITY, DAILY_NBHD,
+                   PROCESSED_DIR / 'daily_borough_crashes.parquet',
+                   PROCESSED_DIR / 'hour_of_week_crashes.parquet',
+                   PROCESSED_DIR / 'daily_neighborhood_cube.npz'],
+          args={'input_file': CRASH_STORE, 'output_dir': PROCESSED_DIR,
+                'geojson_file': GEOJSON}),
+    Stage('geometry',
+          'src.features.build_neighborhood_geometry:'
+          'build_neighborhood_geometry',
+          inputs=[GEOJSON], outputs=[PROCESSED_DIR / 'neighborhood_geometry'],
+          args={'geojson_file': GEOJSON,
+                'output_dir': PROCESSED_DIR / 'neighborhood_geometry'}),
+    Stage('train_city', 'src.models.forecast_crash_counts:train_city_model',
+          inputs=[DAILY_CITY], outputs=[CITY_MODEL],
+          args={'daily_city_file': DAILY_CITY, 'model_file': CITY_MODEL,
+                'mode': 'auto', 'features_dir': CALENDAR_FEATURES}),
+    Stage('forecast_store',
+          'src.models.build_forecast_store:build_forecast_store',
+          inputs=[DAILY_NBHD, CITY_MODEL, SPECS], outputs=[FORECAST_STORE],
+          args={'daily_nbhd_file': DAILY_NBHD, 'city_model_file': CITY_MODEL,
+                'output_file': FORECAST_STORE,
+                'checkpoint_dir':
+                    PROJECT_DIR / 'models/forecast_store/checkpoints',
+                'specs_file': SPECS, 'features_dir': CALENDAR_FEATURES}),
+    Stage('reconcile', 'src.models.reconcile_forecasts:reconcile_forecasts',
+          inputs=[FORECAST_STORE, GEOJSON], outputs=[RECONCILED],
+          args={'store_file': FORECAST_STORE, 'geojson_file': GEOJSON,
+                'output_file': RECONCILED}),
+]
+
+
+# ─── Fingerprints ────────────────────────────────────────────────────────────
+
+def _relative(path):
+    path = Path(path)
+    if path.is_relative_to(PROJECT_DIR):
+        return path.relative_to(PROJECT_DIR).as_posix()
+    return str(path)
+
+
+def file_digest(path, cache):
+    """ sha1 of a file's contents. `cache` maps path -> [size, mtime_ns,
+        digest], so only files that changed since the last run are read
+        again.
+    """
+    st = path.stat()
+    key = _relative(path)
+    cached = cache.get(key)
+    if cached and cached[:2] == [st.st_size, st.st_mtime_ns]:
+        return cached[2]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK):
+            digest.update(block)
+    cache[key] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def path_digest(path, cache):
+    # Directories hash their visible files; dot-files are temp or
+    # bookkeeping files
+    path = Path(path)
+    if path.is_file():
+        return file_digest(path, cache)
+    if not path.is_dir():
+        return 'missing'
+    digest = hashlib.sha1()
+    for f in sorted(path.rglob('*')):
+        rel = f.relative_to(path)
+        hidden = any(part.startswith('.') for part in rel.parts)
+        if f.is_file() and not hidden:
+            digest.update(
+                f"{rel.as_posix()}:{file_digest(f, cache)}\n".encode())
+    return digest.hexdigest()
+
+
+def module_file(module):
+    # Source file of a project module, found without importing it (and its
+    # heavy dependencies)
+    base = PROJECT_DIR.joinpath(*module.split('.'))
+    for path in (base.with_suffix('.py'), base / '__init__.py'):
+        if path.is_file():
+            return path
+    return None
+
+
+def _imported_names(tree):
+    # Every absolute import anywhere in the module, including function-level
+    # ones; `from a import b` may name a module a.b, so both are candidates
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif (isinstance(node, ast.ImportFrom) and node.level == 0
+              and node.module):
+            yield node.module
+            yield from (f"{node.module}.{alias.name}" for alias in node.names)
+
+
+def stage_modules(module):
+    """ `module` and every src module it imports, directly or through other
+        src modules, read from their sources with ast.
+    """
+    found, pending = set(), [module]
+    while pending:
+        name = pending.pop()
+        path = module_file(name)
+        if name in found or path is None:
+            continue
+        found.add(name)
+        tree = ast.parse(path.read_text(), str(path))
+        pending.extend(n for n in _imported_names(tree)
+                       if n.split('.')[0] in PROJECT_PACKAGES)
+    return sorted(found)
+
+
+def code_digest(module):
+    return hashlib.sha1(module_file(module).read_bytes()).hexdigest()
+
+
+def fingerprint(stage, cache):
+    payload = {
+        'code': {m: code_digest(m) for m in stage_modules(stage.module)},
+        'args': {k: _relative(v) if isinstance(v, Path) else v
+                 for k, v in stage.args.items()},
+        'inputs': {_relative(p): path_digest(p, cache)
+                   for p in stage.inputs},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def load_state(path=STATE_FILE):
+    if not Path(path).exists():
+        return {'stages': {}, 'files': {}}
+    return json.loads(Path(path).read_text())
+
+
+def save_state(state, path=STATE_FILE):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(path).with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(tmp, path)
+
+
+# ─── Scheduling ──────────────────────────────────────────────────────────────
+
+def upstream(stages):
+    return {s.name: [u.name for u in stages if u is not s and s.reads_from(u)]
+            for s in stages}
+
+
+def select(stages, targets):
+    # The targets and everything they read from, in pipeline order
+    deps = upstream(stages)
+    wanted = set()
+    todo = list(targets or [s.name for s in stages])
+    while todo:
+        name = todo.pop()
+        if name not in deps:
+            raise click.BadParameter(
+                f"unknown stage '{name}' (stages: {', '.join(deps)})")
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(deps[name])
+    return [s for s in stages if s.name in wanted]
+
+
+def _run_stage(fn, args):
+    module, name = fn.split(':')
+    kwargs = {k: str(v) if isinstance(v, Path) else v
+              for k, v in args.items()}
+    return getattr(importlib.import_module(module), name)(**kwargs)
+
+
+def _upstream_done(stage, status, deps, dry_run):
+    """ Whether every stage `stage` reads from has finished. A stage below a
+        failed, blocked or (in a dry run) pending one is marked and never
+        becomes ready.
+    """
+    upstream_status = [status[d] for d in deps[stage.name] if d in status]
+    if any(u in ('failed', 'blocked', 'pending') for u in upstream_status):
+        status[stage.name] = 'pending' if dry_run else 'blocked'
+        return False
+    return all(u in ('ok', 'skipped') for u in upstream_status)
+
+
+def _needs_run(stage, state, force, download):
+    # (whether the stage has to run, the fingerprint to record if it does)
+    if stage.volatile:
+        stale, fp = download, None
+    else:
+        fp = fingerprint(stage, state['files'])
+        previous = state['stages'].get(stage.name, {}).get('fingerprint')
+        outputs_exist = all(p.exists() for p in stage.outputs)
+        stale = fp != previous or not outputs_exist
+    forced = stage.name in force or ('all' in force and not stage.volatile)
+    return stale or forced, fp
+
+
+def _record(future, stage, fp, state, state_file):
+    # Status of a finished stage; only a successful one keeps its fingerprint
+    try:
+        future.result()
+    except Exception as e:
+        log_event('pipeline_stage', stage=stage.name, status='failed',
+                  error=repr(e))
+        return 'failed'
+    # The fingerprint taken before the run, so inputs changed meanwhile
+    # still count as new
+    state['stages'][stage.name] = {'fingerprint': fp}
+    save_state(state, state_file)
+    log_event('pipeline_stage', stage=stage.name, status='ok')
+    return 'ok'
+
+
+def run_pipeline(stages, force=(), download=False, jobs=2, dry_run=False,
+                 state_file=STATE_FILE):
+    """ Runs `stages` in dependency order, up to `jobs` at once, skipping the
+        ones whose fingerprint matches the last successful run. A failed stage
+        blocks its downstream stages but not independent branches.
+        Returns {stage: 'ok' | 'skipped' | 'failed' | 'blocked' | 'pending'}.
+    """
+    state = load_state(state_file)
+    # Forget files that are gone, such as replaced partitions
+    state['files'] = {k: v for k, v in state['files'].items()
+                      if (PROJECT_DIR / k).exists()}
+    deps = upstream(stages)
+    status = {s.name: None for s in stages}
+    running = {}
+
+    def start(s, pool):
+        needed, fp = _needs_run(s, state, force, download)
+        if not needed:
+            status[s.name] = 'skipped'
+            log_event('pipeline_stage', stage=s.name, status='skipped')
+        elif dry_run:
+            status[s.name] = 'pending'
+            print(f"would run {s.name}")
+        else:
+            status[s.name] = 'running'
+            running[pool.submit(_run_stage, s.fn, s.args)] = (s, fp)
+            log_event('pipeline_stage', stage=s.name, status='started')
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            for s in stages:
+                if (status[s.name] is None
+                        and _upstream_done(s, status, deps, dry_run)):
+                    start(s, pool)
+            # Stages are listed upstream first, so one pass settles all but
+            # those waiting on a running stage
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                s, fp = running.pop(future)
+                status[s.name] = _record(future, s, fp, state, state_file)
+    return status
+
+
+@click.command()
+@click.argument('targets', nargs=-1)
+@click.option('--download', is_flag=True,
+              help='Fetch new and changed collisions from NYC Open Data '
+                   'first.')
+@click.option('--force', multiple=True,
+              help="Rerun this stage even if it is up to date; 'all' for "
+                   "every stage but download.")
+@click.option('--jobs', type=int, default=2, show_default=True,
+              help='Stages run at once.')
+@click.option('--dry-run', is_flag=True,
+              help='List the stages that would run.')
+def main(targets, download, force, jobs, dry_run):
+    """ Runs the pipeline up to TARGETS (default: every stage):
+        download → clean → spatial_join → aggregate → train_city
+        → forecast_store → reconcile, with geometry as an independent branch.
+    """
+    status = run_pipeline(select(STAGES, targets), force=force,
+                          download=download, jobs=jobs, dry_run=dry_run)
+    for name, result in status.items():
+        print(f"{name:16s} {result}")
+    if any(result in ('failed', 'blocked') for result in status.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
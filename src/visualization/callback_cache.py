@@ -0,0 +1,162 @@
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+MAX_BYTES = 64 * 1024 * 1024
+TTL_SECONDS = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT,
+                                    size INTEGER, created REAL, used REAL);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, hits INTEGER,
+                                  misses INTEGER);
+"""
+
+
+def normalize_date(value):
+    # The date picker sends '2021-04-22' or '2021-04-22T00:00:00' for the
+    # same day
+    return None if value is None else pd.Timestamp(value).date().isoformat()
+
+
+def normalize_choice(value):
+    # A cleared dropdown can arrive as None or ''
+    return value or None
+
+
+def data_version(*paths, extra=''):
+    """ Fingerprint of the files a dashboard reads (path, size, mtime) plus
+        `extra`, e.g. the forecast model version. Part of every cache key, so
+        rebuilt data or a new model never serves old outputs.
+    """
+    parts = [str(extra)]
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path}:missing")
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def encode(value):
+    # Plotly's encoder is imported on first use, so loading the cache doesn't
+    # load plotly
+    from plotly.utils import PlotlyJSONEncoder
+    return json.dumps(value, cls=PlotlyJSONEncoder)
+
+
+class CallbackCache:
+    """ Memoizes callback outputs in one SQLite file, so every worker process
+        on the box shares the entries and the hit/miss counters. Entries are
+        JSON (figures through Plotly's encoder), evicted least-recently-used
+        once they add up to more than `max_bytes`, and expired after `ttl`
+        seconds.
+    """
+
+    def __init__(self, path, version, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.path = Path(path)
+        self.version = version
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A connection per call: Dash may run callbacks on several threads
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn, name, hit):
+        column = 'hits' if hit else 'misses'
+        conn.execute("INSERT OR IGNORE INTO stats VALUES (?, 0, 0)", (name,))
+        conn.execute(f"UPDATE stats SET {column} = {column} + 1 "
+                     "WHERE name = ?", (name,))
+
+    def get(self, name, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM entries "
+                               "WHERE key = ?", (key,)).fetchone()
+            hit = row is not None and now - row[1] < self.ttl
+            if hit:
+                conn.execute("UPDATE entries SET used = ? WHERE key = ?",
+                             (now, key))
+            self._count(conn, name, hit)
+        return json.loads(row[0]) if hit else None
+
+    def set(self, key, value):
+        now = time.time()
+        payload = encode(value)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (key, payload, len(payload), now, now))
+            conn.execute("DELETE FROM entries WHERE created < ?",
+                         (now - self.ttl,))
+            # Least recently used first, past the point where the newer
+            # entries fill the budget
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM "
+                "(SELECT key, SUM(size) OVER (ORDER BY used DESC, key) "
+                "AS running FROM entries) WHERE running > ?)",
+                (self.max_bytes,)
+            )
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, hits, misses FROM stats "
+                                "ORDER BY name").fetchall()
+            size, nbytes = conn.execute("SELECT COUNT(*), "
+                                        "COALESCE(SUM(size), 0) "
+                                        "FROM entries").fetchone()
+        return {'entries': size, 'bytes': nbytes,
+                'callbacks': {name: {'hits': h, 'misses': m}
+                              for name, h, m in rows}}
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM stats")
+
+    def memoize(self, *normalizers, detach=None):
+        """ Caches a callback on its normalized arguments, one normalizer per
+            positional argument. Apply below @app.callback.
+
+            `detach` is an optional (strip, restore) pair for outputs with
+            bulky parts that are cheap to rebuild: strip(value) gets the JSON
+            form and returns what is stored, restore(stored, *args) puts the
+            parts back on a hit.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args):
+                normalized = [norm(arg)
+                              for norm, arg in zip(normalizers, args)]
+                encoded = json.dumps([self.version, fn.__name__, normalized])
+                key = hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+                cached = self.get(fn.__name__, key)
+                if cached is not None:
+                    return detach[1](cached, *normalized) if detach else cached
+                value = fn(*normalized)
+                stored = value
+                if detach:
+                    stored = detach[0](json.loads(encode(value)))
+                self.set(key, stored)
+                return value
+            return wrapper
+        return decorator
@@ -0,0 +1,245 @@
+import base64
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+class DailyCube:
+    """ (date x neighborhood) -> crashes, injured, killed, with prefix sums
+        along the date axis. Any date range total is two row lookups, and a
+        per-neighborhood breakdown is one vector subtraction.
+    """
+
+    def __init__(self, dates, neighborhoods, values, measures):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.neighborhoods = [str(n) for n in neighborhoods]
+        self.measures = [str(m) for m in measures]
+        self.values = values
+        self._index = {n: i for i, n in enumerate(self.neighborhoods)}
+
+        # prefix[i] holds the totals of days [0, i)
+        self.prefix = np.zeros((len(self.dates) + 1,) + values.shape[1:],
+                               dtype=np.int64)
+        np.cumsum(values, axis=0, out=self.prefix[1:])
+        self.city_prefix = self.prefix.sum(axis=1)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz['dates'], npz['neighborhoods'], npz['values'],
+                       npz['measures'])
+
+    @property
+    def min_date(self):
+        return pd.Timestamp(self.dates[0])
+
+    @property
+    def max_date(self):
+        return pd.Timestamp(self.dates[-1])
+
+    def _bounds(self, start_date, end_date):
+        # Inclusive calendar-day range -> half-open row range
+        start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+        end = np.datetime64(pd.Timestamp(end_date).date(), 'D')
+        return (np.searchsorted(self.dates, start, side='left'),
+                np.searchsorted(self.dates, end, side='right'))
+
+    def totals(self, start_date, end_date, neighborhood=None):
+        i0, i1 = self._bounds(start_date, end_date)
+        if neighborhood:
+            if neighborhood not in self._index:
+                return dict.fromkeys(self.measures, 0)
+            j = self._index[neighborhood]
+            sums = self.prefix[i1, j] - self.prefix[i0, j]
+        else:
+            sums = self.city_prefix[i1] - self.city_prefix[i0]
+        return dict(zip(self.measures, sums.tolist()))
+
+    def by_neighborhood(self, start_date, end_date, measure='crashes'):
+        i0, i1 = self._bounds(start_date, end_date)
+        k = self.measures.index(measure)
+        sums = self.prefix[i1, :, k] - self.prefix[i0, :, k]
+        index = pd.Index(self.neighborhoods, name='neighborhood')
+        return pd.Series(sums, index=index, name=measure)
+
+    def daily(self, start_date, end_date, neighborhood=None,
+              measure='crashes'):
+        # Daily series trimmed to the first and last day with any crashes,
+        # like a groupby would give
+        i0, i1 = self._bounds(start_date, end_date)
+        k = self.measures.index(measure)
+        if neighborhood:
+            if neighborhood not in self._index:
+                empty = pd.DatetimeIndex([], name='crash_date')
+                return pd.Series(dtype='int64', name=measure, index=empty)
+            values = self.values[i0:i1, self._index[neighborhood], k]
+        else:
+            values = self.values[i0:i1, :, k].sum(axis=1)
+        nonzero = np.flatnonzero(values)
+        if len(nonzero):
+            i0, i1 = i0 + nonzero[0], i0 + nonzero[-1] + 1
+            values = values[nonzero[0]:nonzero[-1] + 1]
+        else:
+            i1 = i0
+            values = values[:0]
+        index = pd.DatetimeIndex(self.dates[i0:i1], name='crash_date')
+        return pd.Series(values.astype('int64'), index=index, name=measure)
+
+
+def _count_dtype(array):
+    # Narrowest unsigned type that holds every count
+    return np.min_scalar_type(int(array.max()) if array.size else 0)
+
+
+def _pack(array, dtype=None):
+    # Little-endian typed array as base64; counts get the narrowest unsigned
+    # type that holds them
+    array = np.asarray(array)
+    if dtype is None:
+        dtype = _count_dtype(array)
+    raw = np.ascontiguousarray(
+        array, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()
+    return {'dtype': np.dtype(dtype).name, 'shape': list(array.shape),
+            'data': base64.b64encode(raw).decode('ascii')}
+
+
+def _pack_counts(array):
+    """ A count array, dense or sparse, whichever is smaller. Sparse keeps
+        the gaps between successive nonzero flat positions (the first one
+        counted from -1) and the nonzero values; killed and injured counts
+        are mostly zeros.
+    """
+    flat = np.asarray(array).ravel()
+    nonzero = np.flatnonzero(flat)
+    gaps = np.diff(nonzero, prepend=-1)
+    values = flat[nonzero]
+    sparse_bytes = (gaps.size * _count_dtype(gaps).itemsize
+                    + values.size * _count_dtype(values).itemsize)
+    if sparse_bytes >= flat.size * _count_dtype(flat).itemsize:
+        return _pack(array)
+    return {'format': 'sparse', 'shape': list(np.shape(array)),
+            'gaps': _pack(gaps), 'values': _pack(values)}
+
+
+def _pack_quantized(array):
+    # Floats as uint16 steps between their min and max: half the bytes of
+    # float32, off by at most 1/131070 of the range
+    array = np.nan_to_num(np.asarray(array, dtype=np.float64))
+    low = float(array.min()) if array.size else 0.0
+    scale = (float(array.max()) - low) / 65535 if array.size else 0.0
+    if scale > 0:
+        steps = np.round((array - low) / scale)
+    else:
+        steps = np.zeros_like(array)
+    return dict(_pack(steps, dtype=np.uint16), offset=low, scale=scale)
+
+
+def client_payload(cube, forecasts, template, city_key):
+    """ Everything the clientside callbacks need, packed once per process: one
+        (date x neighborhood) array per measure (sparse where that is
+        smaller), the forecast means quantized to uint16, and the Plotly
+        template object (plotly.js has no named templates).
+    """
+    keys = sorted(forecasts)
+    horizon = max((len(forecasts[k]) for k in keys), default=0)
+    means = np.zeros((len(keys), horizon), dtype=np.float32)
+    for i, key in enumerate(keys):
+        means[i, :len(forecasts[key])] = forecasts[key]['mean'].to_numpy()
+    return {
+        'start': str(cube.dates[0]),
+        'days': len(cube.dates),
+        'neighborhoods': cube.neighborhoods,
+        'measures': {m: _pack_counts(cube.values[:, :, k])
+                     for k, m in enumerate(cube.measures)},
+        'city_key': city_key,
+        'forecast_keys': keys,
+        'forecast_length': [len(forecasts[k]) for k in keys],
+        'forecast_mean': _pack_quantized(means),
+        'template': template,
+    }
+
+
+class NeighborhoodGeometry:
+    """ Pre-simplified NTA outlines per zoom level plus the bbox/centroid index
+        written by src/features/build_neighborhood_geometry.py.
+    """
+
+    def __init__(self, levels, index):
+        # {level: {NTAName: feature}}
+        self.levels = levels
+        self.index = index
+
+    @classmethod
+    def load(cls, directory):
+        directory = Path(directory)
+        levels = {}
+        for path in sorted(directory.glob('*.geojson')):
+            features = json.loads(path.read_text())['features']
+            levels[path.stem] = {feat['properties']['NTAName']: feat
+                                 for feat in features}
+        return cls(levels, json.loads((directory / 'index.json').read_text()))
+
+    def collection(self, names, level, detail=None, detail_level=None):
+        # `detail` (one NTA) is drawn at `detail_level`, everything else at
+        # `level`
+        features = []
+        for name in names:
+            if name == detail and detail_level:
+                source = self.levels[detail_level]
+            else:
+                source = self.levels[level]
+            if name in source:
+                features.append(source[name])
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def bounds(self, name):
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        return {k: entry[k] for k in ('west', 'south', 'east', 'north')}
+
+
+class LazyData:
+    """ Named dashboard inputs, each loaded by its loader on first access and
+        kept afterwards. `warm()` loads them all, in a background thread when
+        asked, so a server can start listening before its data is in memory.
+    """
+
+    def __init__(self, **loaders):
+        self._loaders = loaders
+        self._values = {}
+        self._lock = threading.RLock()
+        self.error = None
+
+    def __getattr__(self, name):
+        loaders = self.__dict__.get('_loaders', {})
+        if name not in loaders:
+            raise AttributeError(name)
+        if name not in self._values:
+            # One loader at a time, so a request racing the warm-up waits
+            # instead of loading twice; reentrant because a loader may read
+            # other inputs
+            with self._lock:
+                if name not in self._values:
+                    self._values[name] = loaders[name]()
+        return self._values[name]
+
+    @property
+    def ready(self):
+        return len(self._values) == len(self._loaders)
+
+    def warm(self, background=False):
+        if background:
+            threading.Thread(target=self.warm, name='dashboard-warmup',
+                             daemon=True).start()
+            return
+        try:
+            for name in self._loaders:
+                getattr(self, name)
+        except Exception as e:
+            # Kept for the readiness probe; the next access retries the load
+            self.error = f"{type(e).__name__}: {e}"
+            raise
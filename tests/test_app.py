@@ -0,0 +1,88 @@
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('dash')
+
+from src.models.forecast_store import CITY_KEY, MODEL_VERSION  # noqa: E402
+
+APP_FILE = Path(__file__).resolve().parents[1] / 'app.py'
+NEIGHBORHOODS = ['Astoria', 'Midwood']
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+    # The smallest inputs every loader accepts, at the paths app.py reads
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DASHBOARD_CACHE', str(tmp_path / 'cache.sqlite'))
+    for directory in ['data/processed/neighborhood_geometry',
+                      'models/forecast_store']:
+        Path(directory).mkdir(parents=True)
+
+    dates = np.arange('2024-01-01', '2024-01-11', dtype='datetime64[D]')
+    np.savez('data/processed/daily_neighborhood_cube.npz', dates=dates,
+             neighborhoods=np.array(NEIGHBORHOODS),
+             values=np.ones((len(dates), len(NEIGHBORHOODS), 3), dtype=int),
+             measures=np.array(['crashes', 'injured', 'killed']))
+    pd.DataFrame({'neighborhood': NEIGHBORHOODS,
+                  'confidence_level': 'high'}).to_csv(
+        'data/processed/neighborhood_forecast_confidence.csv', index=False)
+    Path('data/processed/neighborhood_geometry/index.json').write_text(
+        json.dumps({}))
+    pd.DataFrame({'key': CITY_KEY, 'model_version': MODEL_VERSION,
+                  'step': [1, 2],
+                  'date': pd.date_range('2024-01-11', periods=2),
+                  'mean': 1.0, 'lower': 0.0, 'upper': 2.0}).to_parquet(
+        'models/forecast_store/reconciled_forecasts.parquet', index=False)
+    return tmp_path
+
+
+def start(startup, monkeypatch):
+    # A fresh app.py module, as a server process in that startup mode sees it
+    monkeypatch.setenv('DASHBOARD_STARTUP', startup)
+    spec = importlib.util.spec_from_file_location('app', APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, 'app', module)
+    spec.loader.exec_module(module)
+    return module, module.app.server.test_client()
+
+
+def test_lazy_mode_is_ready_once_the_inputs_exist(artifacts, monkeypatch):
+    module, client = start('lazy', monkeypatch)
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    # Nothing had to be loaded for that
+    assert not module.data.ready
+
+
+def test_lazy_mode_reports_missing_inputs(artifacts, monkeypatch):
+    missing = 'data/processed/neighborhood_forecast_confidence.csv'
+    Path(missing).unlink()
+    module, client = start('lazy', monkeypatch)
+
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['missing'] == [missing]
+
+
+def test_eager_mode_is_ready_once_loaded(artifacts, monkeypatch):
+    module, client = start('eager', monkeypatch)
+
+    assert module.data.ready
+    assert client.get('/readyz').status_code == 200
+
+
+def test_background_mode_becomes_ready(artifacts, monkeypatch):
+    module, client = start('background', monkeypatch)
+
+    deadline = time.monotonic() + 30
+    while not module.data.ready and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert client.get('/readyz').status_code == 200
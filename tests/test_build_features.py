@@ -0,0 +1,93 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.features.build_features import (FEATURE_GROUPS, MODEL_EXOG,
+                                         CalendarFeatures,
+                                         build_calendar_features, model_exog)
+
+
+def direct(dates, groups=MODEL_EXOG):
+    # The builders run straight on `dates`, as the reference for the store
+    return pd.concat([FEATURE_GROUPS[g](dates) for g in groups],
+                     axis=1).astype(np.float64)
+
+
+def test_columns_follow_the_groups(tmp_path):
+    build_calendar_features(tmp_path, start='2020-01-01', end='2020-12-31')
+    calendar = CalendarFeatures.load(tmp_path)
+
+    assert calendar.column_names() == [
+        'dow_1', 'dow_2', 'dow_3', 'dow_4', 'dow_5', 'dow_6', 'holiday',
+        'dst_spring', 'dst_fall', 'year_sin_1', 'year_cos_1', 'year_sin_2',
+        'year_cos_2']
+    assert calendar.column_names(['holiday', 'dst']) == [
+        'holiday', 'dst_spring', 'dst_fall']
+
+
+def test_rows_line_up_with_their_dates(tmp_path):
+    build_calendar_features(tmp_path, start='2020-01-01', end='2020-12-31')
+    calendar = CalendarFeatures.load(tmp_path)
+    # A slice starting inside a DST window, away from the store's start
+    dates = pd.date_range('2020-03-10', '2020-11-10')
+
+    frame = calendar.frame(dates)
+    pd.testing.assert_frame_equal(frame, direct(dates), check_freq=False)
+    assert frame.loc['2020-07-03', 'holiday'] == 1
+    assert frame.loc['2020-07-04', 'holiday'] == 0
+    assert frame.loc['2020-03-10':'2020-03-14', 'dst_spring'].eq(1).all()
+    assert frame.loc['2020-03-15', 'dst_spring'] == 0
+    # Tuesday is dow_1; Monday is the baseline
+    assert frame.loc['2020-03-10', 'dow_1'] == 1
+
+
+def test_extending_matches_a_fresh_build(tmp_path):
+    build_calendar_features(tmp_path / 'extended', start='2020-01-01',
+                            end='2020-06-30')
+    build_calendar_features(tmp_path / 'extended', start='2020-01-01',
+                            end='2021-06-30')
+    build_calendar_features(tmp_path / 'fresh', start='2020-01-01',
+                            end='2021-06-30')
+
+    extended = CalendarFeatures.load(tmp_path / 'extended')
+    fresh = CalendarFeatures.load(tmp_path / 'fresh')
+    assert extended.days == fresh.days == 547
+    for group in MODEL_EXOG:
+        np.testing.assert_array_equal(extended.arrays[group],
+                                      fresh.arrays[group])
+
+
+def test_only_new_or_changed_groups_are_rebuilt(tmp_path):
+    build_calendar_features(tmp_path, start='2020-01-01', end='2020-12-31')
+    before = {p.name: p.stat().st_mtime_ns for p in tmp_path.glob('*.npy')}
+
+    def holiday_eves(dates):
+        return pd.DataFrame({'holiday_eve': FEATURE_GROUPS['holiday'](
+            dates + pd.Timedelta(days=1))['holiday'].to_numpy()}, index=dates)
+
+    build_calendar_features(tmp_path, start='2020-01-01', end='2020-12-31',
+                            groups=dict(FEATURE_GROUPS, eve=holiday_eves))
+    after = {p.name: p.stat().st_mtime_ns for p in tmp_path.glob('*.npy')}
+
+    assert {name for name in after if after[name] != before.get(name)} == {
+        'eve.npy'}
+    index = json.loads((tmp_path / 'index.json').read_text())
+    assert index['groups']['eve']['columns'] == ['holiday_eve']
+    eves = CalendarFeatures.load(tmp_path).frame(
+        pd.date_range('2020-12-24', '2020-12-25'), groups=['eve'])
+    assert eves['holiday_eve'].tolist() == [1.0, 0.0]
+
+
+def test_dates_outside_the_store_are_rejected(tmp_path):
+    build_calendar_features(tmp_path, start='2020-01-01', end='2020-12-31')
+    calendar = CalendarFeatures.load(tmp_path)
+
+    with pytest.raises(ValueError):
+        calendar.frame(pd.date_range('2020-12-30', '2021-01-02'))
+
+
+def test_weekly_differencing_drops_the_day_of_week_dummies():
+    assert model_exog([1, 1, 1, 7]) == ['holiday', 'dst', 'fourier_year']
+    assert model_exog([1, 0, 1, 7]) == MODEL_EXOG
@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.visualization import callback_cache
+from src.visualization.callback_cache import CallbackCache, normalize_date
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Settable time for the cache module, so recency and age are exact
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(callback_cache, 'time',
+                        SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def value(tag):
+    # About 110 bytes once encoded
+    return {'tag': tag, 'padding': 'x' * 90}
+
+
+def workers(tmp_path, **kwargs):
+    # Two caches on one file stand for two worker processes
+    path = tmp_path / 'cache.sqlite'
+    return (CallbackCache(path, 'v1', **kwargs),
+            CallbackCache(path, 'v1', **kwargs))
+
+
+def test_memoize_serves_repeat_calls_from_the_cache(tmp_path):
+    cache = CallbackCache(tmp_path / 'cache.sqlite', 'v1')
+    calls = []
+
+    @cache.memoize(normalize_date)
+    def totals(day):
+        calls.append(day)
+        return {'day': day}
+
+    assert totals('2021-04-22') == {'day': '2021-04-22'}
+    assert totals('2021-04-22T00:00:00') == {'day': '2021-04-22'}
+    assert calls == ['2021-04-22']
+    assert cache.stats()['callbacks'] == {'totals': {'hits': 1, 'misses': 1}}
+
+
+def test_entries_and_counters_are_shared_across_connections(tmp_path):
+    first, second = workers(tmp_path)
+    first.set('a', value('a'))
+
+    assert second.get('view', 'a') == value('a')
+    assert second.get('view', 'b') is None
+    assert first.stats()['callbacks'] == {'view': {'hits': 1, 'misses': 1}}
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path, clock):
+    first, second = workers(tmp_path, max_bytes=250)
+    first.set('a', value('a'))
+    clock.value += 1
+    second.set('b', value('b'))
+    clock.value += 1
+    # Reading `a` through the other connection makes `b` the oldest
+    second.get('view', 'a')
+    clock.value += 1
+    first.set('c', value('c'))
+
+    assert first.get('view', 'b') is None
+    assert second.get('view', 'a') == value('a')
+    assert second.get('view', 'c') == value('c')
+    assert first.stats()['entries'] == 2
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    first, second = workers(tmp_path, ttl=60)
+    first.set('a', value('a'))
+
+    clock.value += 59
+    assert second.get('view', 'a') == value('a')
+    clock.value += 2
+    assert second.get('view', 'a') is None
+    # Expired entries are removed on the next write
+    second.set('b', value('b'))
+    assert first.stats()['entries'] == 1
@@ -0,0 +1,86 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.visualization.dashboard_data import DailyCube, client_payload
+
+CITY_KEY = '__city__'
+
+
+# Python versions of the decoders in assets/clientside.js
+
+def unpack(packed):
+    dtype = np.dtype(packed['dtype']).newbyteorder('<')
+    return np.frombuffer(base64.b64decode(packed['data']), dtype=dtype)
+
+
+def unpack_counts(packed):
+    if packed.get('format') != 'sparse':
+        return unpack(packed).reshape(packed['shape'])
+    # The first gap is counted from position -1
+    positions = np.cumsum(unpack(packed['gaps']).astype(np.int64)) - 1
+    out = np.zeros(np.prod(packed['shape']), dtype=packed['values']['dtype'])
+    out[positions] = unpack(packed['values'])
+    return out.reshape(packed['shape'])
+
+
+def unpack_quantized(packed):
+    steps = unpack(packed).astype(np.float64).reshape(packed['shape'])
+    return packed['offset'] + steps * packed['scale']
+
+
+@pytest.fixture
+def cube():
+    rng = np.random.default_rng(0)
+    days, width = 400, 12
+    values = np.stack([rng.poisson(3.0, (days, width)),
+                       rng.poisson(0.8, (days, width)),
+                       rng.random((days, width)) < 0.002], axis=2)
+    return DailyCube(np.datetime64('2023-01-01') + np.arange(days),
+                     [f"NTA {j}" for j in range(width)], values,
+                     ['crashes', 'injured', 'killed'])
+
+
+def forecast(mean):
+    return pd.DataFrame({'mean': mean})
+
+
+def test_counts_round_trip_exactly(cube):
+    payload = client_payload(cube, {}, {}, CITY_KEY)
+
+    # Mostly-zero killed counts go sparse, the rest stay dense
+    assert payload['measures']['killed'].get('format') == 'sparse'
+    assert payload['measures']['crashes'].get('format') != 'sparse'
+    for k, measure in enumerate(cube.measures):
+        np.testing.assert_array_equal(
+            unpack_counts(payload['measures'][measure]), cube.values[:, :, k])
+    assert payload['days'] == len(cube.dates)
+    assert payload['start'] == '2023-01-01'
+
+
+def test_quantized_forecasts_round_trip_within_half_a_step(cube):
+    rng = np.random.default_rng(1)
+    forecasts = {'NTA 1': forecast(rng.uniform(0, 5, 30)),
+                 CITY_KEY: forecast(rng.uniform(200, 400, 60))}
+    payload = client_payload(cube, forecasts, {}, CITY_KEY)
+
+    packed = payload['forecast_mean']
+    decoded = unpack_quantized(packed)
+    for i, key in enumerate(payload['forecast_keys']):
+        n = payload['forecast_length'][i]
+        original = forecasts[key]['mean'].to_numpy(dtype=np.float32)
+        np.testing.assert_allclose(decoded[i, :n], original,
+                                   atol=packed['scale'] / 2 + 1e-4)
+        # Shorter forecasts are padded with zeros, which stay exact
+        assert (decoded[i, n:] == 0).all()
+
+
+def test_constant_forecasts_decode_exactly(cube):
+    payload = client_payload(cube, {CITY_KEY: forecast(np.full(10, 7.5))},
+                             {}, CITY_KEY)
+
+    assert payload['forecast_mean']['scale'] == 0
+    np.testing.assert_array_equal(unpack_quantized(payload['forecast_mean']),
+                                  np.full((1, 10), 7.5))
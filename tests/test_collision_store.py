@@ -0,0 +1,67 @@
+import pandas as pd
+
+from src.data.canned_server import canned_collisions, serve_canned_pages
+from src.data.nyc_motor_vehicle_collisions import (download_all_collisions,
+                                                   download_incremental,
+                                                   read_watermark)
+
+
+def read_store(store_dir):
+    crashes = pd.read_parquet(store_dir)
+    crashes = crashes.astype({'year': int, 'month': int})
+    return crashes.sort_values('collision_id').reset_index(drop=True)
+
+
+def backfill(frame, store_dir):
+    with serve_canned_pages(frame) as url:
+        download_all_collisions(store_dir=store_dir, endpoint=url)
+
+
+def revised(frame):
+    # Later versions of some rows, a few of them moved to another month,
+    # plus brand new collisions
+    changed = frame.iloc[::10].copy()
+    changed['number_of_persons_injured'] += 1
+    changed.loc[changed.index[::3], 'crash_date'] = '2013-02-14T00:00:00.000'
+    added = canned_collisions(20, seed=1)
+    added['collision_id'] += len(frame)
+    delta = pd.concat([changed, added], ignore_index=True)
+    delta[':updated_at'] = '2024-02-01T00:00:00.000'
+    return delta
+
+
+def test_incremental_upsert_matches_full_rebuild(tmp_path):
+    base = canned_collisions(500)
+    delta = revised(base)
+    backfill(base, tmp_path / 'incremental')
+    with serve_canned_pages(delta) as url:
+        download_incremental(store_dir=tmp_path / 'incremental', endpoint=url)
+
+    current = pd.concat([base[~base['collision_id'].isin(
+        delta['collision_id'])], delta])
+    backfill(current, tmp_path / 'full')
+
+    pd.testing.assert_frame_equal(read_store(tmp_path / 'incremental'),
+                                  read_store(tmp_path / 'full'))
+    assert read_watermark(tmp_path / 'incremental') == \
+        '2024-02-01T00:00:00.000'
+
+
+def test_incremental_compacts_touched_partitions(tmp_path):
+    base = canned_collisions(500)
+    backfill(base, tmp_path / 'store')
+    with serve_canned_pages(revised(base)) as url:
+        download_incremental(store_dir=tmp_path / 'store', endpoint=url)
+    moved = tmp_path / 'store' / 'year=2013' / 'month=02'
+    assert [f.name for f in moved.glob('*.parquet')] == ['part-0.parquet']
+
+
+def test_rerunning_the_same_delta_changes_nothing(tmp_path):
+    base = canned_collisions(500)
+    delta = revised(base)
+    backfill(base, tmp_path / 'store')
+    with serve_canned_pages(delta) as url:
+        download_incremental(store_dir=tmp_path / 'store', endpoint=url)
+        once = read_store(tmp_path / 'store')
+        download_incremental(store_dir=tmp_path / 'store', endpoint=url)
+    pd.testing.assert_frame_equal(read_store(tmp_path / 'store'), once)
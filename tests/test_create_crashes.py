@@ -0,0 +1,110 @@
+import importlib
+import json
+
+import pandas as pd
+import pytest
+
+from src.data.canned_server import canned_collisions, serve_canned_pages
+from src.data.make_dataset import clean_collisions
+from src.data.nyc_motor_vehicle_collisions import (download_all_collisions,
+                                                   download_incremental)
+from src.features.nyc_motor_vehicle_collisions.create_crashes import (
+    UNMATCHED_FILE, create_crashes)
+
+enrichment = importlib.import_module(
+    'src.features.nyc_motor_vehicle_collisions.create_crashes')
+
+
+def square(name, west, south, size):
+    ring = [[west, south], [west + size, south], [west + size, south + size],
+            [west, south + size], [west, south]]
+    return {'type': 'Feature', 'properties': {'NTAName': name},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+
+
+@pytest.fixture
+def geojson(tmp_path):
+    # Covers the southern part of the canned crashes only, so some go unmatched
+    path = tmp_path / 'neighborhoods.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        square('West', -74.2, 40.5, 0.25), square('East', -73.95, 40.5, 0.25),
+    ]}))
+    return path
+
+
+def revised(frame):
+    # Later versions of some rows: corrected counts, some moved to another
+    # month, some moved into or out of a neighborhood; plus new collisions
+    changed = frame.iloc[::10].copy()
+    changed['number_of_persons_injured'] += 1
+    changed.loc[changed.index[::3], 'crash_date'] = '2013-02-14T00:00:00.000'
+    # Mirrored north-south across the edge of the covered area
+    moved = changed.index[1::3]
+    changed.loc[moved, 'latitude'] = 81.4 - changed.loc[moved, 'latitude']
+    added = canned_collisions(20, seed=1)
+    added['collision_id'] += len(frame)
+    delta = pd.concat([changed, added], ignore_index=True)
+    delta[':updated_at'] = '2024-02-01T00:00:00.000'
+    return delta
+
+
+def enrich(raw_dir, tmp_path, geojson, output_dir, full=False):
+    interim = tmp_path / 'interim' / 'crashes.csv'
+    clean_collisions(raw_dir, interim)
+    create_crashes(interim, output_dir, geojson,
+                   tmp_path / 'interim' / 'neighborhood_index.npz', full=full)
+
+
+def read_processed(output_dir):
+    crashes = pd.read_parquet(output_dir).drop(columns=['year', 'month'])
+    return crashes.sort_values('collision_id').reset_index(drop=True)
+
+
+def read_unmatched(output_dir):
+    unmatched = pd.read_parquet(output_dir / UNMATCHED_FILE)
+    return unmatched.sort_values('collision_id').reset_index(drop=True)
+
+
+def test_incremental_enrichment_matches_full_rebuild(tmp_path, geojson):
+    base = canned_collisions(500)
+    raw = tmp_path / 'raw'
+    with serve_canned_pages(base) as url:
+        download_all_collisions(store_dir=raw, endpoint=url)
+    enrich(raw, tmp_path, geojson, tmp_path / 'incremental')
+    with serve_canned_pages(revised(base)) as url:
+        download_incremental(store_dir=raw, endpoint=url)
+    enrich(raw, tmp_path, geojson, tmp_path / 'incremental')
+    enrich(raw, tmp_path, geojson, tmp_path / 'full', full=True)
+
+    incremental = read_processed(tmp_path / 'incremental')
+    pd.testing.assert_frame_equal(incremental,
+                                  read_processed(tmp_path / 'full'))
+    pd.testing.assert_frame_equal(read_unmatched(tmp_path / 'incremental'),
+                                  read_unmatched(tmp_path / 'full'))
+    assert incremental['collision_id'].is_unique
+
+
+def test_rows_behind_the_watermark_are_not_hashed(tmp_path, geojson,
+                                                  monkeypatch):
+    base = canned_collisions(500)
+    delta = revised(base)
+    raw = tmp_path / 'raw'
+    with serve_canned_pages(base) as url:
+        download_all_collisions(store_dir=raw, endpoint=url)
+    enrich(raw, tmp_path, geojson, tmp_path / 'processed')
+    with serve_canned_pages(delta) as url:
+        download_incremental(store_dir=raw, endpoint=url)
+    enrich(raw, tmp_path, geojson, tmp_path / 'processed')
+    before = read_processed(tmp_path / 'processed')
+
+    hashed = []
+    row_hashes = enrichment.row_hashes
+    monkeypatch.setattr(enrichment, 'row_hashes',
+                        lambda crashes: hashed.append(len(crashes))
+                        or row_hashes(crashes))
+    enrich(raw, tmp_path, geojson, tmp_path / 'processed')
+
+    # Only the rows at the watermark are checked again, and none is redone
+    assert hashed == [len(delta)]
+    pd.testing.assert_frame_equal(read_processed(tmp_path / 'processed'),
+                                  before)
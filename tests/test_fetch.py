@@ -0,0 +1,120 @@
+import io
+import time
+
+import pandas as pd
+import pytest
+import requests
+
+from src.data.canned_server import canned_collisions, serve_canned_pages
+from src.data.fetch import RateLimiter, fetch_pages, get_with_retry
+
+PAGE_SIZE = 100
+
+
+def parse(text):
+    return pd.read_csv(io.StringIO(text))
+
+
+def collision_ids(pages):
+    return pd.concat(pages)['collision_id'].tolist()
+
+
+class SlowFirstPages(requests.Session):
+    # Earlier offsets answer later, so pages complete out of order
+    def get(self, url, params=None, **kwargs):
+        time.sleep(max(0.0, 0.2 - params['$offset'] / PAGE_SIZE * 0.05))
+        return super().get(url, params=params, **kwargs)
+
+
+class DropsFirstTry(requests.Session):
+    # Every page's first request fails with a connection error
+    def __init__(self):
+        super().__init__()
+        self.attempts = {}
+
+    def get(self, url, params=None, **kwargs):
+        offset = params['$offset']
+        self.attempts[offset] = self.attempts.get(offset, 0) + 1
+        if self.attempts[offset] == 1:
+            raise requests.ConnectionError(f"dropped {offset}")
+        return super().get(url, params=params, **kwargs)
+
+
+class FakeResponse:
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return canned_collisions(1050)
+
+
+def test_fetch_pages_returns_every_row_in_order(frame):
+    with serve_canned_pages(frame) as url:
+        pages = list(fetch_pages(url, {}, PAGE_SIZE, parse, max_in_flight=4))
+    assert [len(p) for p in pages] == [PAGE_SIZE] * 10 + [50]
+    assert collision_ids(pages) == frame['collision_id'].tolist()
+
+
+def test_fetch_pages_exact_multiple_ends_on_empty_page(frame):
+    with serve_canned_pages(frame.iloc[:300]) as url:
+        pages = list(fetch_pages(url, {}, PAGE_SIZE, parse, max_in_flight=2))
+    assert [len(p) for p in pages] == [PAGE_SIZE] * 3 + [0]
+    assert collision_ids(pages[:-1]) == frame['collision_id'][:300].tolist()
+
+
+def test_fetch_pages_keeps_offset_order_when_pages_finish_out_of_order(
+        frame):
+    with serve_canned_pages(frame) as url:
+        pages = list(fetch_pages(url, {}, PAGE_SIZE, parse, max_in_flight=4,
+                                 session=SlowFirstPages()))
+    assert collision_ids(pages) == frame['collision_id'].tolist()
+
+
+def test_fetch_pages_retries_dropped_connections(frame):
+    session = DropsFirstTry()
+    with serve_canned_pages(frame) as url:
+        pages = list(fetch_pages(url, {}, PAGE_SIZE, parse, max_in_flight=4,
+                                 backoff=0, session=session))
+    assert collision_ids(pages) == frame['collision_id'].tolist()
+    assert all(n == 2 for n in session.attempts.values())
+
+
+def test_get_with_retry_retries_retryable_status():
+    session = FakeSession([FakeResponse(503, headers={'Retry-After': '0'}),
+                           FakeResponse(429), FakeResponse(200, 'ok')])
+    text = get_with_retry(session, 'http://x', {}, RateLimiter(), backoff=0)
+    assert text == 'ok'
+    assert session.calls == 3
+
+
+def test_get_with_retry_gives_up_after_retries():
+    session = FakeSession([FakeResponse(502)] * 3)
+    with pytest.raises(requests.HTTPError):
+        get_with_retry(session, 'http://x', {}, RateLimiter(), retries=2,
+                       backoff=0)
+    assert session.calls == 3
+
+
+def test_get_with_retry_does_not_retry_client_errors():
+    session = FakeSession([FakeResponse(404), FakeResponse(200, 'ok')])
+    with pytest.raises(requests.HTTPError):
+        get_with_retry(session, 'http://x', {}, RateLimiter(), backoff=0)
+    assert session.calls == 1
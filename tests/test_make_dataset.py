@@ -0,0 +1,84 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.make_dataset import (OUTPUT_COLUMNS, STREET_RULES,
+                                   clean_collisions)
+
+STREETS = ['Brooklyn Brg', 'QUEENSBORO BRDG', 'queens midtown tnl',
+           'BROADWAY', '  ATLANTIC   AVENUE ', 'Battery Tunnel',
+           'BRIDGE PLAZA', 'brg', None]
+
+
+@pytest.fixture
+def export(tmp_path):
+    # A small Socrata CSV export: dates spelled with a time, missing
+    # coordinates, and street names that need the notebook's fixes
+    rng = np.random.default_rng(0)
+    n = 200
+    lat = (40.5 + rng.random(n) * 0.4).round(6)
+    lon = (-74.2 + rng.random(n) * 0.5).round(6)
+    lat[rng.random(n) < 0.15] = np.nan
+    lon[rng.random(n) < 0.05] = np.nan
+    frame = pd.DataFrame({
+        'crash_date': pd.Series(pd.date_range('2020-01-01', periods=n))
+        .dt.strftime('%Y-%m-%dT00:00:00.000'),
+        'crash_time': '8:05',
+        'borough': rng.choice(['BROOKLYN', 'QUEENS', None], n),
+        'zip_code': '11201',
+        'latitude': lat,
+        'longitude': lon,
+        'on_street_name': rng.choice(STREETS, n),
+        'off_street_name': rng.choice(['12 MAIN STREET', None], n),
+        'cross_street_name': rng.choice(['5 AVENUE', None], n),
+        'number_of_persons_injured': rng.choice([0, 1, 2, np.nan], n),
+        'number_of_persons_killed': rng.choice([0, 0, 1, np.nan], n),
+        'collision_id': np.arange(n) + 1,
+    })
+    path = tmp_path / 'collisions.csv'
+    frame.to_csv(path, index=False)
+    return path
+
+
+def notebook_clean(path):
+    # notebooks/01_preprocessing.ipynb on the whole frame at once
+    df = pd.read_csv(path)
+    streets = df['on_street_name']
+    for pattern, replacement in STREET_RULES:
+        streets = streets.str.replace(pattern, replacement, regex=True,
+                                      flags=re.IGNORECASE)
+    df['on_street_name'] = streets.str.strip()
+
+    locatable = (df['latitude'].notna()
+                 | df['on_street_name'].str.contains(
+                     r'(?i)\b(?:BRIDGE|TUNNEL)\b', na=False)
+                 | (df['on_street_name'].notna()
+                    & df['cross_street_name'].notna())
+                 | df['off_street_name'].notna())
+    df = df[locatable].dropna(subset=['latitude', 'longitude'])
+    df['crash_date'] = df['crash_date'].str[:10]
+    df = df.fillna({'number_of_persons_injured': 0,
+                    'number_of_persons_killed': 0})
+    return df.reindex(columns=OUTPUT_COLUMNS)
+
+
+def read_cleaned(path):
+    return pd.read_csv(path).astype({'updated_at': 'float64'})
+
+
+@pytest.mark.parametrize('chunksize', [7, 1000])
+def test_chunked_clean_matches_the_notebook(export, tmp_path, chunksize):
+    expected = tmp_path / 'expected.csv'
+    notebook_clean(export).to_csv(expected, index=False)
+    cache = tmp_path / 'street_names.json'
+
+    # The second run normalizes street names from the saved cache
+    for run in range(2):
+        output = tmp_path / f'crashes-{run}.csv'
+        clean_collisions(export, output, street_cache=cache,
+                         chunksize=chunksize)
+        pd.testing.assert_frame_equal(read_cleaned(output),
+                                      read_cleaned(expected),
+                                      check_dtype=False)
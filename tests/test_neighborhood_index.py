@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import shape
+
+from src.benchmarks.synthetic import synthetic_neighborhoods
+from src.features.nyc_motor_vehicle_collisions.neighborhood_index import (
+    NeighborhoodIndex)
+
+
+def square(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size],
+            [x, y]]
+
+
+@pytest.fixture
+def ring_and_islands(tmp_path):
+    # A neighborhood with a hole, one in two parts, and one in the hole
+    path = tmp_path / 'ring_and_islands.geojson'
+    features = [
+        ('Ring', {'type': 'Polygon',
+                  'coordinates': [square(0, 0, 3), square(1, 1, 1)]}),
+        ('Islands', {'type': 'MultiPolygon',
+                     'coordinates': [[square(4, 0, 1)], [square(4, 2, 1)]]}),
+        ('Core', {'type': 'Polygon',
+                  'coordinates': [square(1.25, 1.25, 0.5)]}),
+    ]
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'NTAName': name},
+         'geometry': geometry} for name, geometry in features]}))
+    return path
+
+
+@pytest.fixture
+def jittered_cells(tmp_path):
+    path = tmp_path / 'cells.geojson'
+    path.write_text(json.dumps(synthetic_neighborhoods(0)))
+    return path
+
+
+def read_polygons(geojson_file):
+    with open(geojson_file) as f:
+        return [shape(feat['geometry']) for feat in json.load(f)['features']]
+
+
+def contains(geojson_file, lon, lat):
+    # The reference answer: index of the polygon shapely says contains each
+    # point, -1 for none
+    polygons = read_polygons(geojson_file)
+    points = shapely.points(lon, lat)
+    inside = np.array([shapely.contains(poly, points) for poly in polygons])
+    return np.where(inside.any(axis=0), inside.argmax(axis=0), -1)
+
+
+def random_points(geojson_file, n, seed=0):
+    # Over and a little beyond the polygons' bounds, at the index's 1e-6
+    # degree resolution
+    minx, miny, maxx, maxy = shapely.total_bounds(read_polygons(geojson_file))
+    pad_x, pad_y = (maxx - minx) * 0.05, (maxy - miny) * 0.05
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(minx - pad_x, maxx + pad_x, n).round(6)
+    lat = rng.uniform(miny - pad_y, maxy + pad_y, n).round(6)
+    return lon, lat
+
+
+@pytest.mark.parametrize('geojson', ['jittered_cells', 'ring_and_islands'])
+def test_lookup_matches_shapely_contains(geojson, request):
+    geojson_file = request.getfixturevalue(geojson)
+    lon, lat = random_points(geojson_file, 20_000)
+
+    index = NeighborhoodIndex.build(geojson_file, grid_size=64)
+    np.testing.assert_array_equal(index.lookup(lon, lat),
+                                  contains(geojson_file, lon, lat))
+
+
+def test_assign_names_and_missing_coordinates(ring_and_islands):
+    index = NeighborhoodIndex.build(ring_and_islands, grid_size=16)
+    names = index.assign([0.5, 1.1, 1.5, 4.5, 4.5, np.nan, 9.0],
+                         [0.5, 1.1, 1.5, 2.5, 1.5, 0.5, 9.0])
+    # In the hole, between the islands, without coordinates, outside
+    assert names.fillna('-').tolist() == ['Ring', '-', 'Core', 'Islands',
+                                          '-', '-', '-']
+
+
+def test_cached_index_answers_the_same(jittered_cells, tmp_path):
+    lon, lat = random_points(jittered_cells, 5_000, seed=1)
+    cache = tmp_path / 'index.npz'
+    built = NeighborhoodIndex.from_geojson(jittered_cells, cache)
+    loaded = NeighborhoodIndex.from_geojson(jittered_cells, cache)
+
+    assert cache.exists()
+    np.testing.assert_array_equal(loaded.lookup(lon, lat),
+                                  built.lookup(lon, lat))
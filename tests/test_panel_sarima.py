@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from src.models.panel_sarima import (PARAM_NAMES, _loglike_terms, difference,
+                                     fit_panel, forecast_panel, stack_series)
+
+ORDER = (1, 1, 1)
+SEASONAL_ORDER = (1, 1, 1, 7)
+PARAMS = np.array([0.3, -0.6, 0.2, -0.7])
+
+
+def simulate(n_days, seed, start='2020-01-01'):
+    # Weekly pattern plus a slow level around a few crashes a day
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_days)
+    level = (5 + np.sin(2 * np.pi * t / 7)
+             + np.cumsum(rng.normal(0, 0.05, n_days)))
+    dates = pd.date_range(start, periods=n_days, freq='D')
+    return pd.Series(level + rng.normal(0, 1, n_days), index=dates)
+
+
+def statsmodels_model(ts, **kwargs):
+    return SARIMAX(ts, order=ORDER, seasonal_order=SEASONAL_ORDER,
+                   concentrate_scale=True, **kwargs)
+
+
+def statsmodels_loglike(ts):
+    return statsmodels_model(ts, simple_differencing=True).loglike(PARAMS)
+
+
+def test_loglike_matches_statsmodels():
+    ts = simulate(600, seed=1)
+    _, _, values, start = stack_series({'a': ts})
+    ours = _loglike_terms(difference(values), start, PARAMS[None, :])[0]
+    assert ours == pytest.approx(statsmodels_loglike(ts), rel=1e-6)
+
+
+def test_loglike_respects_later_starts():
+    long = simulate(600, seed=1)
+    short = simulate(450, seed=2, start='2020-06-01')
+    _, _, values, start = stack_series({'long': long, 'short': short})
+    params = np.tile(PARAMS, (2, 1))
+    ours = _loglike_terms(difference(values), start, params)[1]
+    assert ours == pytest.approx(statsmodels_loglike(short), rel=1e-6)
+
+
+def test_fit_matches_statsmodels():
+    ts = simulate(800, seed=3)
+    _, _, values, start = stack_series({'a': ts})
+    params, result = fit_panel(values, start)
+    assert result.success
+    model = statsmodels_model(ts, simple_differencing=True)
+    fitted = model.fit(disp=False).params[PARAM_NAMES].to_numpy()
+    np.testing.assert_allclose(params[0], fitted, atol=2e-2)
+
+
+def test_forecast_matches_statsmodels():
+    ts = simulate(600, seed=4)
+    _, _, values, start = stack_series({'a': ts})
+    ours = forecast_panel(values, start, PARAMS[None, :], horizon=30)[:, 0]
+    theirs = statsmodels_model(ts).filter(PARAMS).forecast(30).to_numpy()
+    np.testing.assert_allclose(ours, theirs, rtol=1e-5, atol=1e-5)
+
+
+def test_series_ending_early_is_missing_not_zero():
+    long, short = simulate(600, seed=5), simulate(540, seed=6)
+    _, dates, values, start = stack_series({'long': long, 'short': short})
+    assert np.isnan(values[len(short):, 1]).all()
+    params = np.tile(PARAMS, (2, 1))
+
+    # Statsmodels with the same days missing forecasts the same dates
+    ours = forecast_panel(values, start, params, horizon=30)[:, 1]
+    model = statsmodels_model(short.reindex(dates))
+    theirs = model.filter(PARAMS).forecast(30).to_numpy()
+    np.testing.assert_allclose(ours, theirs, rtol=1e-5, atol=1e-5)
+
+    # The missing days are left out of the likelihood
+    ours = _loglike_terms(difference(values), start, params)[1]
+    assert ours == pytest.approx(statsmodels_loglike(short), rel=1e-6)
@@ -0,0 +1,108 @@
+import pytest
+
+from src import pipeline
+from src.pipeline import Stage, run_pipeline, stage_modules
+
+STAGE_SOURCE = '''
+from pathlib import Path
+
+from {package}.helpers import SUFFIX
+
+
+def copy(src, dst):
+    Path(dst).write_text(Path(src).read_text() + SUFFIX)
+
+
+def fail(src, dst):
+    raise RuntimeError('broken stage')
+'''
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    # A throwaway project: stage modules resolve against PROJECT_DIR, and the
+    # stage workers import them from the same directory
+    package = f'stages_{tmp_path.name}'
+    (tmp_path / package).mkdir()
+    (tmp_path / package / '__init__.py').write_text('')
+    (tmp_path / package / 'helpers.py').write_text("SUFFIX = '!'\n")
+    steps = STAGE_SOURCE.format(package=package)
+    (tmp_path / package / 'steps.py').write_text(steps)
+    (tmp_path / 'raw.txt').write_text('crashes')
+    monkeypatch.setattr(pipeline, 'PROJECT_DIR', tmp_path)
+    monkeypatch.setattr(pipeline, 'PROJECT_PACKAGES', ('src', package))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return tmp_path, package
+
+
+def stages(root, package, second='copy'):
+    return [
+        Stage('first', f'{package}.steps:copy',
+              inputs=[root / 'raw.txt'], outputs=[root / 'mid.txt'],
+              args={'src': root / 'raw.txt', 'dst': root / 'mid.txt'}),
+        Stage('second', f'{package}.steps:{second}',
+              inputs=[root / 'mid.txt'], outputs=[root / 'out.txt'],
+              args={'src': root / 'mid.txt', 'dst': root / 'out.txt'}),
+    ]
+
+
+def run(root, package, second='copy', **kwargs):
+    return run_pipeline(stages(root, package, second), jobs=1,
+                        state_file=root / 'state.json', **kwargs)
+
+
+def test_stage_modules_follows_imports(project):
+    root, package = project
+    modules = stage_modules(f'{package}.steps')
+    assert modules == [f'{package}.helpers', f'{package}.steps']
+
+
+def test_second_run_is_skipped(project):
+    root, package = project
+    assert run(root, package) == {'first': 'ok', 'second': 'ok'}
+    assert (root / 'out.txt').read_text() == 'crashes!!'
+    assert run(root, package) == {'first': 'skipped', 'second': 'skipped'}
+
+
+def test_changed_input_reruns_downstream(project):
+    root, package = project
+    run(root, package)
+    (root / 'raw.txt').write_text('more crashes')
+    assert run(root, package) == {'first': 'ok', 'second': 'ok'}
+    assert (root / 'out.txt').read_text() == 'more crashes!!'
+
+
+def test_changed_imported_module_reruns(project):
+    root, package = project
+    run(root, package)
+    (root / package / 'helpers.py').write_text("SUFFIX = '?!'\n")
+    assert run(root, package) == {'first': 'ok', 'second': 'ok'}
+
+
+def test_missing_output_reruns_that_stage(project):
+    root, package = project
+    run(root, package)
+    (root / 'out.txt').unlink()
+    assert run(root, package) == {'first': 'skipped', 'second': 'ok'}
+
+
+def test_force_reruns_a_fresh_stage(project):
+    root, package = project
+    run(root, package)
+    status = run(root, package, force=('second',))
+    assert status == {'first': 'skipped', 'second': 'ok'}
+
+
+def test_failed_stage_is_retried(project):
+    root, package = project
+    status = run(root, package, second='fail')
+    assert status == {'first': 'ok', 'second': 'failed'}
+    # A failed stage records no fingerprint, so the next run tries it again
+    assert run(root, package) == {'first': 'skipped', 'second': 'ok'}
+
+
+def test_dry_run_runs_nothing(project):
+    root, package = project
+    status = run(root, package, dry_run=True)
+    assert status == {'first': 'pending', 'second': 'pending'}
+    assert not (root / 'mid.txt').exists()
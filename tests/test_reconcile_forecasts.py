@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models.forecast_store import CITY_KEY, MODEL_VERSION, borough_key
+from src.models.reconcile_forecasts import Z_95, reconcile_store
+
+STEPS = 14
+# One neighborhood missing from the lookup, which only rolls up into the city
+BOROUGHS = {'Astoria': 'Queens', 'Jamaica': 'Queens', 'Flushing': 'Queens',
+            'Midwood': 'Brooklyn', 'Bushwick': 'Brooklyn'}
+NEIGHBORHOODS = sorted(BOROUGHS) + ['Airport']
+
+
+def forecasts(key, mean, sd):
+    return pd.DataFrame({
+        'key': key, 'model_version': MODEL_VERSION,
+        'step': np.arange(1, STEPS + 1),
+        'date': pd.date_range('2024-01-01', periods=STEPS),
+        'mean': mean, 'lower': mean - Z_95 * sd, 'upper': mean + Z_95 * sd,
+    })
+
+
+@pytest.fixture
+def store():
+    rng = np.random.default_rng(0)
+    frames = [forecasts(n, rng.uniform(2, 20, STEPS), rng.uniform(0.5, 3))
+              for n in NEIGHBORHOODS]
+    # A city model that disagrees with the sum of its neighborhoods
+    city = sum(frame['mean'] for frame in frames) * 1.1
+    frames.append(forecasts(CITY_KEY, city, 2.0))
+    return pd.concat(frames, ignore_index=True)
+
+
+def pivot(frame, column='mean'):
+    return frame.pivot(index='date', columns='key', values=column)
+
+
+def assert_coherent(reconciled):
+    mean = pivot(reconciled)
+    np.testing.assert_allclose(mean[CITY_KEY], mean[NEIGHBORHOODS].sum(axis=1),
+                               rtol=1e-5)
+    for borough in set(BOROUGHS.values()):
+        members = [n for n, b in BOROUGHS.items() if b == borough]
+        np.testing.assert_allclose(mean[borough_key(borough)],
+                                   mean[members].sum(axis=1), rtol=1e-5)
+
+
+def test_bottom_up_sums_the_neighborhoods(store):
+    reconciled = reconcile_store(store, BOROUGHS)
+
+    assert_coherent(reconciled)
+    np.testing.assert_allclose(pivot(reconciled)[NEIGHBORHOODS],
+                               pivot(store)[NEIGHBORHOODS], rtol=1e-6)
+
+
+def test_mint_matches_the_textbook_formula(store):
+    reconciled = reconcile_store(store, BOROUGHS, method='mint')
+    assert_coherent(reconciled)
+
+    # S (S' W^-1 S)^-1 S' W^-1 y over city and neighborhoods, with W the
+    # diagonal of base variances and no borough base forecasts
+    summing = np.vstack([np.ones(len(NEIGHBORHOODS)),
+                         np.eye(len(NEIGHBORHOODS))])
+    keys = [CITY_KEY] + NEIGHBORHOODS
+    base = pivot(store)[keys].to_numpy()
+    var = ((pivot(store, 'upper') - pivot(store, 'lower'))[keys].to_numpy()
+           / (2 * Z_95)) ** 2
+    mean = pivot(reconciled)
+    half_width = (pivot(reconciled, 'upper') - mean) / Z_95
+    for step in range(STEPS):
+        w_inv = np.diag(1 / var[step])
+        cov = np.linalg.inv(summing.T @ w_inv @ summing)
+        expected = summing @ cov @ summing.T @ w_inv @ base[step]
+        np.testing.assert_allclose(mean[keys].iloc[step], expected, rtol=1e-5)
+        np.testing.assert_allclose(half_width[keys].iloc[step],
+                                   np.sqrt(np.diag(summing @ cov @ summing.T)),
+                                   rtol=1e-4)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from src.models.sarima_artifact import SarimaArtifact
+
+STEPS = 30
+
+
+def daily_counts(n, seed=0):
+    # Weekly pattern, slow drift and noise, as in the crash series
+    rng = np.random.default_rng(seed)
+    t = np.arange(n + STEPS)
+    values = (20 + 0.02 * t + 3 * np.sin(2 * np.pi * t / 7)
+              + rng.normal(0, 2, len(t)))
+    return pd.Series(values, index=pd.date_range('2020-01-01',
+                                                 periods=len(t), freq='D'))
+
+
+def round_trip(results, tmp_path):
+    SarimaArtifact.from_results(results, '2024-01-01').save(
+        tmp_path / 'model.npz')
+    return SarimaArtifact.load(tmp_path / 'model.npz')
+
+
+@pytest.mark.parametrize('order, seasonal_order, trend', [
+    ((1, 1, 1), (1, 1, 1, 7), 'n'),
+    ((1, 0, 1), (1, 0, 0, 7), 'c'),
+    # A time trend makes the state intercept time-varying
+    ((1, 0, 0), (1, 0, 0, 7), 'ct'),
+    ((0, 1, 1), (0, 0, 1, 7), 't'),
+])
+def test_artifact_forecast_matches_sarimax(tmp_path, order, seasonal_order,
+                                           trend):
+    ts = daily_counts(400)
+    results = SARIMAX(ts.iloc[:-STEPS], order=order,
+                      seasonal_order=seasonal_order, trend=trend).fit(
+        disp=False, maxiter=200)
+
+    forecast = round_trip(results, tmp_path).forecast(STEPS, alpha=0.1)
+    expected = results.get_forecast(STEPS).summary_frame(alpha=0.1)
+
+    np.testing.assert_allclose(forecast['mean'], expected['mean'],
+                               rtol=1e-8)
+    np.testing.assert_allclose(forecast['lower'], expected['mean_ci_lower'],
+                               rtol=1e-8)
+    np.testing.assert_allclose(forecast['upper'], expected['mean_ci_upper'],
+                               rtol=1e-8)
+    assert (forecast.index == expected.index).all()
+
+
+def test_artifact_forecast_with_exog_matches_sarimax(tmp_path):
+    ts = daily_counts(400)
+    exog = pd.DataFrame({'holiday': (ts.index.day == 1).astype(float),
+                         'weekend': (ts.index.dayofweek >= 5).astype(float)},
+                        index=ts.index)
+    results = SARIMAX(ts.iloc[:-STEPS], exog=exog.iloc[:-STEPS],
+                      order=(1, 1, 1), seasonal_order=(0, 1, 1, 7)).fit(
+        disp=False, maxiter=200)
+
+    artifact = round_trip(results, tmp_path)
+    forecast = artifact.forecast(STEPS, exog=exog.iloc[-STEPS:])
+    expected = results.get_forecast(STEPS, exog=exog.iloc[-STEPS:])
+
+    np.testing.assert_allclose(forecast['mean'], expected.predicted_mean,
+                               rtol=1e-8)
+    with pytest.raises(ValueError):
+        artifact.forecast(STEPS)
@@ -0,0 +1,95 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.models.training_engine import (checkpoint_path, load_checkpoints,
+                                        run_fits)
+
+KEYS = ['Astoria', 'Bay Ridge', 'Chelsea-Flatiron']
+
+
+def fit_mean(key, ts, offset=0):
+    return {'mean': float(ts.mean()) + offset}
+
+
+def fit_fails(key, ts):
+    raise RuntimeError(f"refit {key}")
+
+
+def fit_slow(key, ts):
+    time.sleep(5)
+    return {'mean': float(ts.mean())}
+
+
+def make_series(n_days=30):
+    dates = pd.date_range('2024-01-01', periods=n_days, freq='D')
+    return {key: pd.Series(np.arange(n_days, dtype=float) * (i + 1),
+                           index=dates)
+            for i, key in enumerate(KEYS)}
+
+
+def statuses(records):
+    return {key: record['status'] for key, record in records.items()}
+
+
+def test_run_fits_writes_one_checkpoint_per_key(tmp_path):
+    series = make_series()
+    records = run_fits(series, fit_mean, tmp_path, n_workers=2)
+    assert statuses(records) == dict.fromkeys(KEYS, 'ok')
+    assert set(load_checkpoints(tmp_path)) == set(KEYS)
+    assert all(checkpoint_path(tmp_path, key).exists() for key in KEYS)
+
+
+def test_run_fits_resumes_from_checkpoints(tmp_path):
+    series = make_series()
+    first = run_fits(series, fit_mean, tmp_path, n_workers=2)
+    # Nothing is refitted, so a fit that would fail never runs
+    assert run_fits(series, fit_fails, tmp_path, n_workers=2) == first
+
+
+def test_run_fits_refits_changed_series_only(tmp_path):
+    series = make_series()
+    run_fits(series, fit_mean, tmp_path, n_workers=2)
+    series['Astoria'] = series['Astoria'] + 1
+    records = run_fits(series, fit_fails, tmp_path, n_workers=2)
+    assert records['Astoria']['status'] == 'failed'
+    assert records['Bay Ridge']['status'] == 'ok'
+
+
+def test_run_fits_refits_changed_setup_only(tmp_path):
+    series = make_series()
+    setup = dict.fromkeys(KEYS, {'order': [1, 1, 1]})
+    run_fits(series, fit_mean, tmp_path, n_workers=2, task_setup=setup)
+    setup['Bay Ridge'] = {'order': [2, 1, 1]}
+    records = run_fits(series, fit_mean, tmp_path, n_workers=2,
+                       task_setup=setup,
+                       task_kwargs={'Bay Ridge': {'offset': 100}})
+    bay_ridge = records['Bay Ridge']['result']['mean']
+    assert bay_ridge == series['Bay Ridge'].mean() + 100
+    astoria = records['Astoria']['result']['mean']
+    assert astoria == series['Astoria'].mean()
+
+
+def test_run_fits_ignores_half_written_checkpoints(tmp_path):
+    series = make_series()
+    run_fits(series, fit_mean, tmp_path, n_workers=2)
+    path = checkpoint_path(tmp_path, 'Chelsea-Flatiron')
+    path.write_text('{"key": "Chel')
+    records = run_fits(series, fit_mean, tmp_path, n_workers=2)
+    assert records['Chelsea-Flatiron']['status'] == 'ok'
+    assert json.loads(path.read_text())['status'] == 'ok'
+
+
+def test_run_fits_times_out_and_retries_on_request(tmp_path):
+    series = {'Astoria': make_series()['Astoria']}
+    records = run_fits(series, fit_slow, tmp_path, n_workers=1, timeout=0.2)
+    assert records['Astoria']['status'] == 'timeout'
+
+    # Timeouts are kept unless asked to retry them
+    records = run_fits(series, fit_mean, tmp_path, n_workers=1)
+    assert records['Astoria']['status'] == 'timeout'
+    records = run_fits(series, fit_mean, tmp_path, n_workers=1,
+                       retry_failed=True)
+    assert records['Astoria']['status'] == 'ok'